@@ -3,17 +3,18 @@
 This file contains classes and methods to interact with dlrn server
 dlrn configuration options, dlrn repos
 """
-import contextlib
 import copy
 import datetime
 import json
 import logging
-import os
-import tempfile
 
 import dlrnapi_client
 import yaml
 from dlrn_hash import DlrnAggregateHash, DlrnCommitDistroExtendedHash, DlrnHash
+from http_session import get_session
+from promoter_status import status
+from promotion_history import PromotionHistory
+from repo_client import RepoArtifacts, RepoError
 
 try:
     # Python3 imports
@@ -93,6 +94,13 @@ class DlrnClient(object):
         self.api_instance = dlrnapi_client.DefaultApi(api_client=api_client)
         self.last_promotions = {}
 
+        # Local index of the promotions, appended on every successful
+        # promotion
+        self.history = None
+        history_db = getattr(self.config, 'promotion_history_db', None)
+        if history_db:
+            self.history = PromotionHistory(history_db)
+
         # Variable to detect changes on the hash while we are running a
         # promotion
         self.named_hashes_map = {}
@@ -176,9 +184,11 @@ class DlrnClient(object):
 
         if hash_type is DlrnCommitDistroExtendedHash:
             api_call = self.api_instance.api_repo_status_get
+            api_name = 'api_repo_status_get'
             jobs_params = self.jobs_params
         elif hash_type is DlrnAggregateHash:
             api_call = self.api_instance.api_agg_status_get
+            api_name = 'api_agg_status_get'
             jobs_params = self.jobs_params_aggregate
         else:
             raise TypeError("Unrecognized dlrn_hash type: %s", hash_type)
@@ -190,7 +200,8 @@ class DlrnClient(object):
         try:
             self.log.debug("Hash '%s': fetching list of successful "
                            "jobs", dlrn_hash)
-            jobs = api_call(params)
+            with status.api_call(api_name):
+                jobs = api_call(params)
         except ApiException as ae:
             message = ae.body
             try:
@@ -306,7 +317,8 @@ class DlrnClient(object):
         try:
             # API documentation says the hashes are returned in reverse
             # timestamp order (from newest to oldest) by defaut
-            api_hashes = self.api_instance.api_promotions_get(params)
+            with status.api_call('api_promotions_get'):
+                api_hashes = self.api_instance.api_promotions_get(params)
         except ApiException as ae:
             message = ae.body
             try:
@@ -398,11 +410,8 @@ class DlrnClient(object):
         self.log.debug("%s commit info url for component %s at %s", log_header,
                        component_name, commit_url)
         try:
-            # FIXME: in python2 urlopen is not a context manager
-            with contextlib.closing(
-                    url.urlopen(commit_url)
-            ) as commits_yaml:
-                commits = yaml.safe_load(commits_yaml.read().decode("UTF-8"))
+            commits = yaml.safe_load(
+                get_session().get(commit_url).decode("UTF-8"))
         # FIXME(gcerami) it is very difficult to make urlopen generate
         #  url.HTTPError (without mocking side effect directly), so this part
         #  is only partially tested
@@ -443,41 +452,23 @@ class DlrnClient(object):
         # all the components the aggregate points to singularly
 
         # Aggregate promotion step 1: download the full delorean repo
-        # and save it locally for parsing
-        candidate_url = ("{}/{}/delorean.repo"
-                         "".format(self.config.repo_url, dlrn_hash.commit_dir))
+        # and parse it while it's downloaded
+        artifacts = RepoArtifacts(self.config.repo_url, dlrn_hash)
+        candidate_url = artifacts.get_url("delorean.repo")
         self.log.debug("Dlrn promote '%s': URL for candidate label repo: %s",
                        dlrn_hash, candidate_url)
         try:
-            # FIXME: in python2 urlopen is not a context manager
-            with contextlib.closing(
-                    url.urlopen(candidate_url)
-            ) as remote_repo_content:
-                # FIXME: in python2 configparser can read a config only from
-                #  a file or a file-like obj. But python3 need the file
-                #  to be converted first in UTF-8
-                remote_repo_content = remote_repo_content.read().decode()
-        except (url.HTTPError, url.URLError):
+            repo_components = artifacts.components
+        except (RepoError, ini_parser.Error):
             self.log.error("Dlrn Promote: Error downloading delorean repo"
                            " at %s", candidate_url)
             self.log.error("------- -------- Promoter aborted")
             raise PromotionError("Unable to fetch repo from repo url at %s",
                                  candidate_url)
-        # Tried to use stringIO here, but the config.readfp seems not
-        # to be working correctly with stringIO, so a temporary file
-        # is needed
-        __, repo_file_path = tempfile.mkstemp()
-        repo_config = ini_parser.ConfigParser()
-        with open(repo_file_path, "w+") as repo_file:
-            repo_file.write(remote_repo_content)
-            repo_file.seek(0)
-            # FIXME python3 can read from a string, doesn't need a fp
-            repo_config.readfp(repo_file)
-        os.unlink(repo_file_path)
 
         # AP step2: for all the subrepos in repo file get the baseurl for
         # all the components
-        components = repo_config.sections()
+        components = list(repo_components)
         if not components:
             self.log.error("%s aggregate repo at %s contains no components",
                            log_header, candidate_url)
@@ -490,7 +481,7 @@ class DlrnClient(object):
         # AP step3 download commits information for all the single
         # component
         for component_name in components:
-            base_url = repo_config.get(component_name, 'baseurl')
+            base_url = repo_components[component_name]
             promotion_hash = self.get_hash_from_component(log_header,
                                                           component_name,
                                                           base_url)
@@ -522,6 +513,7 @@ class DlrnClient(object):
             dlrn_hash.dump_to_params(promotion_parameters)
             promotion_parameters.promote_name = target_label
             api_call = self.api_instance.api_promote_post
+            api_name = 'api_promote_post'
 
         elif hash_type is DlrnAggregateHash:
             promotion_parameters = \
@@ -530,12 +522,14 @@ class DlrnClient(object):
                                                     candidate_label,
                                                     target_label)
             api_call = self.api_instance.api_promote_batch_post
+            api_name = 'api_promote_batch_post'
         else:
             self.log.error("Unrecognized dlrn hash type: %s", hash_type)
             raise PromotionError("Unknown hash type")
 
         try:
-            promoted_info = api_call(promotion_parameters)
+            with status.api_call(api_name):
+                promoted_info = api_call(promotion_parameters)
         except ApiException as ae:
             message = ae.body
             try:
@@ -553,6 +547,7 @@ class DlrnClient(object):
         # and always the timestamp
         # but we'll always be interested in comparing just commit and
         # distro hashes
+        promoted_timestamp = getattr(promoted_info, 'timestamp', None)
         stored_timestamp = dlrn_hash.timestamp
         dlrn_hash.timestamp = None
         promoted_hash = DlrnHash(source=promoted_info)
@@ -576,6 +571,9 @@ class DlrnClient(object):
 
         # For every hash promoted, we need to update the named hashes.
         self.update_current_named_hashes(dlrn_hash, target_label)
+        if self.history is not None:
+            self.history.record(dlrn_hash, target_label,
+                                timestamp=promoted_timestamp)
         # Add back timestamp
         dlrn_hash.timestamp = stored_timestamp
 
@@ -613,7 +611,9 @@ class DlrnClient(object):
         self.log.info("Dlrn voting success: %s for job %s with parameters %s"
                       "", params.success, job_id, str_params)
         try:
-            api_response = self.api_instance.api_report_result_post(params)
+            with status.api_call('api_report_result_post'):
+                api_response = \
+                    self.api_instance.api_report_result_post(params)
             self.log.info("Dlrn voted success: %s for job %s on hash %s"
                           "", params.success, job_id, dlrn_hash)
         except ApiException as ae:
@@ -9,13 +9,17 @@ import shutil
 from datetime import datetime
 
 import common
-from common import LockError, get_log_file
+import yaml
+from common import LockError, PromotionError, get_log_file
 from config import PromoterConfigFactory
 from dlrn_hash import DlrnHash, DlrnHashError
 from logic import Promoter
+from promoter_status import start_status_server
 
 DEFAULT_CONFIG_RELEASE = "CentOS-8/master.yaml"
 DEFAULT_CONFIG_ROOT = "staging"  # "rdo" for production environment
+PROMOTION_CLIENTS = ['registries_client', 'qcow_client', 'dockerfile_client',
+                     'dlrn_client']
 
 
 def promote_all(promoter, args):
@@ -33,6 +37,71 @@ def force_promote(promoter, args):
     promoter.promote(candidate_hash, args.candidate_label, args.target_label)
 
 
+def load_promotion_manifest(manifest_path):
+    """
+    Loads and validates a batch promotion manifest. The manifest is a yaml
+    (or json) file with a list of promotions under the 'promotions' key, each
+    with commit_hash, distro_hash, optional aggregate_hash, candidate_label,
+    target_label and optional allowed_clients (list or comma separated)
+    All the entries are validated before returning, so nothing is promoted
+    if any of them is invalid
+    :param manifest_path: The path to the manifest file
+    :return: A list of promotion dicts as expected by Promoter.promote_batch
+    """
+    with open(manifest_path) as manifest_file:
+        manifest = yaml.safe_load(manifest_file)
+
+    entries = []
+    if isinstance(manifest, dict):
+        entries = manifest.get('promotions') or []
+    if not isinstance(entries, list) or not entries:
+        raise PromotionError("Promotion manifest {}: no promotions found"
+                             "".format(manifest_path))
+
+    promotions = []
+    errors = []
+    for index, entry in enumerate(entries):
+        if not isinstance(entry, dict):
+            errors.append("entry {}: not a mapping".format(index))
+            continue
+        missing = [key for key in ['commit_hash', 'distro_hash',
+                                   'candidate_label', 'target_label']
+                   if not entry.get(key)]
+        if missing:
+            errors.append("entry {}: missing {}".format(index,
+                                                        ', '.join(missing)))
+            continue
+        allowed_clients = entry.get('allowed_clients')
+        if isinstance(allowed_clients, str):
+            allowed_clients = allowed_clients.split(',')
+        unknown = set(allowed_clients or []) - set(PROMOTION_CLIENTS)
+        if unknown:
+            errors.append("entry {}: unknown clients {}"
+                          "".format(index, ', '.join(sorted(unknown))))
+            continue
+        try:
+            candidate_hash = DlrnHash(source=entry)
+        except DlrnHashError as ex:
+            errors.append("entry {}: invalid hash: {}".format(index, ex))
+            continue
+        promotions.append({
+            'candidate_hash': candidate_hash,
+            'candidate_label': entry['candidate_label'],
+            'target_label': entry['target_label'],
+            'allowed_clients': allowed_clients,
+        })
+
+    if errors:
+        raise PromotionError("Promotion manifest {} is invalid: {}"
+                             "".format(manifest_path, '; '.join(errors)))
+    return promotions
+
+
+def force_promote_batch(promoter, args):
+    promotions = load_promotion_manifest(args.manifest)
+    promoter.promote_batch(promotions, workers=args.workers)
+
+
 def arg_parser(cmd_line=None, config=None):
     """
     Parse the command line or the parameter to pass to the rest of the workflow
@@ -54,6 +123,10 @@ def arg_parser(cmd_line=None, config=None):
     main_parser.add_argument("--log-level",
                              default='INFO',
                              help="Set the log level")
+    main_parser.add_argument("--status-port", type=int,
+                             default=argparse.SUPPRESS,
+                             help="Serve the live promoter status and "
+                                  "metrics on this port")
     command_parser = main_parser.add_subparsers(dest='subcommand')
     command_parser.required = True
     promote_all_parser = command_parser.add_parser('promote-all',
@@ -90,6 +163,22 @@ def arg_parser(cmd_line=None, config=None):
                                            "the candidate hash to")
     force_promote_parser.set_defaults(handler=force_promote)
 
+    force_promote_batch_parser = \
+        command_parser.add_parser('force-promote-batch',
+                                  help="Force promotion of all the hashes "
+                                       "listed in a manifest, bypassing "
+                                       "candidate selection",
+                                  formatter_class=default_formatter)
+    force_promote_batch_parser.add_argument("--workers", type=int, default=1,
+                                            help="The max number of "
+                                                 "independent labels "
+                                                 "promoted concurrently")
+    force_promote_batch_parser.add_argument("manifest",
+                                            help="The yaml or json file "
+                                                 "with the list of "
+                                                 "promotions")
+    force_promote_batch_parser.set_defaults(handler=force_promote_batch)
+
     if cmd_line is not None:
         args = main_parser.parse_args(cmd_line.split())
     else:
@@ -133,9 +222,16 @@ def main(cmd_line=None):
     config = config_builder(args.config_root,
                             CONFIG_RELEASE,
                             cli_args=args)
+    status_server = None
+    if config.status_port:
+        status_server = start_status_server(config.status_port)
     promoter = Promoter(config)
 
-    args.handler(promoter, args)
+    try:
+        args.handler(promoter, args)
+    finally:
+        if status_server is not None:
+            status_server.shutdown()
     c_date_t = datetime.now().isoformat(timespec='minutes')
     log_file_name = log_file.split(".")[0] + "_" + c_date_t + ".log"
     shutil.copyfile(log_file, log_file_name)
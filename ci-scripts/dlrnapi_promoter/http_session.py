@@ -0,0 +1,290 @@
+"""
+This file contains the http session shared by all the promoter downloads.
+The session keeps a pool of keep-alive connections per host, retries the
+transient errors, asks for compressed responses and revalidates the files
+already downloaded with conditional requests, so repeated downloads from the
+same hosts don't pay a new TCP and TLS handshake, and unchanged files are not
+transferred again.
+The files that change rarely can also be kept in a cache directory, so they
+are revalidated across runs, and across processes that share the directory.
+Errors are raised as url.URLError, so the callers handle them as they did
+with urlopen. Urls with other schemes, like file://, are opened with urlopen.
+"""
+import contextlib
+import hashlib
+import io
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    # Python3 imports
+    from urllib import request as url
+    from urllib.parse import urlparse
+except ImportError:
+    # Python 2 imports
+    import urllib2 as url
+    from urlparse import urlparse
+
+POOL_SIZE = 10
+RETRIES = 3
+RETRY_BACKOFF = 0.5
+RETRY_STATUSES = (500, 502, 503, 504)
+# connect, read
+TIMEOUT = (10, 120)
+# Number of downloaded files kept for revalidation, and the max size of each
+CACHE_ENTRIES = 64
+CACHE_MAX_SIZE = 4 * 1024 * 1024
+
+
+class DownloadError(url.URLError):
+    """
+    A download failed. Subclass of URLError, so the except clauses written
+    for urlopen keep working
+    """
+
+    def __init__(self, reason, status_code=None):
+        super(DownloadError, self).__init__(reason)
+        self.status_code = status_code
+
+
+class DiskCache(object):
+    """
+    Directory with the validators and the content of downloaded files. Each
+    url is stored in a single file named after the sha256 of the url: a
+    first json line with the url and the validators, then the content. The
+    files are replaced atomically, so processes sharing the directory never
+    read a partial entry
+    """
+
+    log = logging.getLogger("promoter")
+
+    def __init__(self, cache_dir):
+        """
+        :param cache_dir: The directory of the cache, created if missing
+        """
+        self.cache_dir = os.path.expanduser(cache_dir)
+
+    def get_path(self, file_url):
+        return os.path.join(self.cache_dir,
+                            hashlib.sha256(file_url.encode()).hexdigest())
+
+    def get(self, file_url):
+        """
+        :param file_url: The url of the file
+        :return: A tuple (validators dict, content), None if the url is not
+        in the cache
+        """
+        try:
+            with open(self.get_path(file_url), 'rb') as cache_file:
+                header = json.loads(cache_file.readline().decode())
+                content = cache_file.read()
+        except (IOError, OSError, ValueError):
+            return None
+        if header.get('url') != file_url:
+            return None
+        return header['validators'], content
+
+    def put(self, file_url, validators, content):
+        """
+        Stores a file in the cache. Errors are logged and ignored, the cache
+        is only an optimization
+        :param file_url: The url of the file
+        :param validators: The conditional request headers for the file
+        :param content: The content of the file, as bytes
+        :return: None
+        """
+        header = json.dumps({'url': file_url, 'validators': validators})
+        tmp_path = None
+        try:
+            if not os.path.isdir(self.cache_dir):
+                os.makedirs(self.cache_dir)
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir,
+                                            prefix='.tmp')
+            with os.fdopen(fd, 'wb') as cache_file:
+                cache_file.write(header.encode() + b"\n")
+                cache_file.write(content)
+            os.rename(tmp_path, self.get_path(file_url))
+        except (IOError, OSError) as ex:
+            self.log.warning("Unable to store %s in the http cache at %s: %s",
+                             file_url, self.cache_dir, ex)
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+
+class ResponseStream(io.RawIOBase):
+    """
+    Raw binary stream over the body of a streamed response. The body is
+    read in chunks while it's consumed, and when it's read to the end the
+    connection goes back to the pool
+    """
+
+    def __init__(self, response, chunk_size=64 * 1024):
+        self.response = response
+        self.chunks = response.iter_content(chunk_size)
+        self.chunk = b''
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self.chunk:
+            try:
+                self.chunk = next(self.chunks)
+            except StopIteration:
+                return 0
+            except requests.exceptions.RequestException as ex:
+                raise DownloadError(str(ex))
+        size = min(len(buffer), len(self.chunk))
+        buffer[:size] = self.chunk[:size]
+        self.chunk = self.chunk[size:]
+        return size
+
+    def close(self):
+        if not self.closed:
+            self.response.close()
+        super(ResponseStream, self).close()
+
+
+class HttpSession(object):
+    """
+    Pooled http session with retries and conditional requests
+    """
+
+    log = logging.getLogger("promoter")
+
+    def __init__(self, pool_size=POOL_SIZE, retries=RETRIES,
+                 timeout=TIMEOUT):
+        """
+        :param pool_size: The max number of connections kept per host
+        :param retries: The number of retries on connection errors and
+        on the RETRY_STATUSES
+        :param timeout: The timeout of the requests, in seconds
+        """
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=pool_size, pool_maxsize=pool_size,
+            max_retries=Retry(total=retries, backoff_factor=RETRY_BACKOFF,
+                              status_forcelist=RETRY_STATUSES,
+                              raise_on_status=False))
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.lock = threading.Lock()
+        # url -> (validators dict, content)
+        self.cache = OrderedDict()
+
+    @staticmethod
+    def is_http(file_url):
+        return urlparse(file_url).scheme in ['http', 'https']
+
+    def request(self, file_url, headers=None, stream=False):
+        try:
+            response = self.session.get(file_url, headers=headers,
+                                        stream=stream, timeout=self.timeout)
+        except requests.exceptions.RequestException as ex:
+            raise DownloadError("Unable to download {}: {}"
+                                "".format(file_url, ex))
+        if response.status_code >= 400:
+            response.close()
+            raise DownloadError("Unable to download {}: HTTP {}"
+                                "".format(file_url, response.status_code),
+                                status_code=response.status_code)
+        return response
+
+    def get_cached(self, file_url, disk_cache=None):
+        with self.lock:
+            cached = self.cache.get(file_url)
+            if cached is not None:
+                self.cache.move_to_end(file_url)
+                return cached
+        if disk_cache is not None:
+            return disk_cache.get(file_url)
+        return None
+
+    def store(self, file_url, response, content, disk_cache=None):
+        validators = {}
+        if response.headers.get('ETag'):
+            validators['If-None-Match'] = response.headers['ETag']
+        if response.headers.get('Last-Modified'):
+            validators['If-Modified-Since'] = response.headers['Last-Modified']
+        if not validators or len(content) > CACHE_MAX_SIZE:
+            return
+        if disk_cache is not None:
+            disk_cache.put(file_url, validators, content)
+        self.remember(file_url, (validators, content))
+
+    def remember(self, file_url, cached):
+        with self.lock:
+            self.cache[file_url] = cached
+            self.cache.move_to_end(file_url)
+            while len(self.cache) > CACHE_ENTRIES:
+                self.cache.popitem(last=False)
+
+    def get(self, file_url, cache_dir=None):
+        """
+        Downloads a file. A file already downloaded is revalidated with a
+        conditional request, and not transferred again if it didn't change
+        :param file_url: The url of the file
+        :param cache_dir: An optional directory where the file is kept
+        between runs
+        :return: The content of the file, as bytes
+        """
+        if not self.is_http(file_url):
+            try:
+                with contextlib.closing(url.urlopen(file_url)) as response:
+                    return response.read()
+            except ValueError as ex:
+                raise DownloadError(str(ex))
+
+        disk_cache = DiskCache(cache_dir) if cache_dir else None
+        cached = self.get_cached(file_url, disk_cache=disk_cache)
+        headers = dict(cached[0]) if cached is not None else None
+        response = self.request(file_url, headers=headers)
+        if response.status_code == 304 and cached is not None:
+            self.log.debug("Download of %s: not modified, reusing the "
+                           "previous content", file_url)
+            self.remember(file_url, cached)
+            return cached[1]
+        content = response.content
+        self.store(file_url, response, content, disk_cache=disk_cache)
+        return content
+
+    def open_text(self, file_url, encoding='utf-8'):
+        """
+        Opens a file as a text stream, decoded while it's read
+        :param file_url: The url of the file
+        :param encoding: The encoding of the file
+        :return: A text file object, to be closed by the caller
+        """
+        if not self.is_http(file_url):
+            try:
+                raw = url.urlopen(file_url)
+            except ValueError as ex:
+                raise DownloadError(str(ex))
+        else:
+            raw = io.BufferedReader(
+                ResponseStream(self.request(file_url, stream=True)))
+        return io.TextIOWrapper(raw, encoding=encoding, newline='')
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """
+    :return: The HttpSession shared by the whole process
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = HttpSession()
+    return _session
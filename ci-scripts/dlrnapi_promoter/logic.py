@@ -2,63 +2,25 @@
 This file contains classes and function for high level logic of the promoter
 workflow
 """
+import copy
 import logging
+from collections import OrderedDict
+from concurrent import futures
 
 from common import PromotionError
 from dlrn_client import DlrnClient
 from dockerfile_client import DockerfileClient
+from promoter_status import status
+from promotion_report import PromotionReport
 from qcow_client import QcowClient
 from registries_client import RegistriesClient
-from tabulate import tabulate
-
-
-def print_job_table(log, c_hash_list, candidate_hash, promoted=False,
-                    success_jobs=[], missing_jobs=[]):
-    header1 = ['Aggregate Hash', 'Promoted', 'Description']
-    header2 = {
-        'Commit Hash': candidate_hash.commit_hash
-        if hasattr(candidate_hash, 'commit_hash') else '',
-        'Distro Hash': candidate_hash.distro_hash
-        if hasattr(candidate_hash, 'distro_hash') else '',
-        'Extended Hash': candidate_hash.extended_hash
-        if hasattr(candidate_hash, 'extended_hash') else '',
-        'Component': candidate_hash.component
-        if hasattr(candidate_hash, 'component') else '',
-        'Timestamp': str(candidate_hash.timestamp)
-        if hasattr(candidate_hash, 'timestamp') else '',
-        'Successful Jobs': "\n".join(list(success_jobs)),
-        'Missing Jobs': "\n".join(list(missing_jobs))}
-    if c_hash_list == []:
-        c_hash_list.append(header1)
-    c_hash_list.append([candidate_hash.aggregate_hash,
-                        'Yes' if promoted else 'No',
-                        tabulate([[i, j] for i, j in header2.items()],
-                                 tablefmt='grid')])
-
-
-def print_hash_table(log, hash_list):
-    table_headers = ['Aggregate Hash', 'Commit Hash', 'Distro Hash',
-                     'Extended Hash', 'Component', 'Timestamp']
-    table_list = [table_headers]
-    if isinstance(hash_list, list):
-        for hashes in hash_list:
-            table_list.append([
-                hashes.aggregate_hash
-                if hasattr(hashes, 'aggregate_hash') else '',
-                hashes.commit_hash, hashes.distro_hash,
-                hashes.extended_hash
-                if hasattr(hashes, 'extended_hash') else '',
-                hashes.component, hashes.timestamp])
-    else:
-        table_list.append([
-            hash_list.aggregate_hash
-            if hasattr(hash_list, 'aggregate_hash') else '',
-            hash_list.commit_hash, hash_list.distro_hash,
-            hash_list.extended_hash
-            if hasattr(hash_list, 'extended_hash') else '',
-            hash_list.component, hash_list.timestamp])
-    log.info("\n {}".format(tabulate(table_list, headers='firstrow',
-                                     tablefmt='grid')))
+
+# The clients that have to complete their promotion before a client can
+# start. DLRN moves the label only after all the artifacts were promoted, the
+# artifact clients don't depend on each other and run concurrently
+CLIENT_DEPENDENCIES = {
+    'dlrn_client': ['registries_client', 'qcow_client', 'dockerfile_client'],
+}
 
 
 class Promoter(object):
@@ -81,6 +43,150 @@ class Promoter(object):
         self.registries_client = RegistriesClient(self.config)
         self.qcow_client = QcowClient(self.config)
         self.dockerfile_client = DockerfileClient(self.config)
+        self.report = PromotionReport(self.config.report_format)
+        # Shared fetch results, active only during a promote_all round
+        self.fetch_cache = None
+        # Clients work started in advance for the candidates, see
+        # start_preflight
+        self.preflight = []
+        self.preflight_executors = {}
+
+    def fetch_promotions(self, label, **kwargs):
+        """
+        Wrapper around DlrnClient.fetch_promotions that reuses the results
+        fetched in the current promote_all round
+        :param label: The label to fetch the hashes from
+        :param kwargs: Passed directly to DlrnClient.fetch_promotions
+        :return: A list of hashes promoted to label
+        """
+        if self.fetch_cache is None:
+            return self.dlrn_client.fetch_promotions(label, **kwargs)
+        key = ('promotions', label, kwargs.get('count'))
+        if key not in self.fetch_cache:
+            self.fetch_cache[key] = \
+                self.dlrn_client.fetch_promotions(label, **kwargs)
+        else:
+            self.log.debug("Label '%s': reusing fetched hashes", label)
+        return self.fetch_cache[key]
+
+    def fetch_votes(self, candidate_hash):
+        """
+        Fetches the vote details page and the successful jobs of a candidate,
+        reusing the results fetched in the current promote_all round
+        :param candidate_hash: The hash to fetch the votes for
+        :return: A tuple with the vote details page and the set of
+        successful jobs
+        """
+        key = ('votes', candidate_hash.full_hash)
+        if self.fetch_cache is not None and key in self.fetch_cache:
+            self.log.debug("Candidate hash '%s': reusing fetched jobs",
+                           candidate_hash)
+            return self.fetch_cache[key]
+        votes = (self.dlrn_client.get_civotes_info(candidate_hash),
+                 set(self.dlrn_client.fetch_jobs(candidate_hash)))
+        if self.fetch_cache is not None:
+            self.fetch_cache[key] = votes
+        return votes
+
+    def invalidate_label(self, label):
+        """
+        Drops the cached hashes of a label after a promotion changed it,
+        so targets that use it as candidate label see the new hash
+        :param label: The label promoted to
+        :return: None
+        """
+        if self.fetch_cache is None:
+            return
+        for key in list(self.fetch_cache):
+            if key[0] == 'promotions' and key[1] == label:
+                del self.fetch_cache[key]
+
+    def get_preflight_executor(self, client_name):
+        """
+        Each client has its own single thread, so the clients warm up in
+        parallel but a client never runs two preparations at the same time
+        :param client_name: The name of the client
+        :return: The executor for the client
+        """
+        if client_name not in self.preflight_executors:
+            self.preflight_executors[client_name] = \
+                futures.ThreadPoolExecutor(max_workers=1)
+        return self.preflight_executors[client_name]
+
+    def run_preflight(self, client_name, candidate_hash, candidate_label):
+        client = getattr(self, client_name)
+        try:
+            with status.phase('preflight'):
+                client.prepare(candidate_hash, candidate_label=candidate_label)
+        except Exception as ex:
+            # The promotion will do the work again and report the error
+            self.log.debug("Candidate hash '%s': client %s preflight failed:"
+                           " %s", candidate_hash, client_name, ex)
+            return False
+        self.log.debug("Candidate hash '%s': client %s preflight ready",
+                       candidate_hash, client_name)
+        return True
+
+    def start_preflight(self, candidates, candidate_label):
+        """
+        Starts preparing in background the promotion of the newest
+        candidates while their votes are checked: the clients that support it
+        resolve and open what they need to promote the hash, so the
+        promotion of a candidate meeting the criteria starts warm
+        :param candidates: The list of candidate hashes, newest first
+        :param candidate_label: The label the candidates were promoted to
+        :return: None
+        """
+        if self.config.dry_run or not self.config.preflight_candidates:
+            return
+        client_names = [client_name for client_name
+                        in self.config.allowed_clients
+                        if hasattr(getattr(self, client_name), 'prepare')]
+        for candidate_hash in candidates[:self.config.preflight_candidates]:
+            for client_name in client_names:
+                executor = self.get_preflight_executor(client_name)
+                future = executor.submit(self.run_preflight, client_name,
+                                         candidate_hash, candidate_label)
+                self.preflight.append((candidate_hash.full_hash, future))
+
+    def wait_preflight(self, candidate_hash=None):
+        """
+        Cancels the preflight work not yet started for other candidates, and
+        waits for the running one, so the clients are free to promote
+        :param candidate_hash: The hash about to be promoted, its preflight
+        is completed instead of cancelled
+        :return: None
+        """
+        full_hash = getattr(candidate_hash, 'full_hash', None)
+        for preflight_hash, future in self.preflight:
+            if preflight_hash != full_hash:
+                future.cancel()
+        futures.wait([future for __, future in self.preflight])
+        self.preflight = []
+
+    def discard_preflight(self):
+        """
+        Drops the preflight work of the candidates not promoted
+        :return: None
+        """
+        if not self.preflight_executors:
+            return
+        self.wait_preflight()
+        for client_name in self.preflight_executors:
+            client = getattr(self, client_name)
+            if hasattr(client, 'discard'):
+                client.discard()
+
+    def shutdown_preflight(self):
+        """
+        Cancels the preflight work left and stops the threads of the
+        clients, they are created again by the next start_preflight
+        :return: None
+        """
+        self.wait_preflight()
+        for executor in self.preflight_executors.values():
+            executor.shutdown(wait=True)
+        self.preflight_executors = {}
 
     def select_candidates(self, candidate_label, target_label):
         """
@@ -92,7 +198,7 @@ class Promoter(object):
         :param target_label:  The label to which the candidate would be promoted
         :return: A list of candidate hashes
         """
-        candidate_hashes_list = self.dlrn_client.fetch_promotions(
+        candidate_hashes_list = self.fetch_promotions(
             candidate_label, count=self.config.latest_hashes_count)
 
         if not candidate_hashes_list:
@@ -113,7 +219,7 @@ class Promoter(object):
             candidate_hashes[dlrn_hash.full_hash][candidate_label] = \
                 dlrn_hash.timestamp
 
-        old_hashes = self.dlrn_client.fetch_promotions(target_label)
+        old_hashes = self.fetch_promotions(target_label)
         if not old_hashes:
             self.log.warning("Target label '{}': No hashes fetched."
                              " This could mean that the target label is new"
@@ -141,7 +247,9 @@ class Promoter(object):
 
         if candidate_hashes_list:
             self.log.info("Candidate hashes younger than target label current")
-            print_hash_table(self.log, candidate_hashes_list)
+            candidates_entry = self.report.add_candidates(
+                candidate_label, target_label, candidate_hashes_list)
+            self.report.log_candidates(self.log, candidates_entry)
         else:
             self.log.info("Candidate hashes: none found younger than target "
                           "label current")
@@ -170,10 +278,10 @@ class Promoter(object):
         if allowed_clients is None:
             allowed_clients = self.config.allowed_clients
 
-        # DLRN client should always be called last,
-        # This ensures the order of the called clients, it uses alphabetical
-        # sorting, which is quite weak but works. If it becomes inconvenient,
-        # we can just remove the loop here and act on clients singularly
+        self.wait_preflight(candidate_hash)
+
+        # The sort only gives a stable order to the logs, the order of the
+        # promotions is decided by CLIENT_DEPENDENCIES
         allowed_clients.sort(reverse=True)
 
         self.log.debug("Candidate hash '%s': clients allowed to promote: %s"
@@ -182,27 +290,198 @@ class Promoter(object):
         self.log.info("Candidate hash '%s': attempting promotion"
                       "", candidate_hash)
         candidate_hash.label = candidate_label
-        for client_name in allowed_clients:
-            client = getattr(self, client_name)
-            self.dlrn_client.check_named_hashes_unchanged()
-            try:
-                client.promote(candidate_hash, target_label,
-                               candidate_label=candidate_label)
-                self.log.debug(
-                    "Candidate hash '%s': client %s SUCCESSFUL promotion"
-                    "", candidate_hash, client_name)
-            except PromotionError as e:
+        status.set(candidate_label=candidate_label, target_label=target_label,
+                   candidate_hash=candidate_hash)
+        successful, failed = self.promote_clients(
+            allowed_clients, candidate_hash, candidate_label, target_label)
+
+        for client_name in successful:
+            self.log.debug("Candidate hash '%s': client %s SUCCESSFUL promotion"
+                           "", candidate_hash, client_name)
+        for client_name, ex in failed:
+            if isinstance(ex, PromotionError):
                 self.log.error("Candidate hash '%s': client %s FAILED "
                                "promotion attempt to %s"
                                "", candidate_hash, client_name, target_label)
-                self.log.exception(e)
-                raise
+                self.log.exception(ex)
+        if failed:
+            status.count_promotion(successful=False)
+            raise failed[0][1]
 
+        status.set(client=None)
+        status.count_promotion(successful=True)
         promoted_pair = (candidate_hash, target_label)
         self.log.info("Candidate hash '%s': SUCCESSFUL promotion to %s"
                       "", candidate_hash, target_label)
         return promoted_pair
 
+    def promote_clients(self, client_names, candidate_hash, candidate_label,
+                        target_label):
+        """
+        Runs the promotion of the clients following CLIENT_DEPENDENCIES: a
+        client starts as soon as the clients it depends on are promoted,
+        independent clients run concurrently. After a failure no other client
+        is started, so DLRN is never promoted if an artifact client failed
+        :param client_names: The names of the clients to promote with
+        :param candidate_hash: The hash to promote
+        :param candidate_label: The label the hash was promoted to
+        :param target_label: The label to promote the hash to
+        :return: A tuple with the list of the successful clients, and the
+        list of (client name, exception) of the failed ones, both in
+        client_names order
+        """
+        pending = list(client_names)
+        dependencies = {client_name: set(CLIENT_DEPENDENCIES.get(
+            client_name, [])).intersection(client_names)
+            for client_name in client_names}
+        successful = []
+        failed = []
+        running = {}
+
+        def promote_client(client_name):
+            client = getattr(self, client_name)
+            with status.phase(client_name):
+                client.promote(candidate_hash, target_label,
+                               candidate_label=candidate_label)
+
+        with futures.ThreadPoolExecutor(
+                max_workers=max(len(client_names), 1)) as executor:
+            while pending or running:
+                ready = [client_name for client_name in pending
+                         if dependencies[client_name].issubset(successful)]
+                if not failed:
+                    for client_name in ready:
+                        self.dlrn_client.check_named_hashes_unchanged()
+                        pending.remove(client_name)
+                        running[executor.submit(promote_client,
+                                                client_name)] = client_name
+                    status.set(client=', '.join(sorted(running.values())))
+                if not running:
+                    break
+                done, __ = futures.wait(list(running),
+                                        return_when=futures.FIRST_COMPLETED)
+                for future in done:
+                    client_name = running.pop(future)
+                    if future.exception() is None:
+                        successful.append(client_name)
+                    else:
+                        failed.append((client_name, future.exception()))
+
+        status.set(client=None)
+        if pending and not failed:
+            raise PromotionError("Circular dependencies between clients {}"
+                                 "".format(', '.join(pending)))
+        return ([client_name for client_name in client_names
+                 if client_name in successful],
+                sorted(failed, key=lambda failure:
+                       client_names.index(failure[0])))
+
+    @staticmethod
+    def plan_batch(promotions):
+        """
+        Splits a list of promotions in groups that can run independently.
+        Promotions that share a label, as candidate or as target, end in
+        the same group and keep their relative order
+        :param promotions: A list of dicts with at least candidate_label and
+        target_label keys
+        :return: A list of groups, each a list of promotions
+        """
+        parents = {}
+
+        def find(label):
+            parents.setdefault(label, label)
+            while parents[label] != label:
+                label = parents[label]
+            return label
+
+        for promotion in promotions:
+            candidate_root = find(promotion['candidate_label'])
+            target_root = find(promotion['target_label'])
+            parents[target_root] = candidate_root
+
+        groups = OrderedDict()
+        for promotion in promotions:
+            root = find(promotion['candidate_label'])
+            groups.setdefault(root, []).append(promotion)
+        return list(groups.values())
+
+    def worker_promoter(self):
+        """
+        Creates the promoter of a group of promotions running concurrently
+        with the others. It shares the configuration and the dlrn client,
+        but has its own artifact clients, as they keep the state of the
+        promotion in progress (connection, working dir, rollback links)
+        :return: A Promoter
+        """
+        worker = copy.copy(self)
+        worker.registries_client = RegistriesClient(self.config)
+        worker.qcow_client = QcowClient(self.config)
+        worker.dockerfile_client = DockerfileClient(self.config)
+        worker.preflight = []
+        worker.preflight_executors = {}
+        return worker
+
+    def promote_batch(self, promotions, workers=1):
+        """
+        Promotes a list of candidate hashes reusing the same clients and
+        connections for all of them. Independent groups of promotions (see
+        plan_batch) run concurrently, promotions inside a group run in order
+        and the group stops at the first failure. With more than one worker
+        each group is promoted with its own artifact clients.
+        :param promotions: A list of dicts with keys candidate_hash,
+        candidate_label, target_label and optionally allowed_clients
+        :param workers: The max number of groups promoted concurrently
+        :return: A list of promoted (candidate, target) tuples. Raises
+        PromotionError at the end if any of the promotions failed
+        """
+        groups = self.plan_batch(promotions)
+        self.log.info("Batch promotion: %d promotions in %d independent "
+                      "groups", len(promotions), len(groups))
+
+        def promote_group(group):
+            promoter = self
+            if workers > 1:
+                promoter = self.worker_promoter()
+            promoted = []
+            for index, promotion in enumerate(group):
+                allowed_clients = list(promotion.get('allowed_clients')
+                                       or self.config.allowed_clients)
+                try:
+                    promoted_pair = promoter.promote(
+                        promotion['candidate_hash'],
+                        promotion['candidate_label'],
+                        promotion['target_label'], allowed_clients)
+                except Exception as ex:
+                    skipped = len(group) - index - 1
+                    return promoted, (promotion, ex, skipped)
+                if promoted_pair:
+                    promoted.append(promoted_pair)
+            return promoted, None
+
+        promoted_pairs = []
+        failures = []
+        with futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            results = [executor.submit(promote_group, group)
+                       for group in groups]
+            for future in results:
+                promoted, failure = future.result()
+                promoted_pairs.extend(promoted)
+                if failure is not None:
+                    failures.append(failure)
+
+        for promotion, ex, skipped in failures:
+            self.log.error("Batch promotion: FAILED promotion of '%s' from "
+                           "%s to %s: %s. Skipped %d dependent promotions",
+                           promotion['candidate_hash'],
+                           promotion['candidate_label'],
+                           promotion['target_label'], ex, skipped)
+        self.log.info("Batch promotion: %d of %d promotions SUCCESSFUL",
+                      len(promoted_pairs), len(promotions))
+        if failures:
+            raise PromotionError("Batch promotion: {} groups failed"
+                                 "".format(len(failures)))
+        return promoted_pairs
+
     def promote_label_to_label(self, candidate_label, target_label):
         """
         Launch the selection of candidate hashes in a certain label, verifies
@@ -215,9 +494,11 @@ class Promoter(object):
         :return: None
         """
         promoted_pair = ()
-        jobs_list = []
-        selected_candidates = self.select_candidates(candidate_label,
-                                                     target_label)
+        status.set(candidate_label=candidate_label, target_label=target_label,
+                   candidate_hash=None, client=None)
+        with status.phase('select_candidates'):
+            selected_candidates = self.select_candidates(candidate_label,
+                                                         target_label)
         if not selected_candidates:
             self.log.warning("Candidate label '%s': No candidate hashes"
                              "", candidate_label)
@@ -226,6 +507,28 @@ class Promoter(object):
             self.log.info("Candidate label '%s': %d candidates"
                           "", candidate_label, len(selected_candidates))
 
+        self.start_preflight(selected_candidates, candidate_label)
+        try:
+            return self.check_candidates(selected_candidates,
+                                         candidate_label, target_label)
+        finally:
+            self.discard_preflight()
+
+    def check_candidates(self, selected_candidates, candidate_label,
+                         target_label):
+        """
+        Verifies which candidates meet the criteria for promotion and
+        promotes the first one that does
+        :param selected_candidates: The list of candidate hashes
+        :param candidate_label: the label whose associated hashes we'd like
+        to promote
+        :param target_label: the label to which a winning hash should be
+        promoted
+        :return: A (candidate, target) tuple if a hash was promoted, an
+        empty tuple otherwise
+        """
+        promoted_pair = ()
+
         self.log.info("Candidate label '%s': Checking candidates that meet "
                       "promotion criteria for target label '%s'"
                       "", candidate_label, target_label)
@@ -234,9 +537,9 @@ class Promoter(object):
             self.config.promotions[target_label].get('alternative_criteria', {})
 
         for candidate_hash in selected_candidates:
-            ci_votes = self.dlrn_client.get_civotes_info(candidate_hash)
-            successful_jobs = \
-                set(self.dlrn_client.fetch_jobs(candidate_hash))
+            status.set(candidate_hash=candidate_hash)
+            with status.phase('fetch_votes'):
+                ci_votes, successful_jobs = self.fetch_votes(candidate_hash)
             if successful_jobs:
                 self.log.info("Candidate hash '%s': vote details page "
                               "- %s", candidate_hash,
@@ -260,8 +563,11 @@ class Promoter(object):
 
             # Missing jobs - considering also alternative jobs
             missing_jobs = set(required_jobs - successful_jobs)
-            print_job_table(self.log, jobs_list, candidate_hash, False,
-                            successful_jobs, missing_jobs)
+            evaluation = self.report.add_evaluation(candidate_label,
+                                                    target_label,
+                                                    candidate_hash,
+                                                    successful_jobs,
+                                                    missing_jobs)
             if missing_jobs:
                 # self.log.warning("Candidate hash '%s': missing jobs %s"
                 #                 "", candidate_hash, missing_jobs)
@@ -278,12 +584,9 @@ class Promoter(object):
                                          target_label)
             if promoted_pair:
                 # stop here, don't try to promote other hashes
-                print_job_table(self.log, jobs_list, candidate_hash, True,
-                                successful_jobs, missing_jobs)
+                self.report.mark_promoted(evaluation)
                 break
-        self.log.info("\n {}".format(tabulate(jobs_list,
-                                              headers='firstrow',
-                                              tablefmt='grid')))
+        self.report.log_evaluations(self.log, candidate_label, target_label)
         return promoted_pair
 
     def promote_all(self):
@@ -294,26 +597,39 @@ class Promoter(object):
         """
         self.dlrn_client.fetch_current_named_hashes(store=True)
         promoted_pairs = []
+        self.report = PromotionReport(self.config.report_format)
         self.log.info("Starting promotion attempts for all labels")
 
-        for target_label, target_criteria in \
-                self.config.promotions.items():
-            candidate_label = target_criteria['candidate_label']
-            self.log.info("Candidate label '%s': Attempting promotion to '%s'"
-                          "", candidate_label, target_label)
-            promoted_pair = None
-            try:
-                promoted_pair = self.promote_label_to_label(candidate_label,
-                                                            target_label)
-            except PromotionError:
-                self.log.error("Error while trying to promote %s to %s",
-                               candidate_label, target_label)
-            if promoted_pair:
-                promoted_pairs.append(promoted_pair)
-            else:
-                self.log.warning("Candidate label '%s': NO candidate "
-                                 "hash promoted to %s"
-                                 "", candidate_label, target_label)
+        # The targets are promoted in configuration order, the targets fed by
+        # the same candidate label share the hashes and jobs fetched in this
+        # round
+        self.fetch_cache = {}
+        try:
+            for target_label, target_criteria in \
+                    self.config.promotions.items():
+                candidate_label = target_criteria['candidate_label']
+                self.log.info("Candidate label '%s': Attempting promotion to "
+                              "'%s'", candidate_label, target_label)
+                promoted_pair = None
+                try:
+                    promoted_pair = self.promote_label_to_label(
+                        candidate_label, target_label)
+                except PromotionError:
+                    self.log.error("Error while trying to promote %s to %s",
+                                   candidate_label, target_label)
+                    self.invalidate_label(target_label)
+                if promoted_pair:
+                    promoted_pairs.append(promoted_pair)
+                    self.invalidate_label(target_label)
+                else:
+                    self.log.warning("Candidate label '%s': NO candidate "
+                                     "hash promoted to %s"
+                                     "", candidate_label, target_label)
+        finally:
+            self.fetch_cache = None
+            self.shutdown_preflight()
+        if self.config.report_file:
+            self.report.write(self.config.report_file)
         self.log.info("Summary: Promoted {} hashes this round"
                       "".format(len(promoted_pairs)))
         self.log.info("------- -------- Promoter terminated normally")
@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+"""
+This file contains the classes and functions to plan and push the multi arch
+manifests of the containers.
+The planner finds with concurrent HEAD requests on the source registry which
+arches were built for each container, so only the manifest lists that can
+really be created are planned, and the containers without an image for an
+arch are skipped without trying to pull it.
+The plan is then executed in parallel, one sequence of docker manifest
+commands per container.
+"""
+import argparse
+import logging
+import re
+import subprocess
+import sys
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from http_session import get_session
+
+# The suffix of the arch specific tags, and the arch used to annotate them
+# in the manifest lists. The first one is the arch every manifest list is
+# created from
+ARCH_TAGS = OrderedDict([
+    ('x86_64', 'amd64'),
+    ('ppc64le', 'ppc64le'),
+])
+
+MANIFEST_TYPES = ", ".join([
+    "application/vnd.docker.distribution.manifest.v2+json",
+    "application/vnd.docker.distribution.manifest.list.v2+json",
+])
+
+
+class ManifestPlan(object):
+    """
+    The manifest lists to create for a hash: for each container the arch
+    tags that will be part of its manifest list
+    """
+
+    def __init__(self, full_hash, manifest_tag='_manifest'):
+        """
+        :param full_hash: The full hash the containers are tagged with
+        :param manifest_tag: The suffix of the manifest list tag
+        """
+        self.full_hash = full_hash
+        self.manifest_tag = manifest_tag
+        self.manifests = OrderedDict()
+        self.missing = []
+
+    @classmethod
+    def from_lists(cls, full_hash, containers, arch_containers,
+                   manifest_tag='_manifest'):
+        """
+        Builds a plan from lists of containers already known to have the
+        images
+        :param full_hash: The full hash the containers are tagged with
+        :param containers: The containers with an image for the first arch
+        in ARCH_TAGS
+        :param arch_containers: A dict with an arch tag as key and the list
+        of containers with an image for that arch as value
+        :param manifest_tag: The suffix of the manifest list tag
+        :return: A ManifestPlan
+        """
+        plan = cls(full_hash, manifest_tag=manifest_tag)
+        first_arch = next(iter(ARCH_TAGS))
+        for container in containers:
+            plan.add(container, [first_arch] + [
+                arch for arch in ARCH_TAGS if arch != first_arch
+                and container in arch_containers.get(arch, [])])
+        return plan
+
+    def add(self, container, arch_tags):
+        """
+        Adds a container to the plan. A container without images can't
+        have a manifest list and is recorded as missing
+        :param container: The container name
+        :param arch_tags: The arch tags the container has an image for
+        :return: None
+        """
+        if arch_tags:
+            self.manifests[container] = list(arch_tags)
+        else:
+            self.missing.append(container)
+
+    def containers_with(self, arch_tag):
+        """
+        :param arch_tag: One of the ARCH_TAGS
+        :return: The list of planned containers with an image for arch_tag
+        """
+        return [container for container, arch_tags in self.manifests.items()
+                if arch_tag in arch_tags]
+
+    def get_image(self, registry, container, arch_tag=None):
+        """
+        :param registry: The registry host and namespace
+        :param container: The container name
+        :param arch_tag: The arch tag of the image, None for the manifest list
+        :return: The full image reference
+        """
+        if arch_tag is None:
+            tag = "{}{}".format(self.full_hash, self.manifest_tag)
+        else:
+            tag = "{}_{}".format(self.full_hash, arch_tag)
+        return "{}/{}:{}".format(registry, container, tag)
+
+    def commands(self, registry, container, insecure=False):
+        """
+        Generates the commands to create, annotate and push the manifest
+        list of a container. The manifest list is created with all its
+        images at once instead of creating and amending it for each arch,
+        amend only replaces a list left locally by a failed push
+        :param registry: The registry host and namespace to push to
+        :param container: A planned container
+        :param insecure: Allow insecure registries
+        :return: A list of commands, each one a list of arguments
+        """
+        extra_opts = ['--insecure'] if insecure else []
+        manifest = self.get_image(registry, container)
+        images = [self.get_image(registry, container, arch_tag)
+                  for arch_tag in self.manifests[container]]
+        commands = [['docker', 'manifest', 'create', '--amend'] + extra_opts
+                    + [manifest] + images]
+        for arch_tag, image in zip(self.manifests[container], images):
+            commands.append(['docker', 'manifest', 'annotate', '--arch',
+                             ARCH_TAGS[arch_tag], manifest, image])
+        commands.append(['docker', 'manifest', 'push', '-p'] + extra_opts
+                        + [manifest])
+        return commands
+
+
+class ManifestPlanner(object):
+    """
+    Computes the manifest plan querying the source registry
+    """
+
+    log = logging.getLogger("promoter")
+
+    def __init__(self, registry_url, namespace, manifest_tag='_manifest',
+                 max_workers=10, session=None):
+        """
+        :param registry_url: The url of the source registry, with the scheme
+        :param namespace: The namespace of the containers in the registry
+        :param manifest_tag: The suffix of the manifest list tag
+        :param max_workers: The max number of concurrent lookups
+        :param session: An optional requests session to use, defaults to
+        the session shared by the promoter
+        """
+        self.registry_url = registry_url.rstrip('/')
+        self.namespace = namespace
+        self.manifest_tag = manifest_tag
+        self.max_workers = max_workers
+        self.session = session or get_session().session
+        self.tokens = {}
+
+    def get_token(self, authenticate):
+        """
+        Gets an anonymous pull token following a Bearer challenge
+        :param authenticate: The value of the WWW-Authenticate header
+        :return: The token, or None if the challenge is not a Bearer one or
+        the token can't be obtained
+        """
+        if not authenticate.startswith('Bearer '):
+            return None
+        challenge = dict(re.findall(r'(\w+)="([^"]*)"', authenticate))
+        scope = challenge.get('scope')
+        if scope in self.tokens:
+            return self.tokens[scope]
+        realm = challenge.pop('realm', None)
+        if realm is None:
+            return None
+        response = self.session.get(realm, params=challenge, timeout=30)
+        if not response.ok:
+            return None
+        token_info = response.json()
+        token = token_info.get('token') or token_info.get('access_token')
+        self.tokens[scope] = token
+        return token
+
+    def lookup(self, container, tag):
+        """
+        Checks if a tag exists for a container in the source registry
+        :param container: The container name
+        :param tag: The tag to look for
+        :return: True if found, False if not, None if the registry didn't
+        give a definitive answer
+        """
+        url = "{}/v2/{}/{}/manifests/{}".format(self.registry_url,
+                                                self.namespace, container,
+                                                tag)
+        headers = {'Accept': MANIFEST_TYPES}
+        try:
+            response = self.session.head(url, headers=headers, timeout=30)
+            if response.status_code == 401:
+                token = self.get_token(
+                    response.headers.get('WWW-Authenticate', ''))
+                if token:
+                    headers['Authorization'] = "Bearer {}".format(token)
+                    response = self.session.head(url, headers=headers,
+                                                 timeout=30)
+        except (requests.exceptions.RequestException, ValueError) as ex:
+            self.log.warning("Manifest planner: unable to check %s: %s",
+                             url, ex)
+            return None
+        if response.status_code == 200:
+            return True
+        if response.status_code == 404:
+            return False
+        self.log.warning("Manifest planner: unexpected status %s checking "
+                         "%s", response.status_code, url)
+        return None
+
+    def plan(self, containers, full_hash, arch_tags=None):
+        """
+        Checks concurrently which arch images exist for each container and
+        plans the manifest lists. If a lookup doesn't give a definitive
+        answer the image is considered present, and the push will verify it
+        :param containers: The list of container names
+        :param full_hash: The full hash the containers are tagged with
+        :param arch_tags: The arch tags to look up, default all the
+        ARCH_TAGS
+        :return: A ManifestPlan
+        """
+        containers = list(OrderedDict.fromkeys(containers))
+        arch_tags = list(arch_tags or ARCH_TAGS)
+        lookups = [(container, "{}_{}".format(full_hash, arch_tag))
+                   for container in containers for arch_tag in arch_tags]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            results = OrderedDict(
+                (lookup, executor.submit(self.lookup, *lookup))
+                for lookup in lookups)
+
+        plan = ManifestPlan(full_hash, manifest_tag=self.manifest_tag)
+        for container in containers:
+            found_tags = []
+            for arch_tag in arch_tags:
+                lookup = (container, "{}_{}".format(full_hash, arch_tag))
+                if results[lookup].result() is not False:
+                    found_tags.append(arch_tag)
+            plan.add(container, found_tags)
+        self.log.info("Manifest planner: %d manifest lists planned for %s, "
+                      "%s", len(plan.manifests), full_hash,
+                      ", ".join("{} {}".format(
+                          len(plan.containers_with(arch_tag)), arch_tag)
+                          for arch_tag in arch_tags))
+        if plan.missing:
+            self.log.warning("Manifest planner: no images found for %s",
+                             ", ".join(plan.missing))
+        return plan
+
+
+def execute_plan(plan, registry, max_workers=4, insecure=False,
+                 runner=None):
+    """
+    Pushes the manifest lists of the plan to a registry. The containers are
+    handled in parallel, the commands of each container in sequence
+    :param plan: A ManifestPlan
+    :param registry: The registry host and namespace to push to
+    :param max_workers: The max number of containers handled concurrently
+    :param insecure: Allow insecure registries
+    :param runner: The function used to run the commands, defaults to
+    subprocess.check_output
+    :return: A dict with the failed containers as keys and the errors as
+    values, empty if all the manifest lists were pushed
+    """
+    log = logging.getLogger("promoter")
+    runner = runner or subprocess.check_output
+
+    def push(container):
+        for command in plan.commands(registry, container, insecure=insecure):
+            log.debug("Running: %s", " ".join(command))
+            runner(command, stderr=subprocess.STDOUT)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = OrderedDict(
+            (container, executor.submit(push, container))
+            for container in plan.manifests)
+
+    failures = OrderedDict()
+    for container, result in results.items():
+        try:
+            result.result()
+        except (subprocess.CalledProcessError, OSError) as ex:
+            output = getattr(ex, 'output', None) or b''
+            if not isinstance(output, str):
+                output = output.decode('utf-8', 'replace')
+            log.error("Manifest push of %s failed: %s %s", container, ex,
+                      output)
+            failures[container] = ex
+    log.info("Pushed %d manifest lists to %s, %d failed",
+             len(results) - len(failures), registry, len(failures))
+    return failures
+
+
+def read_list(path):
+    with open(path) as list_file:
+        return [line.strip() for line in list_file if line.strip()]
+
+
+def arg_parser(cmd_line=None):
+    """
+    Parse the command line or the parameter to pass to the rest of the workflow
+    :param cmd_line: A string containing a command line (mainly used for
+    testing)
+    :return: An args object
+    """
+    parser = argparse.ArgumentParser(
+        description="Push the multi arch manifest lists of the containers")
+    parser.add_argument("--registry", required=True,
+                        help="The registry host and namespace to push to")
+    parser.add_argument("--full-hash", required=True,
+                        help="The full hash the containers are tagged with")
+    parser.add_argument("--containers-file", required=True,
+                        help="File with the containers with a {} image, one "
+                             "per line".format(next(iter(ARCH_TAGS))))
+    for arch_tag in list(ARCH_TAGS)[1:]:
+        parser.add_argument("--{}-containers-file".format(arch_tag),
+                            dest="{}_containers_file".format(arch_tag),
+                            default=None,
+                            help="File with the containers with a {} image, "
+                                 "one per line".format(arch_tag))
+    parser.add_argument("--manifest-tag", default="_manifest",
+                        help="The suffix of the manifest list tag")
+    parser.add_argument("--workers", type=int, default=4,
+                        help="The number of containers handled concurrently")
+    parser.add_argument("--insecure", action="store_true",
+                        help="Allow insecure registries")
+
+    if cmd_line is not None:
+        return parser.parse_args(cmd_line.split())
+    return parser.parse_args()
+
+
+def main(cmd_line=None):
+    args = arg_parser(cmd_line=cmd_line)
+    arch_containers = {}
+    for arch_tag in list(ARCH_TAGS)[1:]:
+        path = getattr(args, "{}_containers_file".format(arch_tag))
+        if path:
+            arch_containers[arch_tag] = read_list(path)
+    plan = ManifestPlan.from_lists(args.full_hash,
+                                   read_list(args.containers_file),
+                                   arch_containers,
+                                   manifest_tag=args.manifest_tag)
+    failures = execute_plan(plan, args.registry, max_workers=args.workers,
+                            insecure=args.insecure)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
@@ -15,8 +15,11 @@ import logging
 import os
 import re
 import stat
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 import dlrnapi_client
+import requests
 
 try:
     import urllib2 as url_lib
@@ -30,6 +33,13 @@ logging.basicConfig(level=logging.DEBUG)
 log = logging.getLogger("promoter-integration-checks")
 log.setLevel(logging.DEBUG)
 
+# Manifests types accepted when querying the registries, manifest lists are
+# returned for multi arch images
+MANIFEST_TYPES = ", ".join([
+    "application/vnd.docker.distribution.manifest.v2+json",
+    "application/vnd.docker.distribution.manifest.list.v2+json",
+])
+
 
 def check_dlrn_promoted_hash(stage_info=None, **kwargs):
     """
@@ -76,62 +86,119 @@ def check_dlrn_promoted_hash(stage_info=None, **kwargs):
     assert any(conditions), error_message
 
 
+def lookup_manifests(lookups, max_workers=10, session=None):
+    """
+    Checks concurrently the presence of manifests in the registries.
+    All the lookups share the same pool of connections
+    :param lookups: A list of (registry host, image name, tag) tuples
+    :param max_workers: The max number of concurrent lookups
+    :param session: An optional requests session to use
+    :return: A dict with the lookups as keys and a bool as value, True if
+    the manifest was found
+    """
+    if session is None:
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=max_workers,
+                                                pool_maxsize=max_workers)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+
+    def lookup(registry, name, tag):
+        reg_url = "http://{}/v2/{}/manifests/{}".format(registry, name, tag)
+        log.info("Checking for promoted container: %s", reg_url)
+        try:
+            response = session.head(reg_url,
+                                    headers={'Accept': MANIFEST_TYPES},
+                                    timeout=30)
+        except requests.exceptions.RequestException as ex:
+            log.exception(ex)
+            return False
+        found = response.status_code == 200
+        log.debug("%s/%s:%s %s", registry, name, tag,
+                  "found" if found else "not found")
+        return found
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = OrderedDict(
+            (lookup_key, executor.submit(lookup, *lookup_key))
+            for lookup_key in OrderedDict.fromkeys(lookups))
+
+    return OrderedDict((lookup_key, future.result())
+                       for lookup_key, future in futures.items())
+
+
 def query_container_registry_promotion(stage_info=None, **kwargs):
     """
     Check that the hash containers have been pushed to the
-    promotion registry with the promotion_target tag
+    promotion registries with the promotion_target tag
+    All the lookups are run concurrently, and all the missing images are
+    reported at the end
     :param stage_info: a dictionary containing parameter of the staging env
-    :param kwargs: additional parameter for non-staged executions
-    :return: None
+    :param kwargs: additional parameter for non-staged executions:
+    registries (list of hosts), images (list of name:tag), candidate_hash,
+    promotion_target, no_ppc (optional, ppc images may be missing),
+    max_workers (optional)
+    :return: A dict with the report for each container, for each registry,
+    for each tag, True if the tag was found
     """
 
     if stage_info is not None:
-        registry_target = stage_info['registries']['targets'][0]['host']
+        registries = [target['host']
+                      for target in stage_info['registries']['targets']]
         promotion_target = stage_info['dlrn']['promotion_target']
         candidate_dict = stage_info['dlrn']['promotions']['promotion_candidate']
         candidate_hash = DlrnHash(source=candidate_dict)
-        missing_images = []
+        images = stage_info['containers']['images']
         no_ppc = stage_info.get('ppc_manifests', True)
-        for line in stage_info['containers']['images']:
-            name, tag = line.split(":")
-            reg_url = "http://{}/v2/{}/manifests/{}".format(
-                registry_target, name, tag
-            )
-            log.info("Checking for promoted container hash: %s", reg_url)
-            try:
-                url_lib.urlopen(reg_url)
-                log.debug("%s:%s found", name, tag)
-            except url_lib.HTTPError as ex:
-                log.exception(ex)
+    else:
+        # We are checking production
+        registries = kwargs['registries']
+        promotion_target = kwargs['promotion_target']
+        candidate_hash = kwargs['candidate_hash']
+        if isinstance(candidate_hash, dict):
+            candidate_hash = DlrnHash(source=candidate_hash)
+        images = kwargs['images']
+        no_ppc = kwargs.get('no_ppc', False)
+
+    # For the full_hash lines only, check that there is
+    # an equivalent promotion_target entry
+    checks = []
+    for line in images:
+        name, tag = line.split(":")
+        tags = [tag]
+        if tag == candidate_hash.full_hash:
+            tags.append(promotion_target)
+        checks.append((name, tags))
+
+    lookups = [(registry, name, tag)
+               for name, tags in checks
+               for registry in registries
+               for tag in tags]
+    results = lookup_manifests(lookups,
+                               max_workers=kwargs.get('max_workers', 10))
+
+    report = OrderedDict()
+    missing_images = []
+    for name, tags in checks:
+        container_report = report.setdefault(name, OrderedDict())
+        for registry in registries:
+            registry_report = container_report.setdefault(registry,
+                                                          OrderedDict())
+            for tag in tags:
+                found = results[(registry, name, tag)]
+                registry_report[tag] = found
+                image = "{}/{}:{}".format(registry, name, tag)
+                if found:
+                    continue
                 if no_ppc and '_ppc64le' in tag:
                     log.info("(expected - ppc manifests disabled)"
-                             "Image not found - %s", line)
+                             "Image not found - %s", image)
                 else:
-                    log.error("Image not found - %s", line)
-                    missing_images.append(line)
-            # For the full_hash lines only, check that there is
-            # an equivalent promotion_target entry
-            if tag == candidate_hash.full_hash:
-                reg_url = "http://{}/v2/{}/manifests/{}".format(
-                    registry_target, name, promotion_target
-                )
-                log.info("Checking for promoted container tag: %s", reg_url)
-                try:
-                    url_lib.urlopen(reg_url)
-                    log.debug("%s:%s found", name, promotion_target)
-                except url_lib.HTTPError as ex:
-                    log.exception(ex)
-                    log.error("Image with named tag not found - %s", line)
-                    promo_tgt_line = line.replace(candidate_hash.full_hash,
-                                                  promotion_target)
-                    missing_images.append(promo_tgt_line)
-    else:
-        # We are checking production
-        # TODO: how to verify promoter containers
-        log.info("Compare images tagged with hash and promotion target:")
-        log.error("Not implemented")
+                    log.error("Image not found - %s", image)
+                    missing_images.append(image)
 
     assert missing_images == [], "Images are missing {}".format(missing_images)
+    return report
 
 
 def compare_tagged_image_hash(stage_info=None, **kwargs):
@@ -192,31 +259,190 @@ def compare_tagged_image_hash(stage_info=None, **kwargs):
 
 def check_links(rl_module, promotion_link, target_label, promotion_dir,
                 previous_link=None, previous_dir=None):
-    try:
-        file_mode = rl_module.lstat(promotion_link).st_mode
-        assert True
-    except OSError:
-        assert False, "No link was created"
-    linked_dir = rl_module.readlink(promotion_link)
-    assert stat.S_ISLNK(file_mode), "promoter dir is not a symlink"
-
-    error_msg = "{} points to wrong dir {} instead of {}".format(target_label,
-                                                                 linked_dir,
-                                                                 promotion_dir)
-
-    assert linked_dir == promotion_dir, error_msg
-
+    errors = []
+    links = [(promotion_link, promotion_dir, target_label)]
     if previous_dir is not None and previous_link is not None:
+        links.append((previous_link, previous_dir, None))
+
+    # Check all the links before asserting, to report all the errors at once
+    for link, expected_dir, label in links:
         try:
-            file_mode = rl_module.lstat(previous_link).st_mode
-            assert True
+            file_mode = rl_module.lstat(link).st_mode
         except OSError:
-            assert False, "No link was created"
+            errors.append("No link {} was created".format(link))
+            continue
+        if not stat.S_ISLNK(file_mode):
+            errors.append("{} is not a symlink".format(link))
+            continue
+        linked_dir = rl_module.readlink(link)
+        if linked_dir != expected_dir:
+            if label is not None:
+                errors.append("{} points to wrong dir {} instead of {}"
+                              "".format(label, linked_dir, expected_dir))
+            else:
+                errors.append("{} != {}".format(linked_dir, expected_dir))
+
+    assert not errors, ", ".join(errors)
+
+
+class LogVerifier(object):
+    """
+    Verifies the content of a log reading it only once, line by line.
+    All the expected and forbidden patterns are combined in a single regular
+    expression, so the lines that don't match any pattern, which are the vast
+    majority, are discarded with a single search. Only lines that match are
+    then checked against the single patterns.
+    """
 
-        assert stat.S_ISLNK(file_mode), "Promoted dir is not a symlink"
-        p_link = rl_module.readlink(previous_link)
-        msg = "{} != {}".format(p_link, previous_dir)
-        assert p_link == previous_dir, msg
+    def __init__(self, expected_patterns, forbidden_patterns=None):
+        """
+        Compiles the patterns
+        :param expected_patterns: A list of regex strings that must be
+        found in the log
+        :param forbidden_patterns: A list of regex strings that must not be
+        found in the log
+        """
+        if forbidden_patterns is None:
+            forbidden_patterns = []
+        self.expected = OrderedDict(
+            (pattern, re.compile(pattern)) for pattern in expected_patterns)
+        self.forbidden = OrderedDict(
+            (pattern, re.compile(pattern)) for pattern in forbidden_patterns)
+        self.combined = re.compile("|".join(
+            "(?:{})".format(pattern)
+            for pattern in list(self.expected) + list(self.forbidden)))
+        self.found = OrderedDict()
+        self.forbidden_found = OrderedDict()
+        self.lines_read = 0
+
+    @property
+    def missing(self):
+        """
+        :return: The list of expected patterns not found so far
+        """
+        return [pattern for pattern in self.expected
+                if pattern not in self.found]
+
+    @property
+    def done(self):
+        """
+        The verification can stop as soon as all the expected patterns are
+        found, if there are no forbidden patterns to search for
+        :return: A bool, True if there is no need to read more lines
+        """
+        return not self.forbidden and not self.missing
+
+    def feed(self, line):
+        """
+        Checks a single line against the patterns, reporting the results
+        as soon as they are found
+        :param line: The line to check
+        :return: None
+        """
+        self.lines_read += 1
+        if not self.combined.search(line):
+            return
+        for pattern, regex in self.expected.items():
+            if pattern not in self.found and regex.search(line):
+                self.found[pattern] = self.lines_read
+                log.info("Pattern found at line %d: %s", self.lines_read,
+                         pattern)
+        for pattern, regex in self.forbidden.items():
+            if pattern not in self.forbidden_found and regex.search(line):
+                self.forbidden_found[pattern] = self.lines_read
+                log.error("Forbidden pattern found at line %d: %s",
+                          self.lines_read, pattern)
+
+    def verify(self, lines):
+        """
+        Feeds all the lines to the verifier, stopping early if possible
+        :param lines: An iterable of lines
+        :return: The verifier itself
+        """
+        for line in lines:
+            self.feed(line)
+            if self.done:
+                break
+        return self
+
+
+def iter_log_lines(location, offset=0, chunk_size=65536):
+    """
+    Yields the lines of a log, without loading it in memory.
+    The log can be a local file or a remote file over http(s). For
+    remote files, a range request is used to start reading from the offset,
+    if the server doesn't support range requests, the first offset bytes
+    are skipped while reading
+    :param location: The path or the url of the log
+    :param offset: The byte offset to start reading from
+    :param chunk_size: The size of the chunks to skip when the server
+    doesn't support range requests
+    :return: A generator of lines as strings
+    """
+    if location.startswith(("http://", "https://")):
+        request = url_lib.Request(location)
+        if offset:
+            request.add_header("Range", "bytes={}-".format(offset))
+        response = url_lib.urlopen(request)
+        try:
+            if offset and response.getcode() != 206:
+                to_skip = offset
+                while to_skip > 0:
+                    skipped = response.read(min(chunk_size, to_skip))
+                    if not skipped:
+                        break
+                    to_skip -= len(skipped)
+            for raw_line in response:
+                yield raw_line.decode("utf-8", errors="replace")
+        finally:
+            response.close()
+    else:
+        with open(os.path.expanduser(location), "rb") as log_file:
+            log_file.seek(offset)
+            for raw_line in log_file:
+                yield raw_line.decode("utf-8", errors="replace")
+
+
+def get_log_patterns(candidate_hash=None, promotion_target=None):
+    """
+    Builds the patterns to verify in the promoter logs
+    :param candidate_hash: The DlrnHash that is supposed to be promoted. If
+    None, only the patterns for a normal termination are returned
+    :param promotion_target: The label the candidate is supposed to be
+    promoted to
+    :return: A tuple with the lists of expected and forbidden patterns
+    """
+    expected_patterns = ["Promoter terminated normally"]
+    forbidden_patterns = []
+    if candidate_hash is None:
+        expected_patterns.append(r"Summary: Promoted \d+ hashes this round")
+        return expected_patterns, forbidden_patterns
+
+    # Patterns for the log in the new code
+    candidate_hash_pattern = re.sub("timestamp:.*",
+                                    "timestamp:.*",
+                                    str(candidate_hash))
+    # TODO(gcerami) check if something can be broken is we are not checking
+    #  the component correctly
+    candidate_hash_pattern = re.sub("component:.*",
+                                    "component:.*",
+                                    candidate_hash_pattern)
+    expected_patterns.extend([
+        "Summary: Promoted 1 hashes this round",
+        "Candidate hash '{}': criteria met, attempting promotion to "
+        "{}".format(candidate_hash_pattern, promotion_target),
+        "Qcow promote '{}' to {}: Successful promotion"
+        "".format(candidate_hash_pattern, promotion_target),
+        "Candidate hash '{}': SUCCESSFUL promotion to "
+        "{}".format(candidate_hash_pattern, promotion_target),
+        "Containers promote '{}' to {}: Successful promotion"
+        "".format(candidate_hash_pattern, promotion_target),
+    ])
+    forbidden_patterns.append(
+        "Candidate hash '{}': client .* FAILED promotion attempt to {}"
+        "".format(candidate_hash_pattern, promotion_target))
+
+    return expected_patterns, forbidden_patterns
 
 
 def parse_promotion_logs(stage_info=None, **kwargs):
@@ -224,7 +450,10 @@ def parse_promotion_logs(stage_info=None, **kwargs):
     Check that the promotion logs have the right
     strings printed for the promotion status
     :param stage_info: a dictionary containing parameter of the staging env
-    :param kwargs: additional parameter for non-staged executions
+    :param kwargs: additional parameter for non-staged executions:
+    logfile (path or url of the log), candidate_hash and promotion_target
+    (optional, to check a specific promotion), log_offset (optional, the byte
+    offset to start reading from)
     :return: None
     """
 
@@ -260,74 +489,40 @@ def parse_promotion_logs(stage_info=None, **kwargs):
 
         candidate_dict = stage_info['dlrn']['promotions']['promotion_candidate']
         candidate_hash = DlrnHash(source=candidate_dict)
-
-        with open(os.path.expanduser(logfile), 'r') as lf:
-            logfile_contents = lf.read()
+        promotion_target = stage_info['dlrn']['promotion_target']
     else:
         # We are checking production
-        # logfile = kwargs['logfile']
-        # from bs4 import BeautifulSoup
-        log.debug("Reading web hosted log file")
-        log.error("Not implemented")
-        # url = url_lib.request.urlopen(logfile).read()
-        # soup = BeautifulSoup(url, 'html.parser')
-        # logfile_contents = soup.get_text()
-
-    # Check that the promoter process finished
-    error_message = "Promoter never finished"
-    termination_message = "Promoter terminated normally"
-    assert termination_message in logfile_contents, error_message
+        # The log file can be a local path or an url of the web hosted log
+        logfile = kwargs['logfile']
+        log.debug("Reading log file %s", logfile)
+        candidate_hash = kwargs.get('candidate_hash', None)
+        if isinstance(candidate_hash, dict):
+            candidate_hash = DlrnHash(source=candidate_hash)
+        promotion_target = kwargs.get('promotion_target', None)
 
     # We have a list of hashes at our disposal, we know which one
     # will have to fail, and which one will have to pass
     # We can do all in the same pass
+    expected_patterns, forbidden_patterns = \
+        get_log_patterns(candidate_hash=candidate_hash,
+                         promotion_target=promotion_target)
+    if candidate_hash is not None:
+        log.info("Status Passing: %s", candidate_hash)
+    verifier = LogVerifier(expected_patterns,
+                           forbidden_patterns=forbidden_patterns)
+    verifier.verify(iter_log_lines(logfile,
+                                   offset=kwargs.get('log_offset', 0)))
+    log.info("Read %d lines from %s", verifier.lines_read, logfile)
 
-    # Patterns for the log in the new code
-    candidate_hash_pattern = re.sub("timestamp:.*",
-                                    "timestamp:.*",
-                                    str(candidate_hash))
-    # TODO(gcerami) check if something can be broken is we are not checking
-    #  the component correctly
-    candidate_hash_pattern = re.sub("component:.*",
-                                    "component:.*",
-                                    candidate_hash_pattern)
-    success_pattern_container = re.compile(
-        "Containers promote '{}' to tripleo-ci-staging-promoted: Successful "
-        "promotion".format(candidate_hash_pattern)
-    )
-    success_pattern_images = re.compile(
-        "Qcow promote '{}' to tripleo-ci-staging-promoted: "
-        "Successful promotion".format(candidate_hash_pattern)
-    )
-    success_pattern_criteria = re.compile(
-        "Candidate hash '{}': criteria met, attempting promotion to "
-        "tripleo-ci-staging-promoted".format(candidate_hash_pattern)
-    )
-    success_pattern_summary = re.compile(
-        "Summary: Promoted 1 hashes this round"
-    )
-    success_pattern_target = re.compile(
-        "Candidate hash '{}': SUCCESSFUL promotion to "
-        "tripleo-ci-staging-promoted".format(candidate_hash_pattern)
-    )
-
-    success_patterns = [
-        success_pattern_summary,
-        success_pattern_criteria,
-        success_pattern_images,
-        success_pattern_target,
-        success_pattern_container,
-    ]
-
-    # This commit is supposed succeed
-    # Check strings for passing hashes
-    log.info("Status Passing: %s", candidate_hash)
-    # Build pattern for successful promotion
-    for check_pattern in success_patterns:
-        success_pattern_search = \
-            check_pattern.search(logfile_contents)
-        error_message = "Pattern not found: %s" % check_pattern.pattern
-        assert success_pattern_search is not None, error_message
+    # Check that the promoter process finished
+    error_message = "Promoter never finished"
+    assert "Promoter terminated normally" in verifier.found, error_message
+
+    error_message = "Patterns not found: {}".format(verifier.missing)
+    assert not verifier.missing, error_message
+    error_message = "Forbidden patterns found: {}".format(
+        list(verifier.forbidden_found))
+    assert not verifier.forbidden_found, error_message
 
 
 def main():
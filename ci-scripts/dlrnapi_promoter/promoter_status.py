@@ -0,0 +1,261 @@
+"""
+This file contains the classes to track the live state of a running promoter
+and to expose it over http, as json on /status and in Prometheus text format
+on /metrics
+"""
+import contextlib
+import json
+import logging
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300,
+                   600)
+STATE_KEYS = ['target_label', 'candidate_label', 'candidate_hash', 'client']
+
+
+def escape_label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace(
+        '\n', '\\n')
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return "{{{}}}".format(",".join(
+        '{}="{}"'.format(name, escape_label_value(value))
+        for name, value in labels))
+
+
+class PromoterStatus(object):
+    """
+    Thread safe container of the live promoter state: what is being
+    promoted, the time spent in each phase, and counters and latency
+    histograms for the api calls
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.state = dict.fromkeys(STATE_KEYS)
+        self.phases = {}
+        self.api_calls = {}
+        self.promotions = {'successful': 0, 'failed': 0}
+
+    def set(self, **kwargs):
+        """
+        Updates the current promotion state
+        :param kwargs: Any of the STATE_KEYS, None clears the value
+        :return: None
+        """
+        with self.lock:
+            for key, value in kwargs.items():
+                if key not in STATE_KEYS:
+                    raise KeyError("Unknown promoter state {}".format(key))
+                self.state[key] = None if value is None else str(value)
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """
+        Tracks the time spent in a phase of the promotion
+        :param name: The name of the phase
+        """
+        start = time.time()
+        with self.lock:
+            phase = self.phases.setdefault(
+                name, {'running': 0, 'running_since': None, 'seconds': 0.0,
+                       'runs': 0})
+            phase['running'] += 1
+            phase['running_since'] = start
+        try:
+            yield
+        finally:
+            with self.lock:
+                phase['seconds'] += time.time() - start
+                phase['runs'] += 1
+                phase['running'] -= 1
+                if not phase['running']:
+                    phase['running_since'] = None
+
+    @contextlib.contextmanager
+    def api_call(self, name):
+        """
+        Counts an api call and records its latency, and the error if the
+        call raises
+        :param name: The name of the api call
+        """
+        start = time.time()
+        failed = False
+        try:
+            yield
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self.observe_api_call(name, time.time() - start, failed=failed)
+
+    def observe_api_call(self, name, seconds, failed=False):
+        with self.lock:
+            call = self.api_calls.setdefault(
+                name, {'count': 0, 'errors': 0, 'sum': 0.0,
+                       'buckets': [0] * len(LATENCY_BUCKETS)})
+            call['count'] += 1
+            call['sum'] += seconds
+            if failed:
+                call['errors'] += 1
+            for index, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    call['buckets'][index] += 1
+
+    def count_promotion(self, successful):
+        with self.lock:
+            self.promotions['successful' if successful else 'failed'] += 1
+
+    def snapshot(self):
+        """
+        :return: A json serializable copy of the current state
+        """
+        now = time.time()
+        with self.lock:
+            phases = {}
+            for name, phase in self.phases.items():
+                running = phase['running'] > 0
+                phases[name] = {
+                    'running': running,
+                    'elapsed': now - phase['running_since']
+                    if running else None,
+                    'seconds': phase['seconds'],
+                    'runs': phase['runs'],
+                }
+            return {
+                'uptime': now - self.started,
+                'state': dict(self.state),
+                'phases': phases,
+                'api_calls': {name: {'count': call['count'],
+                                     'errors': call['errors'],
+                                     'seconds': call['sum']}
+                              for name, call in self.api_calls.items()},
+                'promotions': dict(self.promotions),
+            }
+
+    def render_metrics(self):
+        """
+        Renders the state in Prometheus text exposition format
+        :return: A string with all the metrics
+        """
+        snapshot = self.snapshot()
+        lines = []
+
+        def metric(name, metric_type, help_text, samples):
+            lines.append("# HELP {} {}".format(name, help_text))
+            lines.append("# TYPE {} {}".format(name, metric_type))
+            for suffix, labels, value in samples:
+                lines.append("{}{}{} {}".format(name, suffix,
+                                                format_labels(labels), value))
+
+        metric('promoter_uptime_seconds', 'gauge',
+               "Seconds since the promoter started",
+               [('', [], snapshot['uptime'])])
+        metric('promoter_info', 'gauge', "What the promoter is working on",
+               [('', [(key, snapshot['state'][key] or '')
+                      for key in STATE_KEYS], 1)])
+        phases = sorted(snapshot['phases'].items())
+        metric('promoter_phase_running', 'gauge',
+               "1 if the promoter is in the phase",
+               [('', [('phase', name)], int(phase['running']))
+                for name, phase in phases])
+        metric('promoter_phase_elapsed_seconds', 'gauge',
+               "Seconds since the running phase started",
+               [('', [('phase', name)], phase['elapsed'])
+                for name, phase in phases if phase['running']])
+        metric('promoter_phase_seconds_total', 'counter',
+               "Seconds spent in completed runs of the phase",
+               [('', [('phase', name)], phase['seconds'])
+                for name, phase in phases])
+        metric('promoter_phase_runs_total', 'counter',
+               "Completed runs of the phase",
+               [('', [('phase', name)], phase['runs'])
+                for name, phase in phases])
+        metric('promoter_promotions_total', 'counter',
+               "Promotion attempts by result",
+               [('', [('result', result)], count)
+                for result, count in sorted(snapshot['promotions'].items())])
+        with self.lock:
+            api_calls = sorted((name, dict(call, buckets=list(
+                call['buckets']))) for name, call in self.api_calls.items())
+        metric('promoter_api_errors_total', 'counter', "Failed api calls",
+               [('', [('call', name)], call['errors'])
+                for name, call in api_calls])
+        samples = []
+        for name, call in api_calls:
+            for bound, count in zip(LATENCY_BUCKETS, call['buckets']):
+                samples.append(('_bucket', [('call', name), ('le', bound)],
+                                count))
+            samples.append(('_bucket', [('call', name), ('le', '+Inf')],
+                            call['count']))
+            samples.append(('_sum', [('call', name)], call['sum']))
+            samples.append(('_count', [('call', name)], call['count']))
+        metric('promoter_api_call_duration_seconds', 'histogram',
+               "Latency of the api calls", samples)
+        return "\n".join(lines) + "\n"
+
+
+# The status of this promoter process, updated by the promoter logic and
+# the clients
+status = PromoterStatus()
+
+
+class StatusRequestHandler(BaseHTTPRequestHandler):
+
+    log = logging.getLogger("promoter")
+
+    def do_GET(self):
+        path = self.path.split('?')[0]
+        if path == '/metrics':
+            body = self.server.status.render_metrics()
+            content_type = "text/plain; version=0.0.4; charset=utf-8"
+        elif path in ['/', '/status']:
+            body = json.dumps(self.server.status.snapshot(), indent=2)
+            content_type = "application/json"
+        else:
+            self.send_error(404)
+            return
+        body = body.encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, log_format, *args):
+        self.log.debug("Status server: %s - %s", self.address_string(),
+                       log_format % args)
+
+
+class StatusServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, promoter_status):
+        self.status = promoter_status
+        HTTPServer.__init__(self, address, StatusRequestHandler)
+
+
+def start_status_server(port, host='', promoter_status=None):
+    """
+    Starts the status server in a background thread
+    :param port: The port to listen on, 0 for a random free one
+    :param host: The address to listen on, default all
+    :param promoter_status: The PromoterStatus to expose, default the
+    process one
+    :return: The running StatusServer. Use its shutdown method to stop it
+    """
+    server = StatusServer((host, port), promoter_status or status)
+    thread = threading.Thread(target=server.serve_forever,
+                              name="promoter-status-server")
+    thread.daemon = True
+    thread.start()
+    logging.getLogger("promoter").info(
+        "Status server: listening on port %d", server.server_address[1])
+    return server
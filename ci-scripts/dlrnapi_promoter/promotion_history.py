@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""
+This file contains classes and functions to keep a local index of the
+promotion history of the DLRN labels.
+The promoter appends every successful promotion to the index, and the index
+can be backfilled incrementally from the DLRN API, so dashboards and tools
+can answer the common history questions without querying DLRN every time.
+DLRN is the authority on the history: a backfilled promotion replaces the
+rows the promoter recorded for the same hashes, and only the backfilled rows
+move the backfill watermark, so promotions made by other hosts are never
+skipped.
+"""
+import argparse
+import contextlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import dlrnapi_client
+
+HISTORY_FIELDS = ['commit_hash', 'distro_hash', 'extended_hash',
+                  'aggregate_hash', 'component', 'timestamp']
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS promotions (
+    label TEXT NOT NULL,
+    commit_hash TEXT,
+    distro_hash TEXT,
+    extended_hash TEXT NOT NULL DEFAULT '',
+    aggregate_hash TEXT NOT NULL DEFAULT '',
+    component TEXT NOT NULL DEFAULT '',
+    timestamp INTEGER NOT NULL,
+    source TEXT NOT NULL DEFAULT 'promoter',
+    UNIQUE (label, commit_hash, distro_hash, extended_hash, aggregate_hash,
+            component, timestamp)
+);
+CREATE INDEX IF NOT EXISTS promotions_label_timestamp
+    ON promotions (label, timestamp);
+"""
+
+INSERT_COLUMNS = ("label, commit_hash, distro_hash, extended_hash, "
+                  "aggregate_hash, component, timestamp, source")
+
+
+class PromotionHistory(object):
+    """
+    SQLite backed index of the promotions. Every method opens its own
+    connection, so the same object can be used from different threads
+    """
+
+    log = logging.getLogger("promoter")
+
+    def __init__(self, db_file):
+        """
+        :param db_file: The path of the sqlite file, created if missing
+        """
+        self.db_file = os.path.expanduser(db_file)
+        self.lock = threading.Lock()
+        self.schema_created = False
+
+    @contextlib.contextmanager
+    def connect(self):
+        """
+        Opens a connection to the index, creating the schema the first time
+        :return: A sqlite3 connection, committed and closed on exit
+        """
+        connection = sqlite3.connect(self.db_file, timeout=30)
+        connection.row_factory = sqlite3.Row
+        try:
+            if not self.schema_created:
+                connection.executescript(SCHEMA)
+                self.schema_created = True
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    @staticmethod
+    def promotion_to_row(label, promotion, timestamp=None, source='dlrn'):
+        """
+        Extracts the indexed fields from a DlrnHash or a DLRN api promotion
+        :param label: The label the hash was promoted to
+        :param promotion: A DlrnHash or an api promotion object
+        :param timestamp: The promotion timestamp, if not available in
+        promotion
+        :param source: 'dlrn' for the promotions fetched from DLRN,
+        'promoter' for the ones recorded by the promoter
+        :return: A tuple with the values in insertion order
+        """
+        values = [label]
+        for field in HISTORY_FIELDS[:-1]:
+            value = getattr(promotion, field, None)
+            values.append('' if value is None else value)
+        if timestamp is None:
+            timestamp = getattr(promotion, 'timestamp', None)
+        if timestamp is None:
+            timestamp = time.time()
+        values.append(int(timestamp))
+        values.append(source)
+        return tuple(values)
+
+    def add_promotions(self, label, promotions):
+        """
+        Adds the promotions fetched from DLRN to the index. The rows
+        recorded by the promoter for the same hashes are replaced, as their
+        timestamp may differ from the one DLRN stored
+        :param label: The label the hashes were promoted to
+        :param promotions: A list of DlrnHash or api promotion objects
+        :return: The number of promotions added
+        """
+        rows = [self.promotion_to_row(label, promotion)
+                for promotion in promotions]
+        with self.lock, self.connect() as connection:
+            connection.executemany(
+                "DELETE FROM promotions WHERE source = 'promoter' AND "
+                "label = ? AND commit_hash = ? AND distro_hash = ? AND "
+                "extended_hash = ? AND aggregate_hash = ? AND component = ?",
+                [row[:6] for row in rows])
+            before = connection.total_changes
+            connection.executemany(
+                "INSERT OR IGNORE INTO promotions ({}) VALUES "
+                "(?, ?, ?, ?, ?, ?, ?, ?)".format(INSERT_COLUMNS), rows)
+            return connection.total_changes - before
+
+    def record(self, dlrn_hash, label, timestamp=None):
+        """
+        Appends a successful promotion to the index. Errors are logged and
+        never break a promotion
+        :param dlrn_hash: The promoted DlrnHash
+        :param label: The label the hash was promoted to
+        :param timestamp: The promotion timestamp returned by DLRN, defaults
+        to now
+        :return: True if the promotion was recorded
+        """
+        row = self.promotion_to_row(label, dlrn_hash,
+                                    timestamp=timestamp or time.time(),
+                                    source='promoter')
+        try:
+            with self.lock, self.connect() as connection:
+                connection.execute(
+                    "INSERT OR IGNORE INTO promotions ({}) VALUES "
+                    "(?, ?, ?, ?, ?, ?, ?, ?)".format(INSERT_COLUMNS), row)
+        except sqlite3.Error as ex:
+            self.log.error("Promotion history: unable to record promotion "
+                           "of %s to %s in %s: %s", dlrn_hash, label,
+                           self.db_file, ex)
+            return False
+        return True
+
+    def last_timestamp(self, label):
+        """
+        :param label: The label to query
+        :return: The timestamp of the latest promotion to label fetched from
+        DLRN, None if nothing was backfilled yet
+        """
+        with self.connect() as connection:
+            row = connection.execute(
+                "SELECT MAX(timestamp) FROM promotions WHERE label = ? "
+                "AND source = 'dlrn'", (label,)).fetchone()
+        return row[0]
+
+    def backfill(self, api_instance, label, page_size=100):
+        """
+        Fetches from DLRN the promotions to label that are newer than the
+        latest one backfilled. DLRN returns promotions newest first, so
+        the fetch stops at the first page reaching the indexed ones
+        :param api_instance: A dlrnapi_client DefaultApi instance
+        :param label: The label to backfill
+        :param page_size: The number of promotions fetched per api call
+        :return: The number of promotions added
+        """
+        last_timestamp = self.last_timestamp(label)
+        promotions = []
+        offset = 0
+        while True:
+            query = dlrnapi_client.PromotionQuery(promote_name=label,
+                                                  offset=offset,
+                                                  limit=page_size)
+            page = api_instance.api_promotions_get(query)
+            promotions.extend(promotion for promotion in page
+                              if last_timestamp is None
+                              or promotion.timestamp >= last_timestamp)
+            if len(page) < page_size or (
+                    last_timestamp is not None
+                    and page[-1].timestamp <= last_timestamp):
+                break
+            offset += page_size
+        added = self.add_promotions(label, promotions)
+        self.log.info("Promotion history: label %s, %d new promotions",
+                      label, added)
+        return added
+
+    @staticmethod
+    def row_to_dict(row):
+        promotion = dict(row)
+        promotion.pop('source', None)
+        for field in HISTORY_FIELDS[:-1]:
+            if promotion.get(field) == '':
+                promotion[field] = None
+        return promotion
+
+    def latest(self, label):
+        """
+        :param label: The label to query
+        :return: A dict with the latest promotion to label, None if the
+        index has no promotions for it
+        """
+        with self.connect() as connection:
+            row = connection.execute(
+                "SELECT * FROM promotions WHERE label = ? "
+                "ORDER BY timestamp DESC LIMIT 1", (label,)).fetchone()
+        if row is None:
+            return None
+        return self.row_to_dict(row)
+
+    def history(self, label, since=None):
+        """
+        :param label: The label to query
+        :param since: Only promotions at or after this unix timestamp
+        :return: A list of dicts with the promotions to label, oldest first
+        """
+        with self.connect() as connection:
+            rows = connection.execute(
+                "SELECT * FROM promotions WHERE label = ? AND timestamp >= ? "
+                "ORDER BY timestamp", (label, since or 0)).fetchall()
+        return [self.row_to_dict(row) for row in rows]
+
+    def intervals(self, label, since=None):
+        """
+        Computes the time between consecutive promotions to a label.
+        Promotions of several components at the same time count as one
+        :param label: The label to query
+        :param since: Only promotions at or after this unix timestamp
+        :return: A list of (timestamp, seconds since previous promotion)
+        tuples, oldest first
+        """
+        with self.connect() as connection:
+            rows = connection.execute(
+                "SELECT DISTINCT timestamp FROM promotions WHERE label = ? "
+                "AND timestamp >= ? ORDER BY timestamp",
+                (label, since or 0)).fetchall()
+        timestamps = [row[0] for row in rows]
+        return [(current, current - previous) for previous, current
+                in zip(timestamps, timestamps[1:])]
+
+
+def arg_parser(cmd_line=None):
+    """
+    Parse the command line or the parameter to pass to the rest of the workflow
+    :param cmd_line: A string containing a command line (mainly used for
+    testing)
+    :return: An args object
+    """
+    parser = argparse.ArgumentParser(description="Promotion history index")
+    parser.add_argument("--db", required=True,
+                        help="The sqlite file with the index")
+    command_parser = parser.add_subparsers(dest='subcommand')
+    command_parser.required = True
+    backfill_parser = command_parser.add_parser(
+        'backfill', help="Add the new promotions from DLRN to the index")
+    backfill_parser.add_argument("--api-url", required=True,
+                                 help="The DLRN api url")
+    backfill_parser.add_argument("labels", nargs='+',
+                                 help="The labels to backfill")
+    for subcommand in ['latest', 'history', 'intervals']:
+        query_parser = command_parser.add_parser(
+            subcommand, help="Query the {} of a label".format(subcommand))
+        query_parser.add_argument("label")
+        if subcommand != 'latest':
+            query_parser.add_argument("--since", type=int, default=None,
+                                      help="Unix timestamp to start from")
+
+    if cmd_line is not None:
+        return parser.parse_args(cmd_line.split())
+    return parser.parse_args()
+
+
+def main(cmd_line=None):
+    args = arg_parser(cmd_line=cmd_line)
+    history = PromotionHistory(args.db)
+    if args.subcommand == 'backfill':
+        api_client = dlrnapi_client.ApiClient(host=args.api_url)
+        api_instance = dlrnapi_client.DefaultApi(api_client=api_client)
+        result = {label: history.backfill(api_instance, label)
+                  for label in args.labels}
+    elif args.subcommand == 'latest':
+        result = history.latest(args.label)
+    else:
+        result = getattr(history, args.subcommand)(args.label,
+                                                   since=args.since)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,247 @@
+"""
+This file contains the classes that collect what happened during a promotion
+round (the candidates fetched and how each of them was evaluated) and render
+it for the logs and the cockpit.
+Rendering is deferred: nothing is formatted until a log handler really emits
+the record or the json report is written.
+"""
+import json
+import logging
+import os
+import tempfile
+
+from tabulate import tabulate
+
+HASH_ATTRIBUTES = ['aggregate_hash', 'commit_hash', 'distro_hash',
+                   'extended_hash', 'component', 'timestamp']
+HASH_HEADERS = ['Aggregate Hash', 'Commit Hash', 'Distro Hash',
+                'Extended Hash', 'Component', 'Timestamp']
+REPORT_FORMATS = ['grid', 'compact', 'json', 'none']
+
+
+def hash_to_dict(dlrn_hash):
+    """
+    Extracts the fields shown in the reports from a DlrnHash
+    :param dlrn_hash: A DlrnHash object
+    :return: A dict with an entry for each attribute in HASH_ATTRIBUTES, None
+    if the hash type doesn't have it
+    """
+    return {attr: getattr(dlrn_hash, attr, None) for attr in HASH_ATTRIBUTES}
+
+
+def _cell(value):
+    if value is None:
+        return ''
+    return str(value)
+
+
+class DeferredRender(object):
+    """
+    Wraps a render function so that it's called only when the object is
+    converted to string, for example by a log handler that emits the record.
+    """
+
+    def __init__(self, render, *args):
+        self.render = render
+        self.args = args
+
+    def __str__(self):
+        return self.render(*self.args)
+
+
+class PromotionReport(object):
+    """
+    Structured report of a promotion round.
+    The promoter adds entries while it evaluates the candidates, the
+    rendering in one of the REPORT_FORMATS is done only when needed.
+    """
+
+    log = logging.getLogger('promoter')
+
+    def __init__(self, report_format='grid'):
+        """
+        :param report_format: The format used in the logs, one of
+        REPORT_FORMATS. 'none' disables the tables in the logs
+        """
+        if report_format not in REPORT_FORMATS:
+            self.log.error("Unknown report format '%s', using 'grid'",
+                           report_format)
+            report_format = 'grid'
+        self.report_format = report_format
+        self.candidates = []
+        self.evaluations = []
+
+    def add_candidates(self, candidate_label, target_label, hashes):
+        """
+        Records the hashes selected as candidates for a promotion
+        :param candidate_label: The label the hashes were fetched from
+        :param target_label: The label the hashes could be promoted to
+        :param hashes: The list of selected DlrnHash
+        :return: The entry added to the report
+        """
+        entry = {
+            'candidate_label': candidate_label,
+            'target_label': target_label,
+            'hashes': [hash_to_dict(dlrn_hash) for dlrn_hash in hashes],
+        }
+        self.candidates.append(entry)
+        return entry
+
+    def add_evaluation(self, candidate_label, target_label, candidate_hash,
+                       successful_jobs, missing_jobs):
+        """
+        Records the result of the criteria check for a candidate hash
+        :param candidate_label: The label of the candidate hash
+        :param target_label: The label the candidate could be promoted to
+        :param candidate_hash: The DlrnHash evaluated
+        :param successful_jobs: The jobs that voted successfully on the hash
+        :param missing_jobs: The jobs required by the criteria that are
+        missing
+        :return: The entry added to the report
+        """
+        entry = {
+            'candidate_label': candidate_label,
+            'target_label': target_label,
+            'hash': hash_to_dict(candidate_hash),
+            'successful_jobs': sorted(successful_jobs),
+            'missing_jobs': sorted(missing_jobs),
+            'promoted': False,
+        }
+        self.evaluations.append(entry)
+        return entry
+
+    @staticmethod
+    def mark_promoted(entry):
+        """
+        Marks an evaluation as promoted
+        :param entry: The entry returned by add_evaluation
+        :return: None
+        """
+        entry['promoted'] = True
+
+    def get_evaluations(self, candidate_label, target_label):
+        return [entry for entry in self.evaluations
+                if entry['candidate_label'] == candidate_label
+                and entry['target_label'] == target_label]
+
+    def as_dict(self):
+        """
+        :return: The whole report as a json serializable dict
+        """
+        return {
+            'candidates': self.candidates,
+            'evaluations': self.evaluations,
+            'promoted': [{
+                'candidate_label': entry['candidate_label'],
+                'target_label': entry['target_label'],
+                'hash': entry['hash'],
+            } for entry in self.evaluations if entry['promoted']],
+        }
+
+    def render_candidates(self, entry, report_format=None):
+        """
+        Renders a candidates entry
+        :param entry: The entry returned by add_candidates
+        :param report_format: The format to use, defaults to the report one
+        :return: The rendered string
+        """
+        report_format = report_format or self.report_format
+        if report_format == 'json':
+            return json.dumps(entry, sort_keys=True, default=str)
+        rows = [[_cell(hash_dict[attr]) for attr in HASH_ATTRIBUTES]
+                for hash_dict in entry['hashes']]
+        if report_format == 'compact':
+            return "\n".join(" ".join(cell for cell in row if cell)
+                             for row in rows)
+        return tabulate(rows, headers=HASH_HEADERS, tablefmt='grid')
+
+    def render_evaluations(self, entries, report_format=None):
+        """
+        Renders a list of evaluation entries
+        :param entries: A list of entries returned by add_evaluation
+        :param report_format: The format to use, defaults to the report one
+        :return: The rendered string
+        """
+        report_format = report_format or self.report_format
+        if report_format == 'json':
+            return json.dumps(entries, sort_keys=True, default=str)
+        if report_format == 'compact':
+            lines = []
+            for entry in entries:
+                hash_dict = entry['hash']
+                name = hash_dict['aggregate_hash'] or "{}_{}".format(
+                    hash_dict['commit_hash'], hash_dict['distro_hash'])
+                lines.append("{} promoted: {} successful jobs: {} missing "
+                             "jobs: {}".format(
+                                 name, 'Yes' if entry['promoted'] else 'No',
+                                 len(entry['successful_jobs']),
+                                 ', '.join(entry['missing_jobs']) or '-'))
+            return "\n".join(lines)
+        rows = []
+        for entry in entries:
+            hash_dict = entry['hash']
+            details = [[header, _cell(hash_dict[attr])]
+                       for header, attr in zip(HASH_HEADERS[1:],
+                                               HASH_ATTRIBUTES[1:])]
+            details.append(['Successful Jobs',
+                            "\n".join(entry['successful_jobs'])])
+            details.append(['Missing Jobs', "\n".join(entry['missing_jobs'])])
+            rows.append([_cell(hash_dict['aggregate_hash']),
+                         'Yes' if entry['promoted'] else 'No',
+                         tabulate(details, tablefmt='grid')])
+        return tabulate(rows, headers=['Aggregate Hash', 'Promoted',
+                                       'Description'], tablefmt='grid')
+
+    def log_candidates(self, log, entry):
+        """
+        Logs a candidates entry at info level, rendering it only if the
+        record is emitted
+        :param log: The logger to use
+        :param entry: The entry returned by add_candidates
+        :return: None
+        """
+        if self.report_format == 'none' or not log.isEnabledFor(logging.INFO):
+            return
+        log.info("\n %s", DeferredRender(self.render_candidates, entry))
+
+    def log_evaluations(self, log, candidate_label, target_label):
+        """
+        Logs the evaluations for a label pair at info level, rendering them
+        only if the record is emitted
+        :param log: The logger to use
+        :param candidate_label: The candidate label of the evaluations
+        :param target_label: The target label of the evaluations
+        :return: None
+        """
+        if self.report_format == 'none' or not log.isEnabledFor(logging.INFO):
+            return
+        entries = self.get_evaluations(candidate_label, target_label)
+        if entries:
+            log.info("\n %s", DeferredRender(self.render_evaluations,
+                                             entries))
+
+    def write(self, report_file):
+        """
+        Writes the json report, replacing the file atomically so readers
+        never get a partial report
+        :param report_file: The path of the file to write
+        :return: True if the report was written, False otherwise
+        """
+        report_file = os.path.expanduser(report_file)
+        report_dir = os.path.dirname(report_file) or '.'
+        tmp_path = None
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=report_dir,
+                                            prefix='.promotion_report')
+            with os.fdopen(fd, 'w') as tmp_file:
+                json.dump(self.as_dict(), tmp_file, sort_keys=True,
+                          default=str)
+            os.replace(tmp_path, report_file)
+        except (OSError, IOError) as ex:
+            self.log.error("Unable to write promotion report to %s: %s",
+                           report_file, ex)
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            return False
+        self.log.debug("Promotion report written to %s", report_file)
+        return True
@@ -22,6 +22,7 @@ class QcowConnectionClient(object):
         self._client_type = server_conf['client']
         self._keypath = server_conf['keypath']
         self._client = os
+        self.connected = False
         if self._client_type == "sftp":
             client = paramiko.SSHClient()
             client.load_system_host_keys()
@@ -44,6 +45,17 @@ class QcowConnectionClient(object):
         if hasattr(self, 'ssh_client'):
             self.ssh_client.connect(self._host, pkey=self.key, **self.kwargs)
             self._client = self.ssh_client.open_sftp()
+            self.connected = True
+
+    def is_connected(self):
+        """
+        :return: True if an sftp session is open and its transport is still
+        active
+        """
+        if not self.connected:
+            return False
+        transport = self.ssh_client.get_transport()
+        return transport is not None and transport.is_active()
 
     def __getattr__(self, item):
         return getattr(self._client, item)
@@ -51,6 +63,7 @@ class QcowConnectionClient(object):
     def close(self):
         if self._client_type == "sftp":
             self._client.close()
+            self.connected = False
 
 
 class QcowClient(object):
@@ -147,6 +160,27 @@ class QcowClient(object):
 
         return results
 
+    def prepare(self, candidate_hash, candidate_label=None):
+        """
+        Opens the connection to the server in advance and checks the images
+        dir of the candidate, so promote can start on a warm session
+        :param candidate_hash: The dlrn hash that may be promoted
+        :param candidate_label: Currently unused
+        :return: None
+        """
+        if not self.client.is_connected():
+            self.client.connect()
+        self.client.stat(os.path.join(self.images_dir,
+                                      candidate_hash.full_hash))
+
+    def discard(self):
+        """
+        Closes a connection opened by prepare and not used by a promotion
+        :return: None
+        """
+        if self.client.is_connected():
+            self.client.close()
+
     def rollback(self):
         """
         Rolls back the link to the initial status
@@ -176,7 +210,8 @@ class QcowClient(object):
         :return: None
         """
 
-        self.client.connect()
+        if not self.client.is_connected():
+            self.client.connect()
 
         if validation:
             self.validate_qcows(candidate_hash)
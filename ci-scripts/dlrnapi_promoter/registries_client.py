@@ -10,6 +10,7 @@ import tempfile
 
 import yaml
 from common import PromotionError
+from manifest_planner import ManifestPlanner
 from repo_client import RepoClient
 
 
@@ -43,30 +44,103 @@ class RegistriesClient(object):
             'target_registries_push': self.config.target_registries_push
         }
         self.repo_client = RepoClient(self.config)
+        # Containers lists resolved by prepare, consumed by the promotion
+        self.prepared = {}
 
-    def prepare_extra_vars(self, candidate_hash, target_label, candidate_label):
-        versions_reader = self.repo_client.get_versions_csv(candidate_hash,
-                                                            candidate_label)
-        if versions_reader is None:
-            self.log.error("No versions.csv found")
-            raise PromotionError
+    def filter_ppc_containers(self, ppc_containers_list, full_hash):
+        """
+        Keeps only the ppc containers that have really been built for the
+        hash, so the playbook doesn't try to pull the missing ones. The
+        lookup runs whenever a source registry is configured, the ppc
+        containers are pulled also when the manifests are not pushed
+        :param ppc_containers_list: The ppc containers base names
+        :param full_hash: The full hash the containers are tagged with
+        :return: The filtered list of base names
+        """
+        if not (self.config.manifest_source_registry
+                and ppc_containers_list):
+            return ppc_containers_list
+        prefix = self.repo_client.container_preffix
+        planner = ManifestPlanner(
+            self.config.manifest_source_registry,
+            self.config.source_namespace,
+            max_workers=self.config.manifest_lookup_workers)
+        # Only the ppc images decide the list, the x86 ones are not checked
+        plan = planner.plan([prefix + name for name in ppc_containers_list],
+                            full_hash, arch_tags=['ppc64le'])
+        ppc_containers = set(plan.containers_with('ppc64le'))
+        filtered = [name for name in ppc_containers_list
+                    if prefix + name in ppc_containers]
+        if len(filtered) < len(ppc_containers_list):
+            self.log.info("Skipping %d ppc containers without a ppc image",
+                          len(ppc_containers_list) - len(filtered))
+        return filtered
+
+    def get_containers(self, candidate_hash, candidate_label):
+        """
+        Resolves the lists of containers to push for a candidate hash from
+        its versions.csv and the tripleo-common containers list
+        :param candidate_hash: The hash to select container tags
+        :param candidate_label: The label the hash was promoted to
+        :return: A tuple with the x86 and the ppc containers lists
+        :raise PromotionError: With the reason if the lists can't be resolved
+        """
+        # The artifacts of the hash, cached by the repo client: versions.csv
+        # is parsed once in an index, shared by all the project lookups
+        artifacts = self.repo_client.get_versions_csv(candidate_hash,
+                                                      candidate_label)
+        if artifacts is None:
+            raise PromotionError("No versions.csv found")
 
         tripleo_sha = \
-            self.repo_client.get_commit_sha(versions_reader,
+            self.repo_client.get_commit_sha(artifacts,
                                             "openstack-tripleo-common")
         if not tripleo_sha:
-            self.log.error("Versions.csv does not contain tripleo-common "
-                           "commit")
-            raise PromotionError
+            raise PromotionError("Versions.csv does not contain tripleo-common "
+                                 "commit")
 
         containers_dict = self.repo_client.get_containers_list(tripleo_sha)
-        ppc_containers_list = containers_dict.get('ppc_containers_list', [])
         x86_containers_list = containers_dict.get('containers_list', [])
         if not x86_containers_list:
-            self.log.error("Containers list is empty")
-            raise PromotionError
+            raise PromotionError("Containers list is empty")
+        ppc_containers_list = self.filter_ppc_containers(
+            containers_dict.get('ppc_containers_list', []),
+            candidate_hash.full_hash)
+        return x86_containers_list, ppc_containers_list
+
+    def prepare(self, candidate_hash, candidate_label=None):
+        """
+        Resolves in advance the containers lists of a hash that may be
+        promoted, so promote doesn't have to wait for them
+        :param candidate_hash: The hash that may be promoted
+        :param candidate_label: The label the hash was promoted to
+        :return: None
+        """
+        key = (candidate_hash.full_hash, candidate_label)
+        self.prepared[key] = self.get_containers(candidate_hash,
+                                                 candidate_label)
+
+    def discard(self):
+        """
+        Drops the containers lists resolved in advance and not used
+        :return: None
+        """
+        self.prepared.clear()
 
-        extra_vars = {
+    def prepare_extra_vars(self, candidate_hash, target_label, candidate_label):
+        key = (candidate_hash.full_hash, candidate_label)
+        try:
+            x86_containers_list, ppc_containers_list = \
+                self.prepared.pop(key, None) \
+                or self.get_containers(candidate_hash, candidate_label)
+        except PromotionError as ex:
+            self.log.error(str(ex))
+            raise
+
+        # A new dict for each promotion, the client may promote several
+        # hashes at the same time
+        extra_vars = dict(self.extra_vars)
+        extra_vars.update({
             'candidate_label': candidate_label,
             'named_label': target_label,
             'commit_hash': candidate_hash.commit_hash,
@@ -76,15 +150,14 @@ class RegistriesClient(object):
             'ppc_containers_list': ppc_containers_list,
             'source_namespace': self.config.source_namespace,
             'target_namespace': self.config.target_namespace
-        }
+        })
 
-        self.extra_vars.update(extra_vars)
         __, extra_vars_path = tempfile.mkstemp(suffix=".yaml")
         self.log.debug("Crated extra vars file at %s", extra_vars_path)
         self.log.info("Passing extra vars to playbook: %s",
-                      str(self.extra_vars))
+                      str(extra_vars))
         with open(extra_vars_path, "w") as extra_vars_file:
-            yaml.safe_dump(self.extra_vars, extra_vars_file)
+            yaml.safe_dump(extra_vars, extra_vars_file)
 
         return extra_vars_path
 
@@ -1,24 +1,119 @@
+import contextlib
 import csv
 import logging
 import os
+from collections import OrderedDict
 
 import yaml
 from common import get_release_map
+from http_session import get_session
 
 try:
     # Python3 imports
-    from io import StringIO as csv_io  # noqa N813
+    import configparser as ini_parser
     from urllib import request as url
 except ImportError:
     # Python 2 imports
+    import ConfigParser as ini_parser  # noqa N813
     import urllib2 as url
-    from StringIO import StringIO as csv_io  # noqa N813
 
 
 class RepoError(Exception):
     pass
 
 
+def open_text_stream(file_url):
+    """
+    Opens a url as a text stream, decoding the response while it's read
+    instead of downloading and decoding it all in memory first
+    :param file_url: The url to open
+    :return: A text file object, to be closed by the caller
+    """
+    return get_session().open_text(file_url)
+
+
+class RepoArtifacts(object):
+    """
+    The files DLRN publishes in the commit dir of a hash: versions.csv and
+    delorean.repo. Each file is downloaded and parsed in a single pass over
+    the response stream the first time it's needed, then all the lookups
+    use the in memory indexes
+    """
+
+    log = logging.getLogger("promoter")
+
+    def __init__(self, repo_url, dlrn_hash):
+        """
+        :param repo_url: The base url of the DLRN repos
+        :param dlrn_hash: The hash whose commit dir contains the files
+        """
+        self.base_url = "{}/{}".format(repo_url, dlrn_hash.commit_dir)
+        self._versions = None
+        self._components = None
+
+    def get_url(self, file_name):
+        return "{}/{}".format(self.base_url, file_name)
+
+    @contextlib.contextmanager
+    def open(self, file_name):
+        """
+        Opens a file of the commit dir as a text stream, closed at the end
+        of the block. Download errors, also the ones raised while the body
+        is read, are raised as RepoError
+        """
+        file_url = self.get_url(file_name)
+        try:
+            with contextlib.closing(open_text_stream(file_url)) as stream:
+                yield stream
+        except (url.URLError, ValueError) as ex:
+            raise RepoError("Unable to download {}: {}".format(file_url, ex))
+
+    @property
+    def versions(self):
+        """
+        The versions.csv rows indexed by project
+        :return: An OrderedDict project name -> row dict. Raises RepoError
+        if the file can't be downloaded
+        """
+        if self._versions is None:
+            versions = OrderedDict()
+            with self.open("versions.csv") as versions_file:
+                for row in csv.DictReader(versions_file):
+                    if row:
+                        versions.setdefault(row['Project'], row)
+            self._versions = versions
+        return self._versions
+
+    def get_commit_sha(self, project_name):
+        """
+        :param project_name: The name of the project to look for
+        :return: The source sha of the project in versions.csv, None if
+        the project is not there
+        """
+        row = self.versions.get(project_name)
+        if row is None:
+            return None
+        return row['Source Sha']
+
+    @property
+    def components(self):
+        """
+        The repos listed in delorean.repo. For an aggregate hash these are
+        all the components that form the aggregate
+        :return: An OrderedDict repo name -> baseurl. Raises RepoError if
+        the file can't be downloaded
+        """
+        if self._components is None:
+            repo_config = ini_parser.ConfigParser()
+            repo_url = self.get_url("delorean.repo")
+            with self.open("delorean.repo") as repo_file:
+                repo_config.read_file(repo_file, source=repo_url)
+            self._components = OrderedDict(
+                (section, repo_config.get(section, 'baseurl'))
+                for section in repo_config.sections())
+        return self._components
+
+
 class RepoClient(object):
     log = logging.getLogger("promoter")
 
@@ -34,55 +129,56 @@ class RepoClient(object):
             config.containers["containers_list_exclude_config"]
         self.build_method = config.containers["build_method"]
         self.container_preffix = config.containers["container_preffix"]
+        self.artifacts = {}
+
+    def get_artifacts(self, dlrn_hash):
+        """
+        Returns the RepoArtifacts for a hash, reusing the ones already
+        created so the files of a commit dir are parsed only once
+        :param dlrn_hash: The hash to get the artifacts for
+        :return: A RepoArtifacts object
+        """
+        if dlrn_hash.commit_dir not in self.artifacts:
+            self.artifacts[dlrn_hash.commit_dir] = \
+                RepoArtifacts(self.root_url, dlrn_hash)
+        return self.artifacts[dlrn_hash.commit_dir]
 
     def get_versions_csv(self, dlrn_hash, candidate_label):
         """
         Download a versions.csv file relative to a commit referenced by
         hash. Aggregate Hash also require the label to be specified
+        The file is parsed once in an index by project, kept with the other
+        artifacts of the hash
         :param dlrn_hash: The hash associated to the label
         :param candidate_label:
-        :return: A csv reader (None in case of error)
+        :return: The RepoArtifacts of the hash, with versions.csv parsed
+        (None in case of error)
         """
-
-        versions_url = ("{}/{}/versions.csv"
-                        "".format(self.root_url, dlrn_hash.commit_dir))
+        artifacts = self.get_artifacts(dlrn_hash)
+        versions_url = artifacts.get_url("versions.csv")
         self.log.debug("Accessing versions at %s", versions_url)
         try:
-            versions_content = url.urlopen(versions_url).read()
-        except url.URLError as ex:
+            artifacts.versions
+        except RepoError as ex:
             self.log.error("Error downloading versions.csv file at %s",
                            versions_url)
             self.log.exception(ex)
             return None
 
-        # csv.DictReader takes a file as argument, not a string. The only
-        # file I have from urlopen is an undecoded file, that in python3 is a
-        # byte string. The only way to offer a file to csv is to read,
-        # eventually convert and use a stringIO
-
-        if not isinstance(versions_content, str):
-            versions_content = versions_content.decode("UTF-8")
-
-        csv_file = csv_io(versions_content)
-        versions_reader = csv.DictReader(csv_file)
-        return versions_reader
+        return artifacts
 
-    def get_commit_sha(self, versions_csv_reader, project_name):
+    def get_commit_sha(self, versions, project_name):
         """
         extract a commit sha for the specified project from a versions.csv file
-        :param versions_csv_reader: A csv reader for the versions.csv file
+        :param versions: The RepoArtifacts returned by get_versions_csv
         :param project_name: The name of the project to look for
         :return: A sha1 from a commit (None if not found
         """
 
-        commit_sha = None
         self.log.debug("Looking for sha commit of project %s in %s",
                        project_name,
-                       versions_csv_reader)
-        for row in versions_csv_reader:
-            if row and row['Project'] == project_name:
-                commit_sha = row['Source Sha']
-                break
+                       versions)
+        commit_sha = versions.get_commit_sha(project_name)
 
         if commit_sha is None:
             self.log.error("Unable to find commit sha for project %s",
@@ -108,7 +204,7 @@ class RepoClient(object):
             # Download and read the container file(overcloud_containers.yaml
             # or tripleo_containers.yaml) file
             # in bytes format from tripleo-common
-            containers_content = url.urlopen(containers_url).read()
+            containers_content = get_session().get(containers_url)
         except url.URLError as ex:
             self.log.error("Unable to download containers template at %s",
                            containers_url)
@@ -198,9 +294,11 @@ class RepoClient(object):
         exclude_content = None
         exclude_list = []
         ppc_exclude_list = []
+        cache_dir = getattr(self.config, 'http_cache_dir', None)
         try:
-            exclude_content_yaml = url.urlopen(
-                self.containers_list_exclude_config).read().decode()
+            exclude_content_yaml = get_session().get(
+                self.containers_list_exclude_config,
+                cache_dir=cache_dir).decode()
         except (url.URLError, ValueError) as ex:
             self.log.warning("Unable to download containers exclude config at "
                              "%s, no exclusion",
@@ -58,6 +58,12 @@ def parse_args(defaults, cmd_line=None):
                         ),
     parser.add_argument('--dry-run', action='store_true', default=False,
                         help="Don't do anything, still create stage-info")
+    parser.add_argument('--warm-cache', action='store_true', default=False,
+                        help=("Reuse base image and containers already "
+                              "pushed by a previous setup"))
+    parser.add_argument('--synthetic-commits', type=int, default=0,
+                        help=("Number of synthetic commits to add to the "
+                              "dlrn server db"))
     parser.add_argument('--promoter-user',
                         default=os.environ.get("USER", None),
                         help="The promoter user")
@@ -135,6 +141,10 @@ def main(cmd_line=None):
                             validate=None)
     # Export dlrn password
     os.environ['DLRNAPI_PASSWORD'] = config.dlrn['server']['password']
+    if args.warm_cache:
+        config['warm_cache'] = True
+    if args.synthetic_commits:
+        config['synthetic_commits'] = args.synthetic_commits
     staged_env = StageOrchestrator(config)
     args.handler(staged_env)
 
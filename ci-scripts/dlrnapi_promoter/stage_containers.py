@@ -8,6 +8,7 @@ import logging
 import os
 import shutil
 import tempfile
+from concurrent.futures import ThreadPoolExecutor
 
 import docker
 import yaml
@@ -95,6 +96,8 @@ class StagingContainers(object):
         """
         self.config = config
         self.dry_run = self.config['dry_run']
+        self.warm_cache = self.config['warm_cache']
+        self.workers = self.config['stage_workers']
         self.docker_client = docker.from_env()
         # Select only the stagedhash with the promotion candidate
         candidate_hash_dict = \
@@ -157,6 +160,7 @@ class StagingContainers(object):
             except ValueError:
                 self.log.debug("Not excluding container %s", excluded)
 
+        pushes = []
         for image_name in suffixes:
             if self.config['release'] in ['queens', 'stein',
                                           'train', 'ussuri']:
@@ -168,32 +172,67 @@ class StagingContainers(object):
                 image = "{}/{}".format(self.namespace, target_image_name)
                 full_image = "localhost:{}/{}".format(
                     self.source_registry['port'], image)
-                self.log.debug("Pushing container %s:%s"
-                               " to localhost:%s",
-                               image, tag, self.source_registry['port'])
                 # Skip ppc tagging on the last image in the list
                 # to emulate real life scenario
                 if "ppc64le" in tag and image_name == self.suffixes[-1]:
                     continue
-                if not self.dry_run:
-                    self.source_image.tag(full_image, tag=tag)
-                image_tag = "{}:{}".format(full_image, tag)
 
                 self.pushed_images.append("{}:{}".format(image, tag))
 
                 if self.dry_run:
                     continue
 
-                self.docker_client.images.push(full_image, tag=tag)
-                self.docker_client.images.remove(image_tag)
+                pushes.append((full_image, tag))
 
-        if not self.dry_run:
+        # Pushes are independent from each other, and mostly wait on the
+        # registry, so they run in a pool
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = [executor.submit(self.push_image, full_image, tag)
+                       for full_image, tag in pushes]
+            for future in futures:
+                future.result()
+
+        # In warm cache mode the base image is kept for the next setup
+        if not self.dry_run and not self.warm_cache:
             self.base_image.remove()
 
         self.generate_containers_yaml()
 
         return self.stage_info
 
+    def image_exists(self, full_image, tag):
+        """
+        Checks if a tag for an image is already present in the registry
+        :param full_image: The image name, including the registry host
+        :param tag: The tag to check
+        :return: True if the tag exists in the registry, False otherwise
+        """
+        try:
+            self.docker_client.images.get_registry_data(
+                "{}:{}".format(full_image, tag))
+        except docker.errors.APIError:
+            return False
+        return True
+
+    def push_image(self, full_image, tag):
+        """
+        Tags the base image with the full image name and tag, and pushes it
+        to the source registry. In warm cache mode, tags already present in
+        the registry are not pushed again
+        :param full_image: The image name, including the registry host
+        :param tag: The tag to push
+        :return: None
+        """
+        if self.warm_cache and self.image_exists(full_image, tag):
+            self.log.debug("Container %s:%s already in registry, not pushing",
+                           full_image, tag)
+            return
+
+        self.log.debug("Pushing container %s:%s", full_image, tag)
+        self.source_image.tag(full_image, tag=tag)
+        self.docker_client.images.push(full_image, tag=tag)
+        self.docker_client.images.remove("{}:{}".format(full_image, tag))
+
     @property
     def stage_info(self):
         """
@@ -4,6 +4,7 @@ staging dlrn server and the relative repository
 """
 import copy
 import csv
+import hashlib
 import logging
 import os
 import shutil
@@ -56,8 +57,20 @@ repo_template = '''[delorean${repo_name}]
 baseurl=file://${repo_root_files}/${commit_dir}
 '''
 
+# content of the versions.csv file, generated once
+versions_csv_content = None
+
 
 def generate_versions_csv():
+    """
+    Generates the content of the versions.csv file, it's the same for all the
+    commits, so it's generated only once
+    :return: A string with the csv content
+    """
+    global versions_csv_content
+    if versions_csv_content is not None:
+        return versions_csv_content
+
     fieldnames = ("Project,Source Repo,Source Sha,Dist Repo,Dist Sha,"
                   "Status,Last Success Timestamp,Component,Pkg NVR"
                   "").split(',')
@@ -109,7 +122,99 @@ def generate_versions_csv():
     for row in versions_csv_rows:
         csv_writer.writerow(row)
 
-    return versions_csv_file.getvalue()
+    versions_csv_content = versions_csv_file.getvalue()
+    return versions_csv_content
+
+
+def generate_synthetic_db_data(count, components=None, id_offset=100000,
+                               first_timestamp=1400000000):
+    """
+    Generates a synthetic history of commits, with ci votes and promotions,
+    to fill the staging db with a production-like amount of data.
+    The history is older than any commit in the db data files, so it doesn't
+    change the staged promotion candidates.
+    :param count: The number of commits to generate
+    :param components: A list of components to assign the commits to, in
+    turn. If None, the commits are single pipeline commits
+    :param id_offset: The first id for commits, votes and promotions, to
+    avoid clashes with the db data files
+    :param first_timestamp: The timestamp of the first commit
+    :return: A dict with commits, civotes and promotions, in the same format
+    of the db data files
+    """
+    commits = []
+    civotes = []
+    promotions = []
+    for index in range(count):
+        commit_id = id_offset + index
+        timestamp = first_timestamp + index * 10
+        commit_hash = hashlib.sha1(
+            "commit-{}".format(index).encode()).hexdigest()
+        distro_hash = hashlib.sha1(
+            "distro-{}".format(index).encode()).hexdigest()
+        component = None
+        if components:
+            component = components[index % len(components)]
+        commits.append({
+            'id': commit_id,
+            'commit_hash': commit_hash,
+            'distro_hash': distro_hash,
+            'extended_hash': None,
+            'dt_commit': timestamp,
+            'dt_distro': timestamp,
+            'dt_build': timestamp + 5,
+            'project_name': "synthetic-project-{}".format(index % 100),
+            'repo_dir': "/home/synthetic/data/synthetic-project",
+            'status': "SUCCESS",
+            'notes': "OK",
+            'flags': 0,
+            'type': "rpm",
+            'component': component,
+        })
+        # Every commit gets a passing vote and a failing vote, so no
+        # synthetic commit meets the staging criteria
+        for job_index, (ci_name, ci_vote) in enumerate(
+                [('staging-job-1', True), ('staging-job-2', False)]):
+            civotes.append({
+                'id': id_offset + index * 2 + job_index,
+                'commit_id': commit_id,
+                'ci_name': ci_name,
+                'ci_url': "http://nowhe.re",
+                'ci_vote': ci_vote,
+                'ci_in_progress': False,
+                'timestamp': timestamp + 6,
+                'notes': "",
+                'user': "ciuser",
+                'component': component,
+            })
+        # Build a label history similar to the production one
+        promotion_names = []
+        if index % 5 == 0:
+            promotion_names.append('tripleo-ci-staging')
+        if index % 20 == 0:
+            promotion_names.append('tripleo-ci-staging-promoted')
+        for promotion_name in promotion_names:
+            # Like dlrn, a component promotion records the hash of the
+            # aggregate repo it produced
+            aggregate_hash = None
+            if component is not None:
+                aggregate_hash = hashlib.md5("aggregate-{}-{}".format(
+                    promotion_name, index).encode()).hexdigest()
+            promotions.append({
+                'id': id_offset + len(promotions),
+                'commit_id': commit_id,
+                'promotion_name': promotion_name,
+                'timestamp': timestamp + 7,
+                'user': "ciuser",
+                'component': component,
+                'aggregate_hash': aggregate_hash,
+            })
+
+    return {
+        'commits': commits,
+        'civotes': civotes,
+        'promotions': promotions,
+    }
 
 
 def expand_dlrn_config(dlrn_config):
@@ -214,6 +319,19 @@ class StagingRepo(object):
         # One will be used for single pipeline
         # The other will be used for component pipeline
 
+        abs_commit_dir, subst_dict = self.prepare_commit_dir(commit)
+        self.create_additional_files(commit, abs_commit_dir, subst_dict)
+
+        return self.repo_root_files
+
+    def prepare_commit_dir(self, commit):
+        """
+        Creates the dir of a commit in the repo and sets up the templates
+        substitution variables for its files
+        :param commit: A dict with the commit info
+        :return: A tuple with the absolute path of the commit dir and the
+        substitution dictionary
+        """
         dlrn_hash = DlrnCommitDistroExtendedHash(source=commit)
 
         subst_dict = {
@@ -237,9 +355,26 @@ class StagingRepo(object):
         except OSError:
             pass
 
-        self.create_additional_files(commit, abs_commit_dir, subst_dict)
+        return abs_commit_dir, subst_dict
 
-        return self.repo_root_files
+    def create_synthetic_hierarchy(self, commits):
+        """
+        Creates the hierarchy for a large number of synthetic commits.
+        The versions.csv content is the same for all commits, so it's written
+        once in the repo root and linked from every commit dir
+        :param commits: A list of dicts with the commits info
+        :return: None
+        """
+        shared_versions_csv = os.path.join(self.repo_root_files,
+                                           "versions.csv")
+        with open(shared_versions_csv, "w") as versions_file:
+            versions_file.write(generate_versions_csv())
+
+        for commit in commits:
+            abs_commit_dir, subst_dict = self.prepare_commit_dir(commit)
+            self.create_additional_files(
+                commit, abs_commit_dir, subst_dict,
+                shared_versions_csv=shared_versions_csv)
 
     def staged_promotion(self, commit):
         """
@@ -265,7 +400,8 @@ class StagingRepo(object):
             raise
 
     @staticmethod
-    def create_additional_files(commit, commit_dir, subst_dict):
+    def create_additional_files(commit, commit_dir, subst_dict,
+                                shared_versions_csv=None):
         """
         The commit hierarchy is not complete without three additional files:
         - the commits.yaml with commit information
@@ -274,16 +410,27 @@ class StagingRepo(object):
         :param commit: The commit to create files for
         :param commit_dir: The dir in which to create the files
         :param subst_dict: The substitution dicionary to use with the templates
+        :param shared_versions_csv: The path of a versions.csv to link instead
+        of writing a new one
         :return: None
         """
         template = Template(repo_template)
         repo_file = template.substitute(subst_dict)
-        commit_yaml = yaml.safe_dump({'commits': [commit]})
+        # The C dumper is much faster when dumping thousands of files
+        dumper = getattr(yaml, 'CSafeDumper', yaml.SafeDumper)
+        commit_yaml = yaml.dump({'commits': [commit]}, Dumper=dumper)
         additional_files = {
-            'versions.csv': generate_versions_csv(),
             'commit.yaml': commit_yaml,
             'delorean.repo': repo_file,
         }
+        if shared_versions_csv is None:
+            additional_files['versions.csv'] = generate_versions_csv()
+        else:
+            try:
+                os.symlink(shared_versions_csv,
+                           os.path.join(commit_dir, "versions.csv"))
+            except OSError:
+                pass
         for filename, content in additional_files.items():
             file_path = os.path.join(commit_dir, filename)
             with open(file_path, "w") as file:
@@ -333,6 +480,7 @@ class DlrnStagingServer(object):
         self.server_root = self.config.dlrn['server']['root']
         self.db_file = self.config.dlrn['server']['db_file']
         self.db_data = self.config.dlrn['server']['db_data_file']
+        self.synthetic_commits = self.config['synthetic_commits']
 
         self.components_mode = self.config.components_mode
         self.commits = self.config.dlrn['commits']
@@ -397,6 +545,30 @@ class DlrnStagingServer(object):
             utils.loadYAML(session, self.db_data)
         except sql_a_exc.IntegrityError:
             self.log.info("DB is not empty, not injecting data")
+            return
+
+        if self.synthetic_commits:
+            self.seed_synthetic_data(session)
+
+    def seed_synthetic_data(self, session):
+        """
+        Generates a large synthetic history and injects it in the database
+        with bulk operations, then creates the relative repo hierarchy
+        :param session: The db session to use
+        :return: None
+        """
+        components = None
+        if self.components_mode:
+            components = self.config.dlrn['components']
+        data = generate_synthetic_db_data(self.synthetic_commits,
+                                          components=components)
+        self.log.info("Injecting %s synthetic commits to %s",
+                      self.synthetic_commits, self.db_file)
+        session.bulk_insert_mappings(dlrn_db.Commit, data['commits'])
+        session.bulk_insert_mappings(dlrn_db.CIVote, data['civotes'])
+        session.bulk_insert_mappings(dlrn_db.Promotion, data['promotions'])
+        session.commit()
+        self.staging_repo.create_synthetic_hierarchy(data['commits'])
 
     @conditional_run
     def run_server(self):
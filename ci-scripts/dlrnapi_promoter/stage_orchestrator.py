@@ -1,6 +1,7 @@
 import logging
 import os
 import shutil
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
 import yaml
 from stage_containers import StagingContainers
@@ -45,7 +46,17 @@ class StageOrchestrator(object):
             "containers": StagingContainers,
         }
 
+        # The staging parts each scene depends on. Parts that do not depend
+        # on each other are brought up concurrently
+        self.scenes_dependencies = {
+            'dlrn': [],
+            'registries': [],
+            'containers': ['dlrn', 'registries'],
+            'overcloud_images': ['dlrn'],
+        }
+
         self.scenes = self.config['scenes']
+        self.workers = self.config['stage_workers']
 
     @property
     def stage_info(self):
@@ -72,7 +83,8 @@ class StageOrchestrator(object):
     def setup(self):
         """
         Orchestrates the setting up of the environment
-        Creates the stage root dir and calls the various scenes setup
+        Creates the stage root dir and calls the various scenes setup,
+        independent scenes are set up concurrently
         Then create the stag info file
         :return: None
         """
@@ -90,25 +102,26 @@ class StageOrchestrator(object):
             os.makedirs(log_dir)
 
         # If the stage is in in component mode, it's mandatory dlrn is run
+        parts = []
         if 'dlrn' in self.scenes or self.config['components_mode']:
-            self.scenes_controllers['dlrn'].setup()
+            parts.append('dlrn')
+        if 'registries' in self.scenes or 'containers' in self.scenes:
+            parts.append('registries')
+        if 'containers' in self.scenes:
+            parts.append('containers')
+        if 'overcloud_images' in self.scenes:
+            parts.append('overcloud_images')
+
+        results = self.run_parts(parts)
 
         # We need dlrn stage info even if it's not fully run as they are
         # reference for every other operation
         stage_info_content = {
             'dlrn': self.scenes_controllers['dlrn'].stage_info
         }
-
-        if 'registries' in self.scenes or 'containers' in self.scenes:
-            controller = self.scenes_controllers['registries'](self.config)
-            stage_info_content['registries'] = controller.setup()
-        if 'containers' in self.scenes:
-            controller = self.scenes_controllers['containers'](self.config)
-            stage_info_content['containers'] = controller.setup()
-        if 'overcloud_images' in self.scenes:
-            controller = \
-                self.scenes_controllers['overcloud_images'](self.config)
-            stage_info_content['overcloud_images'] = controller.setup()
+        for part in parts:
+            if part != 'dlrn':
+                stage_info_content[part] = results[part]
 
         # Create the stage info file with all the information
         # Gathered from all the stage info returned by the controller setup
@@ -118,6 +131,54 @@ class StageOrchestrator(object):
         with open(self.stage_info_path, "w") as stage_info_file:
             stage_info_file.write(stage_info_yaml)
 
+    def get_controller(self, part):
+        """
+        Returns the controller for a staging part. The dlrn controller is
+        shared, the others are instantiated on request
+        :param part: The name of the staging part
+        :return: The controller instance
+        """
+        if part == 'dlrn':
+            return self.scenes_controllers['dlrn']
+        return self.scenes_controllers[part](self.config)
+
+    def run_parts(self, parts):
+        """
+        Runs the setup of the staging parts, following the dependency graph
+        in scenes_dependencies. A part is started as soon as all the parts it
+        depends on are completed, so independent parts run concurrently.
+        Controllers are instantiated in the calling thread, as their inits
+        access the configuration, only the setup methods run in the pool.
+        :param parts: The list of parts to set up
+        :return: A dict with the results of the setup methods, by part name
+        """
+        pending = {
+            part: [dep for dep in self.scenes_dependencies[part]
+                   if dep in parts]
+            for part in parts
+        }
+        results = {}
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            while pending or running:
+                for part, deps in list(pending.items()):
+                    if all(dep in results for dep in deps):
+                        self.log.info("Setting up stage part %s", part)
+                        controller = self.get_controller(part)
+                        running[executor.submit(controller.setup)] = part
+                        del pending[part]
+                if not running:
+                    raise Exception("Unresolvable dependencies for stage "
+                                    "parts {}".format(", ".join(pending)))
+                done, __ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    part = running.pop(future)
+                    # This raises any exception raised by the setup
+                    results[part] = future.result()
+                    self.log.info("Stage part %s set up", part)
+
+        return results
+
     def teardown(self):
         """
         This orchestrates the stage cleanup calling the various teardown methods
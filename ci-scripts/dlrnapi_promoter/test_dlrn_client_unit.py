@@ -12,6 +12,7 @@ from common import PromotionError, setup_logging, str_api_object
 from dlrn_client import DlrnClient, DlrnClientConfig, HashChangedError
 from dlrn_hash import DlrnAggregateHash, DlrnCommitDistroExtendedHash, DlrnHash
 from dlrnapi_client.rest import ApiException
+from promotion_history import PromotionHistory
 from test_unit_fixtures import hashes_test_cases
 
 try:
@@ -750,6 +751,23 @@ class TestPromoteHash(DlrnSetup):
         self.assertFalse(mock_log_error.called)
         self.assertFalse(api_promote_batch_mock.called)
 
+    @patch('dlrnapi_client.DefaultApi.api_promote_post')
+    def test_promote_hash_records_history(self, api_promote_mock):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        self.client.history = \
+            PromotionHistory(os.path.join(tmp_dir, 'history.sqlite'))
+        promoted_info = copy.deepcopy(self.dlrn_hash_commitdistro1)
+        promoted_info.timestamp = 1000
+        api_promote_mock.return_value = promoted_info
+        self.client.promote_hash("", self.dlrn_hash_commitdistro1,
+                                 'current-tripleo')
+        latest = self.client.history.latest('current-tripleo')
+        self.assertEqual(latest['commit_hash'],
+                         self.dlrn_hash_commitdistro1.commit_hash)
+        # The timestamp stored by DLRN, not the local time
+        self.assertEqual(latest['timestamp'], 1000)
+
     @patch('logging.Logger.error')
     @patch('logging.Logger.info')
     @patch('dlrnapi_client.DefaultApi.api_promote_post')
@@ -0,0 +1,199 @@
+import gzip
+import os
+import shutil
+import socketserver
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+try:
+    # Python3 imports
+    from unittest import mock
+    from urllib import request as url
+except ImportError:
+    # Python2 imports
+    import mock
+    import urllib2 as url
+
+from http_session import DiskCache, DownloadError, HttpSession
+
+FILES = {
+    '/versions.csv': b"Project,Source Sha\nproject1,abc\n" * 1000,
+    '/commit.yaml': b"commits:\n- commit_hash: a\n",
+    '/excludes.yaml': b"exclude_containers:\n  master:\n    centos9: []\n",
+}
+# Files served with Last-Modified instead of ETag
+LAST_MODIFIED = {
+    '/excludes.yaml': "Mon, 19 Oct 2026 10:00:00 GMT",
+}
+
+
+class FileHandler(BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"
+    etag = '"v1"'
+
+    def do_GET(self):
+        self.server.connections.add(self.client_address)
+        self.server.requests.append(dict(self.headers))
+        if self.path not in FILES:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        last_modified = LAST_MODIFIED.get(self.path)
+        if last_modified is not None:
+            not_modified = \
+                self.headers.get('If-Modified-Since') == last_modified
+        else:
+            not_modified = self.headers.get('If-None-Match') == self.etag
+        if not_modified:
+            self.send_response(304)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = FILES[self.path]
+        self.send_response(200)
+        if last_modified is not None:
+            self.send_header("Last-Modified", last_modified)
+        else:
+            self.send_header("ETag", self.etag)
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            body = gzip.compress(body)
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, log_format, *args):
+        pass
+
+
+class FileServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), FileHandler)
+        self.connections = set()
+        self.requests = []
+
+
+class TestHttpSession(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FileServer()
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.base_url = "http://127.0.0.1:{}".format(
+            self.server.server_address[1])
+        self.session = HttpSession()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_get_reuses_connection(self):
+        for path in ['/versions.csv', '/commit.yaml', '/versions.csv']:
+            self.session.get(self.base_url + path)
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(len(self.server.connections), 1)
+        self.assertIn('gzip', self.server.requests[0]['Accept-Encoding'])
+
+    @mock.patch('logging.Logger.debug')
+    def test_get_revalidates(self, mock_log_debug):
+        first = self.session.get(self.base_url + '/versions.csv')
+        second = self.session.get(self.base_url + '/versions.csv')
+        self.assertEqual(first, FILES['/versions.csv'])
+        self.assertEqual(second, first)
+        self.assertNotIn('If-None-Match', self.server.requests[0])
+        self.assertEqual(self.server.requests[1]['If-None-Match'], '"v1"')
+        self.assertTrue(mock_log_debug.called)
+
+    def test_get_not_found(self):
+        with self.assertRaises(url.URLError) as context:
+            self.session.get(self.base_url + '/missing')
+        self.assertIsInstance(context.exception, DownloadError)
+        self.assertEqual(context.exception.status_code, 404)
+
+    def test_open_text_streams_and_releases_connection(self):
+        stream = self.session.open_text(self.base_url + '/versions.csv')
+        with stream:
+            lines = stream.readlines()
+        self.assertEqual(len(lines), 2000)
+        self.session.get(self.base_url + '/commit.yaml')
+        self.assertEqual(len(self.server.connections), 1)
+
+    def test_file_urls(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp_dir, 'commit.yaml')
+            with open(path, 'wb') as local_file:
+                local_file.write(FILES['/commit.yaml'])
+            file_url = "file://" + path
+            self.assertEqual(self.session.get(file_url),
+                             FILES['/commit.yaml'])
+            with self.session.open_text(file_url) as stream:
+                self.assertEqual(stream.read(),
+                                 FILES['/commit.yaml'].decode())
+            with self.assertRaises(url.URLError):
+                self.session.get("file:///not/existing")
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    @mock.patch('logging.Logger.debug')
+    def test_get_revalidates_from_cache_dir(self, mock_log_debug):
+        cache_dir = tempfile.mkdtemp()
+        try:
+            file_url = self.base_url + '/excludes.yaml'
+            first = self.session.get(file_url, cache_dir=cache_dir)
+            # A new process finds the validators in the cache dir
+            second = HttpSession().get(file_url, cache_dir=cache_dir)
+            self.assertEqual(len(os.listdir(cache_dir)), 1)
+        finally:
+            shutil.rmtree(cache_dir)
+        self.assertEqual(first, FILES['/excludes.yaml'])
+        self.assertEqual(second, first)
+        self.assertNotIn('If-Modified-Since', self.server.requests[0])
+        self.assertEqual(self.server.requests[1]['If-Modified-Since'],
+                         LAST_MODIFIED['/excludes.yaml'])
+        mock_log_debug.assert_any_call(
+            "Download of %s: not modified, reusing the previous content",
+            file_url)
+
+
+class TestDiskCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.cache = DiskCache(os.path.join(self.cache_dir, 'http'))
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_put_get(self):
+        validators = {'If-None-Match': '"v1"'}
+        self.assertIsNone(self.cache.get("http://host/a.yaml"))
+        self.cache.put("http://host/a.yaml", validators, b"a: 1\n\nb: 2")
+        self.assertEqual(self.cache.get("http://host/a.yaml"),
+                         (validators, b"a: 1\n\nb: 2"))
+        self.cache.put("http://host/a.yaml", validators, b"a: 2")
+        self.assertEqual(self.cache.get("http://host/a.yaml")[1], b"a: 2")
+        self.assertEqual(os.listdir(self.cache.cache_dir),
+                         [os.path.basename(
+                             self.cache.get_path("http://host/a.yaml"))])
+
+    def test_get_ignores_broken_entries(self):
+        self.cache.put("http://host/a.yaml", {}, b"a: 1")
+        with open(self.cache.get_path("http://host/a.yaml"), 'wb') as entry:
+            entry.write(b"not json\na: 1")
+        self.assertIsNone(self.cache.get("http://host/a.yaml"))
+
+    @mock.patch('logging.Logger.warning')
+    def test_put_errors_are_ignored(self, mock_log_warning):
+        with open(self.cache.cache_dir, 'w'):
+            pass
+        self.cache.put("http://host/a.yaml", {}, b"a: 1")
+        self.assertIsNone(self.cache.get("http://host/a.yaml"))
+        self.assertTrue(mock_log_warning.called)
@@ -1,3 +1,7 @@
+import threading
+from collections import OrderedDict
+
+import yaml
 from common import PromotionError
 from dlrn_client import HashChangedError
 
@@ -457,6 +461,16 @@ class TestPromoteAll(ConfigSetup):
         ])
         self.assertEqual(promoted_pairs, [])
 
+    @patch('promotion_report.PromotionReport.write')
+    @patch('dlrn_client.DlrnClient.fetch_current_named_hashes')
+    @patch('logic.Promoter.promote_label_to_label')
+    def test_promote_all_writes_report(self, mock_promote_label_to_label,
+                                       mock_fetch_named_hashes,
+                                       mock_report_write):
+        mock_promote_label_to_label.return_value = ()
+        self.promoter.promote_all()
+        mock_report_write.assert_called_once_with(self.config.report_file)
+
 
 class TestSelectCandidates(ConfigSetup):
 
@@ -607,3 +621,361 @@ class TestSelectCandidates(ConfigSetup):
         ])
 
         assert (obtained_hashes == expected_hashes)
+
+
+class TestSharedFetch(ConfigSetup):
+
+    def setUp(self):
+        super(TestSharedFetch, self).setUp()
+        self.config['promotions'] = {
+            'target-1': {
+                'candidate_label': 'candidate',
+                'criteria': {'job-1'},
+            },
+            'target-2': {
+                'candidate_label': 'candidate',
+                'criteria': {'job-1', 'job-2'},
+            },
+            'target-3': {
+                'candidate_label': 'target-1',
+                'criteria': {'job-1'},
+            },
+        }
+        self.candidate = DlrnCommitDistroExtendedHash(commit_hash='a',
+                                                      distro_hash='b')
+
+    @patch('logging.Logger.warning')
+    @patch('logging.Logger.info')
+    @patch('logic.Promoter.promote_label_to_label')
+    @patch('dlrn_client.DlrnClient.fetch_current_named_hashes')
+    def test_promote_all_keeps_config_order(self, mock_fetch_named_hashes,
+                                            mock_promote_label_to_label,
+                                            mock_log_info, mock_log_warning):
+        self.config['promotions'] = OrderedDict([
+            ('B', {'candidate_label': 'A', 'criteria': {'job-1'}}),
+            ('C', {'candidate_label': 'B', 'criteria': {'job-1'}}),
+            ('D', {'candidate_label': 'A', 'criteria': {'job-1'}}),
+        ])
+        mock_promote_label_to_label.return_value = None
+        self.promoter.promote_all()
+        self.assertEqual(mock_promote_label_to_label.call_args_list, [
+            mock.call('A', 'B'), mock.call('B', 'C'), mock.call('A', 'D'),
+        ])
+
+    @patch('logic.Promoter.promote')
+    @patch('dlrn_client.DlrnClient.fetch_current_named_hashes')
+    @patch('dlrn_client.DlrnClient.fetch_jobs')
+    @patch('dlrn_client.DlrnClient.get_civotes_info')
+    @patch('dlrn_client.DlrnClient.fetch_promotions')
+    def test_promote_all_fetches_once_per_label(self, mock_fetch_promotions,
+                                                mock_civotes,
+                                                mock_fetch_jobs,
+                                                mock_fetch_named_hashes,
+                                                mock_promote):
+        mock_fetch_promotions.side_effect = \
+            lambda label, **kwargs: [self.candidate] \
+            if label == 'candidate' else []
+        mock_fetch_jobs.return_value = ['job-1']
+        mock_promote.side_effect = \
+            lambda candidate_hash, candidate_label, target_label: \
+            (candidate_hash, target_label)
+
+        promoted_pairs = self.promoter.promote_all()
+
+        self.assertEqual(promoted_pairs, [(self.candidate, 'target-1')])
+        # candidate label is fetched once for both its targets, target-1
+        # is fetched again as candidate label after the promotion to it
+        self.assertEqual(mock_fetch_promotions.call_args_list, [
+            mock.call('candidate', count='10'),
+            mock.call('target-1'),
+            mock.call('target-2'),
+            mock.call('target-1', count='10'),
+        ])
+        self.assertEqual(mock_fetch_jobs.call_count, 1)
+        self.assertEqual(mock_civotes.call_count, 1)
+        self.assertIsNone(self.promoter.fetch_cache)
+
+    @patch('logic.Promoter.promote_label_to_label')
+    @patch('dlrn_client.DlrnClient.fetch_current_named_hashes')
+    def test_promote_all_drops_cache_on_error(self, mock_fetch_named_hashes,
+                                              mock_promote_label_to_label):
+        mock_promote_label_to_label.side_effect = ValueError("broken")
+
+        with self.assertRaises(ValueError):
+            self.promoter.promote_all()
+        self.assertIsNone(self.promoter.fetch_cache)
+
+    @patch('dlrn_client.DlrnClient.fetch_promotions')
+    def test_fetch_promotions_not_cached_outside_round(self,
+                                                       mock_fetch_promotions):
+        self.promoter.fetch_promotions('candidate')
+        self.promoter.fetch_promotions('candidate')
+        self.assertEqual(mock_fetch_promotions.call_count, 2)
+
+
+class TestPromoteBatch(ConfigSetup):
+
+    def setUp(self):
+        super(TestPromoteBatch, self).setUp()
+        self.promotions = []
+        for index, labels in enumerate([('a', 'b'), ('c', 'd'), ('b', 'e'),
+                                        ('x', 'y')]):
+            self.promotions.append({
+                'candidate_hash': DlrnCommitDistroExtendedHash(
+                    commit_hash=str(index), distro_hash=str(index)),
+                'candidate_label': labels[0],
+                'target_label': labels[1],
+            })
+
+    def test_plan_batch_groups_by_shared_labels(self):
+        groups = self.promoter.plan_batch(self.promotions)
+        self.assertEqual(groups, [
+            [self.promotions[0], self.promotions[2]],
+            [self.promotions[1]],
+            [self.promotions[3]],
+        ])
+
+    @patch('logic.Promoter.promote')
+    def test_promote_batch_success(self, mock_promote):
+        mock_promote.side_effect = \
+            lambda candidate_hash, candidate_label, target_label, clients: \
+            (candidate_hash, target_label)
+        promoted_pairs = self.promoter.promote_batch(self.promotions,
+                                                     workers=2)
+        self.assertEqual(len(promoted_pairs), 4)
+        # each promotion gets its own copy of the allowed clients
+        clients = [call[0][3] for call in mock_promote.call_args_list]
+        self.assertEqual(clients[0], self.config.allowed_clients)
+        self.assertIsNot(clients[0], clients[1])
+
+    @patch('logging.Logger.error')
+    @patch('logic.Promoter.promote')
+    def test_promote_batch_failure_stops_group(self, mock_promote,
+                                               mock_log_error):
+        def promote(candidate_hash, candidate_label, target_label, clients):
+            if target_label == 'b':
+                raise PromotionError
+            return candidate_hash, target_label
+
+        mock_promote.side_effect = promote
+        with self.assertRaises(PromotionError):
+            self.promoter.promote_batch(self.promotions)
+        promoted_targets = sorted(call[0][2]
+                                  for call in mock_promote.call_args_list)
+        # b -> e depends on the failed promotion and is skipped
+        self.assertEqual(promoted_targets, ['b', 'd', 'y'])
+        self.assertTrue(mock_log_error.called)
+
+    @patch('logging.Logger.debug')
+    @patch('logging.Logger.info')
+    @patch('registries_client.subprocess.check_output')
+    @patch('registries_client.RegistriesClient.get_containers')
+    @patch('dlrn_client.DlrnClient.check_named_hashes_unchanged')
+    def test_promote_batch_groups_concurrently(self, mock_check_named_hashes,
+                                               mock_get_containers,
+                                               mock_check_output,
+                                               mock_log_info,
+                                               mock_log_debug):
+        mock_get_containers.return_value = (['container'], [])
+        # Both playbooks have to run at the same time to pass the barrier
+        barrier = threading.Barrier(2, timeout=10)
+        playbooks_vars = []
+
+        def check_output(cmd, **kwargs):
+            extra_vars_path = cmd[cmd.index('-e') + 1].lstrip('@')
+            with open(extra_vars_path) as extra_vars_file:
+                playbooks_vars.append(yaml.safe_load(extra_vars_file))
+            barrier.wait()
+            return b""
+
+        mock_check_output.side_effect = check_output
+        promotions = [self.promotions[1], self.promotions[3]]
+        for promotion in promotions:
+            promotion['allowed_clients'] = ['registries_client']
+
+        promoted_pairs = self.promoter.promote_batch(promotions, workers=2)
+
+        self.assertEqual(len(promoted_pairs), 2)
+        obtained = sorted((extra_vars['full_hash'],
+                           extra_vars['candidate_label'],
+                           extra_vars['named_label'])
+                          for extra_vars in playbooks_vars)
+        self.assertEqual(obtained, [
+            (self.promotions[1]['candidate_hash'].full_hash, 'c', 'd'),
+            (self.promotions[3]['candidate_hash'].full_hash, 'x', 'y'),
+        ])
+        self.assertNotIn('full_hash',
+                         self.promoter.registries_client.extra_vars)
+
+
+class TestPreflight(ConfigSetup):
+
+    def setUp(self):
+        super(TestPreflight, self).setUp()
+        self.config['preflight_candidates'] = 2
+        self.candidates = [
+            DlrnCommitDistroExtendedHash(commit_hash=str(index),
+                                         distro_hash=str(index))
+            for index in range(3)]
+
+    def test_preflight_disabled_by_default(self):
+        self.config['preflight_candidates'] = 0
+        self.promoter.start_preflight(self.candidates, 'candidate')
+        self.assertEqual(self.promoter.preflight, [])
+        self.assertEqual(self.promoter.preflight_executors, {})
+
+    @patch('logging.Logger.debug')
+    @patch('registries_client.RegistriesClient.prepare')
+    @patch('qcow_client.QcowClient.prepare')
+    def test_preflight_newest_candidates(self, mock_qcow_prepare,
+                                         mock_registries_prepare,
+                                         mock_log_debug):
+        self.promoter.start_preflight(self.candidates, 'candidate')
+        self.promoter.wait_preflight(self.candidates[0])
+        mock_qcow_prepare.assert_any_call(self.candidates[0],
+                                          candidate_label='candidate')
+        for mock_prepare in [mock_qcow_prepare, mock_registries_prepare]:
+            prepared = [call[0][0] for call in mock_prepare.call_args_list]
+            self.assertNotIn(self.candidates[2], prepared)
+        self.assertEqual(self.promoter.preflight, [])
+
+    @patch('logging.Logger.debug')
+    @patch('registries_client.RegistriesClient.prepare')
+    @patch('qcow_client.QcowClient.prepare')
+    @patch('logic.Promoter.promote_label_to_label')
+    @patch('dlrn_client.DlrnClient.fetch_current_named_hashes')
+    def test_promote_all_shuts_down_preflight(self, mock_fetch_named_hashes,
+                                              mock_promote_label_to_label,
+                                              mock_qcow_prepare,
+                                              mock_registries_prepare,
+                                              mock_log_debug):
+        def promote_label_to_label(candidate_label, target_label):
+            self.promoter.start_preflight(self.candidates, candidate_label)
+            raise ValueError("broken")
+
+        mock_promote_label_to_label.side_effect = promote_label_to_label
+        self.promoter.start_preflight(self.candidates, 'candidate')
+        executors = list(self.promoter.preflight_executors.values())
+        self.assertTrue(executors)
+
+        with self.assertRaises(ValueError):
+            self.promoter.promote_all()
+        self.assertEqual(self.promoter.preflight, [])
+        self.assertEqual(self.promoter.preflight_executors, {})
+        for executor in executors:
+            with self.assertRaises(RuntimeError):
+                executor.submit(print)
+
+    @patch('logging.Logger.debug')
+    @patch('registries_client.RegistriesClient.prepare')
+    @patch('qcow_client.QcowClient.prepare')
+    def test_wait_preflight_cancels_other_candidates(self, mock_qcow_prepare,
+                                                     mock_registries_prepare,
+                                                     mock_log_debug):
+        release = threading.Event()
+        mock_qcow_prepare.side_effect = lambda *args, **kwargs: release.wait()
+        self.promoter.start_preflight(self.candidates, 'candidate')
+        timer = threading.Timer(0.2, release.set)
+        timer.start()
+        self.promoter.wait_preflight(self.candidates[0])
+        timer.join()
+        # The qcow client was still busy with the first candidate, so the
+        # preparation of the second one was dropped before starting
+        mock_qcow_prepare.assert_called_once_with(self.candidates[0],
+                                                  candidate_label='candidate')
+
+    @patch('logging.Logger.debug')
+    @patch('logging.Logger.info')
+    @patch('logging.Logger.warning')
+    @patch('registries_client.RegistriesClient.discard')
+    @patch('registries_client.RegistriesClient.prepare')
+    @patch('qcow_client.QcowClient.discard')
+    @patch('qcow_client.QcowClient.prepare')
+    @patch('logic.Promoter.select_candidates')
+    @patch('logic.Promoter.fetch_votes')
+    def test_preflight_discarded_when_criteria_not_met(
+            self, mock_fetch_votes, mock_select_candidates, mock_qcow_prepare,
+            mock_qcow_discard, mock_registries_prepare,
+            mock_registries_discard, mock_log_warning, mock_log_info,
+            mock_log_debug):
+        mock_select_candidates.return_value = self.candidates[:1]
+        mock_fetch_votes.return_value = ("http://votes", set())
+        mock_qcow_prepare.side_effect = PromotionError("no images")
+
+        promoted_pair = self.promoter.promote_label_to_label(
+            'tripleo-ci-testing', 'tripleo-ci-staging-promoted')
+
+        self.assertEqual(promoted_pair, ())
+        self.assertEqual(mock_registries_prepare.call_count, 1)
+        self.assertTrue(mock_qcow_discard.called)
+        self.assertTrue(mock_registries_discard.called)
+        mock_log_debug.assert_any_call(
+            "Candidate hash '%s': client %s preflight failed: %s",
+            self.candidates[0], 'qcow_client', mock.ANY)
+
+
+class TestPromoteClients(ConfigSetup):
+
+    def setUp(self):
+        super(TestPromoteClients, self).setUp()
+        self.candidate = DlrnCommitDistroExtendedHash(commit_hash='a',
+                                                      distro_hash='b')
+        self.clients = ['registries_client', 'qcow_client', 'dlrn_client']
+        self.calls = []
+
+    def record(self, client_name):
+        def promote(*args, **kwargs):
+            self.calls.append(client_name)
+        return promote
+
+    @patch('dlrn_client.DlrnClient.check_named_hashes_unchanged')
+    @patch('dlrn_client.DlrnClient.promote')
+    @patch('registries_client.RegistriesClient.promote')
+    @patch('qcow_client.QcowClient.promote')
+    def test_artifact_clients_run_concurrently(self, mock_qcow_client,
+                                               mock_registries_client,
+                                               mock_dlrn_client,
+                                               mock_check_named_hashes):
+        # Each artifact client waits for the other one, so they can only
+        # complete if they run at the same time
+        barrier = threading.Barrier(2, timeout=5)
+        mock_registries_client.side_effect = \
+            lambda *args, **kwargs: barrier.wait()
+        mock_qcow_client.side_effect = lambda *args, **kwargs: barrier.wait()
+        mock_dlrn_client.side_effect = self.record('dlrn_client')
+
+        successful, failed = self.promoter.promote_clients(
+            self.clients, self.candidate, 'candidate', 'target')
+
+        self.assertEqual(successful, self.clients)
+        self.assertEqual(failed, [])
+        self.assertEqual(self.calls, ['dlrn_client'])
+        self.assertEqual(mock_check_named_hashes.call_count, 3)
+
+    @patch('dlrn_client.DlrnClient.check_named_hashes_unchanged')
+    @patch('dlrn_client.DlrnClient.promote')
+    @patch('registries_client.RegistriesClient.promote')
+    @patch('qcow_client.QcowClient.promote')
+    def test_artifact_failure_aborts_dlrn(self, mock_qcow_client,
+                                          mock_registries_client,
+                                          mock_dlrn_client,
+                                          mock_check_named_hashes):
+        error = PromotionError("push failed")
+        mock_registries_client.side_effect = error
+        mock_qcow_client.side_effect = self.record('qcow_client')
+
+        successful, failed = self.promoter.promote_clients(
+            self.clients, self.candidate, 'candidate', 'target')
+
+        self.assertEqual(successful, ['qcow_client'])
+        self.assertEqual(failed, [('registries_client', error)])
+        self.assertFalse(mock_dlrn_client.called)
+
+    @patch('logic.CLIENT_DEPENDENCIES', {'qcow_client': ['dlrn_client'],
+                                         'dlrn_client': ['qcow_client']})
+    @patch('dlrn_client.DlrnClient.check_named_hashes_unchanged')
+    def test_circular_dependencies(self, mock_check_named_hashes):
+        with self.assertRaises(PromotionError):
+            self.promoter.promote_clients(['qcow_client', 'dlrn_client'],
+                                          self.candidate, 'candidate',
+                                          'target')
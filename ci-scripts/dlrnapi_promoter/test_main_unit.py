@@ -1,8 +1,9 @@
 import os
 import shutil
+import tempfile
 import unittest
 
-from common import LockError
+from common import LockError, PromotionError
 from dlrn_hash import DlrnCommitDistroExtendedHash
 
 try:
@@ -14,7 +15,8 @@ except ImportError:
     from mock import patch
     import mock
 
-from dlrnapi_promoter import arg_parser, force_promote
+from dlrnapi_promoter import (arg_parser, force_promote, force_promote_batch,
+                              load_promotion_manifest)
 from dlrnapi_promoter import main as promoter_main
 from dlrnapi_promoter import promote_all
 from logic import Promoter
@@ -166,3 +168,89 @@ class TestForcePromote(unittest.TestCase):
             mock.call(mock.ANY, candidate_hash, 'tripleo-ci-staging',
                       'current-tripleo')
         ])
+
+
+class TestForcePromoteBatch(unittest.TestCase):
+    def setUp(self):
+        log_d = os.path.expanduser(log_dir)
+        if not os.path.isdir(log_d):
+            os.makedirs(log_d)
+        fd, self.manifest = tempfile.mkstemp(suffix='.yaml')
+        os.close(fd)
+
+    def tearDown(self):
+        os.unlink(self.manifest)
+        try:
+            shutil.rmtree(os.path.expanduser(log_dir))
+        except Exception:
+            pass
+
+    def write_manifest(self, content):
+        with open(self.manifest, 'w') as manifest:
+            manifest.write(content)
+
+    def test_arg_parser_force_promote_batch(self):
+        cmd_line = ("--release-config CentOS-8/master.yaml "
+                    "force-promote-batch --workers 4 manifest.yaml")
+        args = arg_parser(cmd_line)
+        self.assertEqual(args.workers, 4)
+        self.assertEqual(args.manifest, 'manifest.yaml')
+        self.assertEqual(args.handler, force_promote_batch)
+
+    def test_load_promotion_manifest(self):
+        self.write_manifest(
+            "promotions:\n"
+            "  - commit_hash: a\n"
+            "    distro_hash: b\n"
+            "    candidate_label: tripleo-ci-staging\n"
+            "    target_label: current-tripleo\n"
+            "    allowed_clients: registries_client,dlrn_client\n"
+        )
+        promotions = load_promotion_manifest(self.manifest)
+        self.assertEqual(promotions, [{
+            'candidate_hash': DlrnCommitDistroExtendedHash(commit_hash='a',
+                                                           distro_hash='b'),
+            'candidate_label': 'tripleo-ci-staging',
+            'target_label': 'current-tripleo',
+            'allowed_clients': ['registries_client', 'dlrn_client'],
+        }])
+
+    def test_load_promotion_manifest_reports_all_errors(self):
+        self.write_manifest(
+            '{"promotions": ['
+            '{"commit_hash": "a", "candidate_label": "l1",'
+            ' "target_label": "l2"},'
+            '{"commit_hash": "a", "distro_hash": "b",'
+            ' "candidate_label": "l1", "target_label": "l2",'
+            ' "allowed_clients": ["ftp_client"]}'
+            ']}'
+        )
+        with self.assertRaises(PromotionError) as context:
+            load_promotion_manifest(self.manifest)
+        self.assertIn("entry 0: missing distro_hash", str(context.exception))
+        self.assertIn("entry 1: unknown clients ftp_client",
+                      str(context.exception))
+
+    def test_load_promotion_manifest_empty(self):
+        self.write_manifest("promotions: []\n")
+        with self.assertRaises(PromotionError):
+            load_promotion_manifest(self.manifest)
+
+    @mock.patch.object(Promoter, '__init__', autospec=True, return_value=None)
+    @mock.patch.object(Promoter, 'promote_batch', autospec=True)
+    def test_force_promote_batch_success(self, promote_batch_mock,
+                                         init_mock):
+        self.write_manifest(
+            "promotions:\n"
+            "  - commit_hash: a\n"
+            "    distro_hash: b\n"
+            "    candidate_label: tripleo-ci-staging\n"
+            "    target_label: current-tripleo\n"
+        )
+        cmd_line = ("--release-config CentOS-8/master.yaml "
+                    "force-promote-batch --workers 2 {}".format(self.manifest))
+        promoter_main(cmd_line=cmd_line)
+
+        self.assertEqual(init_mock.call_count, 1)
+        promote_batch_mock.assert_called_once_with(mock.ANY, mock.ANY,
+                                                   workers=2)
@@ -0,0 +1,180 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+try:
+    # Python3 imports
+    from unittest import mock
+except ImportError:
+    # Python2 imports
+    import mock
+
+from http_session import get_session
+from manifest_planner import ManifestPlan, ManifestPlanner, execute_plan, main
+
+
+def head_response(status_code, headers=None):
+    response = mock.Mock()
+    response.status_code = status_code
+    response.headers = headers or {}
+    return response
+
+
+def patch_logging(test_case):
+    """
+    Replaces the logger methods with mocks for the duration of a test
+    :param test_case: The TestCase to patch
+    :return: A dict with the level names as keys and the mocks as values
+    """
+    mocks = {}
+    for level in ['debug', 'info', 'warning', 'error']:
+        patcher = mock.patch('logging.Logger.{}'.format(level))
+        mocks[level] = patcher.start()
+        test_case.addCleanup(patcher.stop)
+    return mocks
+
+
+class TestManifestPlan(unittest.TestCase):
+
+    def setUp(self):
+        self.plan = ManifestPlan.from_lists('abc_def', ['c1', 'c2'],
+                                            {'ppc64le': ['c2']})
+
+    def test_from_lists(self):
+        self.assertEqual(self.plan.manifests,
+                         {'c1': ['x86_64'], 'c2': ['x86_64', 'ppc64le']})
+        self.assertEqual(self.plan.containers_with('ppc64le'), ['c2'])
+
+    def test_add_without_images_is_missing(self):
+        self.plan.add('c3', [])
+        self.assertNotIn('c3', self.plan.manifests)
+        self.assertEqual(self.plan.missing, ['c3'])
+
+    def test_commands_single_create(self):
+        commands = self.plan.commands('reg/ns', 'c2', insecure=True)
+        self.assertEqual(commands, [
+            ['docker', 'manifest', 'create', '--amend', '--insecure',
+             'reg/ns/c2:abc_def_manifest', 'reg/ns/c2:abc_def_x86_64',
+             'reg/ns/c2:abc_def_ppc64le'],
+            ['docker', 'manifest', 'annotate', '--arch', 'amd64',
+             'reg/ns/c2:abc_def_manifest', 'reg/ns/c2:abc_def_x86_64'],
+            ['docker', 'manifest', 'annotate', '--arch', 'ppc64le',
+             'reg/ns/c2:abc_def_manifest', 'reg/ns/c2:abc_def_ppc64le'],
+            ['docker', 'manifest', 'push', '-p', '--insecure',
+             'reg/ns/c2:abc_def_manifest'],
+        ])
+        self.assertEqual(len(self.plan.commands('reg/ns', 'c1')), 3)
+
+
+class TestManifestPlanner(unittest.TestCase):
+
+    def setUp(self):
+        self.session = mock.Mock()
+        self.planner = ManifestPlanner("https://registry/", "ns",
+                                       session=self.session)
+        self.log_mocks = patch_logging(self)
+
+    def test_default_session_is_shared(self):
+        planner = ManifestPlanner("https://registry/", "ns")
+        self.assertIs(planner.session, get_session().session)
+
+    def test_plan_checks_every_arch(self):
+        found = {'c1:h_x86_64', 'c1:h_ppc64le', 'c2:h_x86_64'}
+
+        def head(url, **kwargs):
+            name_tag = url.split('/ns/')[1].replace('/manifests/', ':')
+            return head_response(200 if name_tag in found else 404)
+
+        self.session.head.side_effect = head
+        plan = self.planner.plan(['c1', 'c2', 'c3', 'c1'], 'h')
+        self.assertEqual(self.session.head.call_count, 6)
+        self.session.head.assert_any_call(
+            "https://registry/v2/ns/c2/manifests/h_ppc64le",
+            headers=mock.ANY, timeout=30)
+        self.assertEqual(plan.manifests,
+                         {'c1': ['x86_64', 'ppc64le'], 'c2': ['x86_64']})
+        self.assertEqual(plan.missing, ['c3'])
+
+    def test_plan_checks_given_arch(self):
+        self.session.head.side_effect = lambda url, **kwargs: head_response(
+            404 if '/c2/' in url else 200)
+        plan = self.planner.plan(['c1', 'c2'], 'h', arch_tags=['ppc64le'])
+        self.assertEqual(self.session.head.call_count, 2)
+        self.assertEqual(plan.containers_with('ppc64le'), ['c1'])
+        self.assertEqual(plan.missing, ['c2'])
+
+    def test_plan_undecided_lookup_keeps_image(self):
+        self.session.head.return_value = head_response(500)
+        plan = self.planner.plan(['c1'], 'h')
+        self.assertEqual(plan.manifests, {'c1': ['x86_64', 'ppc64le']})
+        self.assertTrue(self.log_mocks['warning'].called)
+
+    def test_lookup_with_bearer_token(self):
+        challenge = ('Bearer realm="https://auth/token",service="registry",'
+                     'scope="repository:ns/c1:pull"')
+        self.session.head.side_effect = [
+            head_response(401, {'WWW-Authenticate': challenge}),
+            head_response(200),
+            head_response(401, {'WWW-Authenticate': challenge}),
+            head_response(404),
+        ]
+        self.session.get.return_value.ok = True
+        self.session.get.return_value.json.return_value = {'token': 'tok'}
+        self.assertTrue(self.planner.lookup('c1', 'h_x86_64'))
+        self.assertFalse(self.planner.lookup('c1', 'h_ppc64le'))
+        self.session.get.assert_called_once_with(
+            "https://auth/token", params={'service': 'registry',
+                                          'scope': 'repository:ns/c1:pull'},
+            timeout=30)
+        self.assertEqual(
+            self.session.head.call_args[1]['headers']['Authorization'],
+            "Bearer tok")
+
+
+class TestExecutePlan(unittest.TestCase):
+
+    def setUp(self):
+        self.plan = ManifestPlan.from_lists('h', ['c1', 'c2'],
+                                            {'ppc64le': ['c2']})
+        self.log_mocks = patch_logging(self)
+
+    def test_execute_all(self):
+        runner = mock.Mock()
+        failures = execute_plan(self.plan, 'reg/ns', runner=runner)
+        self.assertEqual(failures, {})
+        self.assertEqual(runner.call_count, 7)
+
+    def test_execute_failure_stops_container(self):
+        def runner(command, **kwargs):
+            if 'reg/ns/c1:h_manifest' in command:
+                raise subprocess.CalledProcessError(1, command, b"denied")
+
+        failures = execute_plan(self.plan, 'reg/ns', runner=runner)
+        self.assertEqual(list(failures), ['c1'])
+        self.log_mocks['error'].assert_called_once_with(
+            "Manifest push of %s failed: %s %s", 'c1', mock.ANY, "denied")
+
+    @mock.patch('manifest_planner.execute_plan')
+    def test_main_reads_lists(self, mock_execute):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            containers_file = os.path.join(tmp_dir, 'containers')
+            ppc_file = os.path.join(tmp_dir, 'ppc')
+            with open(containers_file, 'w') as list_file:
+                list_file.write("c1\nc2\n\n")
+            with open(ppc_file, 'w') as list_file:
+                list_file.write("c2\n")
+            mock_execute.return_value = {}
+            result = main("--registry reg/ns --full-hash h "
+                          "--containers-file {} --ppc64le-containers-file {} "
+                          "--insecure".format(containers_file, ppc_file))
+        finally:
+            shutil.rmtree(tmp_dir)
+        self.assertEqual(result, 0)
+        plan = mock_execute.call_args[0][0]
+        self.assertEqual(plan.manifests,
+                         {'c1': ['x86_64'], 'c2': ['x86_64', 'ppc64le']})
+        mock_execute.assert_called_once_with(plan, 'reg/ns', max_workers=4,
+                                             insecure=True)
@@ -7,11 +7,14 @@ and the functional tests on the promoter
 Uses standard pytest fixture as a setup/teardown method
 """
 
+import io
 import logging
 import os
+import tempfile
 
 import dlrnapi_client
 import pytest
+import requests
 
 try:
     import urllib2 as url_libc  # pylint: disable=unused-import
@@ -20,19 +23,20 @@ except ImportError:
 
 import yaml
 from dlrn_hash import DlrnAggregateHash, DlrnCommitDistroExtendedHash, DlrnHash
-from promoter_integration_checks import (check_dlrn_promoted_hash,
+from promoter_integration_checks import (LogVerifier,
+                                         check_dlrn_promoted_hash,
                                          compare_tagged_image_hash,
-                                         parse_promotion_logs,
+                                         iter_log_lines, parse_promotion_logs,
                                          query_container_registry_promotion)
 from stage import main as stage_main
 
 try:
     # Python3 imports
-    from unittest.mock import patch
+    from unittest.mock import Mock, patch
     builtin_str = "builtins.open"
 except ImportError:
     # Python2 imports
-    from mock import patch
+    from mock import Mock, patch
     builtin_str = "__builtin__.open"
 
 
@@ -140,16 +144,77 @@ def test_query_container(staged_env):
     :return: None
     """
     stage_info = staged_env
-    with patch.object(url_lib, 'urlopen') as mock_urllib:
+    with patch.object(requests.Session, 'head') as mock_head:
         # positive tests
-        mock_urllib.return_value = True
+        mock_head.return_value = Mock(status_code=200)
         query_container_registry_promotion(stage_info=stage_info)
         # negative tests
-        mock_urllib.side_effect = url_lib.HTTPError(*[None] * 5)
+        mock_head.return_value = Mock(status_code=404)
         with pytest.raises(AssertionError):
             query_container_registry_promotion(stage_info=stage_info)
 
 
+def get_containers_stage_info():
+    candidate_hash = DlrnCommitDistroExtendedHash(commit_hash='a',
+                                                  distro_hash='b')
+    stage_info = {
+        'registries': {
+            'targets': [{'host': 'localhost:6500'},
+                        {'host': 'localhost:6501'}],
+        },
+        'dlrn': {
+            'promotion_target': 'tripleo-ci-staging-promoted',
+            'promotions': {
+                'promotion_candidate': candidate_hash.dump_to_dict(),
+            },
+        },
+        'containers': {
+            'images': [
+                'tripleomaster/base:{}'.format(candidate_hash.full_hash),
+                'tripleomaster/base:{}_ppc64le'.format(
+                    candidate_hash.full_hash),
+            ],
+        },
+    }
+    return stage_info, candidate_hash
+
+
+def test_query_container_report():
+    stage_info, candidate_hash = get_containers_stage_info()
+    with patch.object(requests.Session, 'head') as mock_head:
+        mock_head.return_value = Mock(status_code=200)
+        report = query_container_registry_promotion(stage_info=stage_info)
+    # Every tag of every container is checked on every registry
+    assert mock_head.call_count == 6
+    assert report['tripleomaster/base']['localhost:6501'] == {
+        candidate_hash.full_hash: True,
+        'tripleo-ci-staging-promoted': True,
+        '{}_ppc64le'.format(candidate_hash.full_hash): True,
+    }
+
+
+def test_query_container_all_missing_reported():
+    stage_info, candidate_hash = get_containers_stage_info()
+    stage_info['ppc_manifests'] = False
+
+    def head(url, **kwargs):
+        if url.startswith("http://localhost:6501") \
+                or "ppc64le" in url:
+            return Mock(status_code=404)
+        return Mock(status_code=200)
+
+    with patch.object(requests.Session, 'head', side_effect=head):
+        with pytest.raises(AssertionError) as error:
+            query_container_registry_promotion(stage_info=stage_info)
+    message = str(error.value)
+    assert "localhost:6501/tripleomaster/base:{}".format(
+        candidate_hash.full_hash) in message
+    assert "localhost:6501/tripleomaster/base:tripleo-ci-staging-promoted" \
+        in message
+    assert "localhost:6500/tripleomaster/base:{}_ppc64le".format(
+        candidate_hash.full_hash) in message
+
+
 @pytest.mark.xfail(reason="needs revisiting, much more difficult to make it "
                           "pass now")
 @pytest.mark.parametrize("staged_env", ("qcow_single",
@@ -238,6 +303,81 @@ def test_parse(staged_env):
     parse_promotion_logs(stage_info=stage_info)
 
 
+def test_log_verifier():
+    verifier = LogVerifier(["first pattern", "second .* pattern"],
+                           forbidden_patterns=["FAILED"])
+    verifier.verify(["nothing here\n",
+                     "first pattern and second big pattern\n",
+                     "client FAILED\n"])
+    assert verifier.missing == []
+    assert verifier.found == {"first pattern": 2, "second .* pattern": 2}
+    assert list(verifier.forbidden_found) == ["FAILED"]
+    assert verifier.lines_read == 3
+
+
+def test_log_verifier_stops_early():
+    verifier = LogVerifier(["first pattern"])
+    verifier.verify(iter(["first pattern\n", "unread\n", "unread\n"]))
+    assert verifier.done
+    assert verifier.lines_read == 1
+
+
+def test_log_verifier_missing():
+    verifier = LogVerifier(["first pattern", "second pattern"])
+    verifier.verify(["first pattern\n"])
+    assert verifier.missing == ["second pattern"]
+
+
+def test_iter_log_lines_file():
+    with tempfile.NamedTemporaryFile(mode="w", delete=False) as log_file:
+        log_file.write("line1\nline2\nline3\n")
+    try:
+        assert list(iter_log_lines(log_file.name)) == ["line1\n", "line2\n",
+                                                       "line3\n"]
+        assert list(iter_log_lines(log_file.name, offset=6)) == ["line2\n",
+                                                                 "line3\n"]
+    finally:
+        os.unlink(log_file.name)
+
+
+class FakeResponse(io.BytesIO):
+
+    def __init__(self, content, code):
+        super(FakeResponse, self).__init__(content)
+        self.code = code
+
+    def getcode(self):
+        return self.code
+
+
+def test_iter_log_lines_http_range():
+    with patch.object(url_lib, 'urlopen') as mock_urlopen:
+        mock_urlopen.return_value = FakeResponse(b"line2\n", 206)
+        lines = list(iter_log_lines("http://logs/promoter.log", offset=6))
+        request = mock_urlopen.call_args[0][0]
+        assert request.get_header("Range") == "bytes=6-"
+        assert lines == ["line2\n"]
+
+
+def test_iter_log_lines_http_no_range_support():
+    with patch.object(url_lib, 'urlopen') as mock_urlopen:
+        mock_urlopen.return_value = FakeResponse(b"line1\nline2\n", 200)
+        lines = list(iter_log_lines("http://logs/promoter.log", offset=6))
+        assert lines == ["line2\n"]
+
+
+def test_parse_production_log():
+    with patch.object(url_lib, 'urlopen') as mock_urlopen:
+        mock_urlopen.return_value = FakeResponse(
+            b"Summary: Promoted 2 hashes this round\n"
+            b"Promoter terminated normally\n", 200)
+        parse_promotion_logs(logfile="http://logs/promoter.log")
+        mock_urlopen.return_value = FakeResponse(
+            b"Summary: Promoted 2 hashes this round\n", 200)
+        with pytest.raises(AssertionError):
+            parse_promotion_logs(logfile="http://logs/promoter.log")
+
+
 @pytest.mark.xfail(reason="Test not implemented")
 def test_main():
     assert False
@@ -0,0 +1,85 @@
+import json
+import unittest
+from urllib import request
+
+try:
+    # Python3 imports
+    from unittest.mock import patch
+except ImportError:
+    # Python2 imports
+    from mock import patch
+
+from promoter_status import (PromoterStatus, format_labels,
+                             start_status_server)
+
+
+class TestPromoterStatus(unittest.TestCase):
+
+    def setUp(self):
+        self.status = PromoterStatus()
+
+    def test_set_state(self):
+        self.status.set(target_label='current-tripleo', client='dlrn_client')
+        self.assertEqual(self.status.snapshot()['state']['client'],
+                         'dlrn_client')
+        self.status.set(client=None)
+        self.assertIsNone(self.status.snapshot()['state']['client'])
+        with self.assertRaises(KeyError):
+            self.status.set(unknown='value')
+
+    def test_phase(self):
+        with self.status.phase('registries_client'):
+            phase = self.status.snapshot()['phases']['registries_client']
+            self.assertTrue(phase['running'])
+            self.assertIsNotNone(phase['elapsed'])
+        phase = self.status.snapshot()['phases']['registries_client']
+        self.assertFalse(phase['running'])
+        self.assertEqual(phase['runs'], 1)
+
+    def test_api_call_counts_errors(self):
+        with self.status.api_call('api_promotions_get'):
+            pass
+        with self.assertRaises(ValueError):
+            with self.status.api_call('api_promotions_get'):
+                raise ValueError
+        call = self.status.snapshot()['api_calls']['api_promotions_get']
+        self.assertEqual(call['count'], 2)
+        self.assertEqual(call['errors'], 1)
+
+    def test_render_metrics(self):
+        self.status.set(target_label='current-tripleo')
+        self.status.observe_api_call('api_promote_post', 0.3)
+        self.status.count_promotion(successful=True)
+        with self.status.phase('qcow_client'):
+            metrics = self.status.render_metrics()
+        self.assertIn('promoter_phase_running{phase="qcow_client"} 1',
+                      metrics)
+        self.assertIn('promoter_promotions_total{result="successful"} 1',
+                      metrics)
+        self.assertIn('promoter_api_call_duration_seconds_bucket'
+                      '{call="api_promote_post",le="0.25"} 0', metrics)
+        self.assertIn('promoter_api_call_duration_seconds_bucket'
+                      '{call="api_promote_post",le="0.5"} 1', metrics)
+        self.assertIn('promoter_api_call_duration_seconds_count'
+                      '{call="api_promote_post"} 1', metrics)
+        self.assertIn('target_label="current-tripleo"', metrics)
+
+    def test_format_labels_escapes(self):
+        self.assertEqual(format_labels([('a', 'x"y\\z\n')]),
+                         '{a="x\\"y\\\\z\\n"}')
+
+    # The promoter logger writes to the log dir, other tests remove it
+    @patch('logging.Logger.debug')
+    @patch('logging.Logger.info')
+    def test_status_server(self, mock_log_info, mock_log_debug):
+        self.status.set(target_label='current-tripleo')
+        server = start_status_server(0, host='127.0.0.1',
+                                     promoter_status=self.status)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        base_url = "http://127.0.0.1:{}".format(server.server_address[1])
+        with request.urlopen(base_url + "/status") as response:
+            snapshot = json.loads(response.read().decode())
+        self.assertEqual(snapshot['state']['target_label'], 'current-tripleo')
+        with request.urlopen(base_url + "/metrics") as response:
+            self.assertIn(b'promoter_uptime_seconds', response.read())
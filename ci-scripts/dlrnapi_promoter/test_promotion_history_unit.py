@@ -0,0 +1,136 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+try:
+    # Python3 imports
+    from unittest import mock
+    from unittest.mock import Mock, patch
+except ImportError:
+    # Python2 imports
+    import mock
+    from mock import Mock, patch
+
+from dlrn_hash import DlrnAggregateHash, DlrnCommitDistroExtendedHash
+from promotion_history import PromotionHistory, main
+
+
+def api_promotion(index, timestamp):
+    promotion = Mock()
+    promotion.commit_hash = "c{}".format(index)
+    promotion.distro_hash = "d{}".format(index)
+    promotion.extended_hash = None
+    promotion.aggregate_hash = None
+    promotion.component = None
+    promotion.timestamp = timestamp
+    return promotion
+
+
+class TestPromotionHistory(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.db_file = os.path.join(self.tmp_dir, 'history.sqlite')
+        self.history = PromotionHistory(self.db_file)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_record_and_latest(self):
+        self.assertIsNone(self.history.latest('current-tripleo'))
+        commitdistro = DlrnCommitDistroExtendedHash(commit_hash='a',
+                                                    distro_hash='b')
+        aggregate = DlrnAggregateHash(commit_hash='c', distro_hash='d',
+                                      aggregate_hash='abc')
+        self.assertTrue(self.history.record(commitdistro, 'current-tripleo',
+                                            timestamp=10))
+        self.history.record(aggregate, 'current-tripleo', timestamp=20)
+        self.history.record(aggregate, 'tripleo-ci-testing', timestamp=30)
+        latest = self.history.latest('current-tripleo')
+        self.assertEqual(latest['aggregate_hash'], 'abc')
+        self.assertEqual(latest['timestamp'], 20)
+        self.assertIsNone(latest['component'])
+
+    def test_history_and_intervals(self):
+        self.history.add_promotions('current-tripleo', [
+            api_promotion(1, 100),
+            api_promotion(2, 160),
+            api_promotion(3, 400),
+        ])
+        history = self.history.history('current-tripleo', since=150)
+        self.assertEqual([promotion['commit_hash'] for promotion in history],
+                         ['c2', 'c3'])
+        self.assertEqual(self.history.intervals('current-tripleo'),
+                         [(160, 60), (400, 240)])
+
+    def test_add_promotions_ignores_duplicates(self):
+        promotions = [api_promotion(1, 100), api_promotion(2, 200)]
+        self.assertEqual(self.history.add_promotions('l', promotions), 2)
+        self.assertEqual(self.history.add_promotions('l', promotions), 0)
+
+    @patch('logging.Logger.info')
+    def test_backfill_is_incremental(self, mock_log_info):
+        api = Mock()
+        api.api_promotions_get.side_effect = [
+            [api_promotion(5, 500), api_promotion(4, 400)],
+            [api_promotion(3, 300), api_promotion(2, 200)],
+        ]
+        self.history.add_promotions('l', [api_promotion(2, 200)])
+        added = self.history.backfill(api, 'l', page_size=2)
+        self.assertEqual(added, 3)
+        self.assertEqual(api.api_promotions_get.call_count, 2)
+        offsets = [call[0][0].offset
+                   for call in api.api_promotions_get.call_args_list]
+        self.assertEqual(offsets, [0, 2])
+        # Nothing newer: a single call and nothing added
+        api.api_promotions_get.side_effect = [[api_promotion(5, 500)]]
+        self.assertEqual(self.history.backfill(api, 'l', page_size=2), 0)
+
+    @patch('logging.Logger.info')
+    def test_backfill_replaces_recorded_promotions(self, mock_log_info):
+        recorded = DlrnCommitDistroExtendedHash(commit_hash='c2',
+                                                distro_hash='d2')
+        # Recorded with a local timestamp, different from the DLRN one
+        self.history.record(recorded, 'l', timestamp=205)
+        api = Mock()
+        api.api_promotions_get.return_value = [api_promotion(2, 200)]
+        self.assertEqual(self.history.backfill(api, 'l'), 1)
+        self.assertEqual(self.history.history('l'), [{
+            'label': 'l', 'commit_hash': 'c2', 'distro_hash': 'd2',
+            'extended_hash': None, 'aggregate_hash': None,
+            'component': None, 'timestamp': 200}])
+        self.assertEqual(self.history.intervals('l'), [])
+
+    @patch('logging.Logger.info')
+    def test_backfill_watermark_ignores_recorded(self, mock_log_info):
+        self.history.add_promotions('l', [api_promotion(1, 100)])
+        recorded = DlrnCommitDistroExtendedHash(commit_hash='c3',
+                                                distro_hash='d3')
+        self.history.record(recorded, 'l', timestamp=300)
+        self.assertEqual(self.history.last_timestamp('l'), 100)
+        # A promotion made by another host before the local one
+        api = Mock()
+        api.api_promotions_get.return_value = [
+            api_promotion(3, 300), api_promotion(2, 200),
+            api_promotion(1, 100)]
+        self.assertEqual(self.history.backfill(api, 'l'), 2)
+        self.assertEqual([promotion['commit_hash'] for promotion
+                          in self.history.history('l')], ['c1', 'c2', 'c3'])
+        self.assertEqual(self.history.last_timestamp('l'), 300)
+
+    @patch('logging.Logger.error')
+    def test_record_failure_not_fatal(self, mock_log_error):
+        history = PromotionHistory(os.path.join(self.tmp_dir, 'missing',
+                                                'history.sqlite'))
+        commitdistro = DlrnCommitDistroExtendedHash(commit_hash='a',
+                                                    distro_hash='b')
+        self.assertFalse(history.record(commitdistro, 'current-tripleo'))
+        self.assertTrue(mock_log_error.called)
+
+    @patch('builtins.print')
+    def test_main_latest(self, mock_print):
+        self.history.add_promotions('l', [api_promotion(1, 100)])
+        main("--db {} latest l".format(self.db_file))
+        mock_print.assert_has_calls([mock.call(mock.ANY)])
+        self.assertIn('"commit_hash": "c1"', mock_print.call_args[0][0])
@@ -0,0 +1,116 @@
+import json
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+
+try:
+    # Python3 imports
+    from unittest import mock
+except ImportError:
+    # Python2 imports
+    import mock
+
+from dlrn_hash import DlrnAggregateHash, DlrnCommitDistroExtendedHash
+from promotion_report import DeferredRender, PromotionReport
+
+
+class TestPromotionReport(unittest.TestCase):
+
+    def setUp(self):
+        self.report = PromotionReport()
+        self.aggregate_hash = DlrnAggregateHash(
+            commit_hash='a', distro_hash='b', aggregate_hash='abc',
+            timestamp=1)
+        self.commitdistro_hash = DlrnCommitDistroExtendedHash(
+            commit_hash='c', distro_hash='d', timestamp=2)
+        self.log = logging.getLogger('promoter')
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    @mock.patch('logging.Logger.error')
+    def test_unknown_format_falls_back_to_grid(self, mock_log_error):
+        report = PromotionReport('fancy')
+        self.assertEqual(report.report_format, 'grid')
+        self.assertTrue(mock_log_error.called)
+
+    def test_evaluations_collected_per_label_pair(self):
+        entry = self.report.add_evaluation('l1', 't1', self.aggregate_hash,
+                                           {'job1', 'job2'}, set())
+        self.report.add_evaluation('l1', 't2', self.commitdistro_hash,
+                                   {'job1'}, {'job2'})
+        self.report.mark_promoted(entry)
+        evaluations = self.report.get_evaluations('l1', 't1')
+        self.assertEqual(evaluations, [entry])
+        self.assertEqual(entry['successful_jobs'], ['job1', 'job2'])
+        self.assertEqual(entry['hash']['aggregate_hash'], 'abc')
+        promoted = self.report.as_dict()['promoted']
+        self.assertEqual(len(promoted), 1)
+        self.assertEqual(promoted[0]['target_label'], 't1')
+
+    def test_render_evaluations_formats(self):
+        self.report.add_evaluation('l1', 't1', self.commitdistro_hash,
+                                   {'job1'}, {'job2'})
+        entries = self.report.get_evaluations('l1', 't1')
+
+        grid = self.report.render_evaluations(entries)
+        self.assertIn('Missing Jobs', grid)
+        self.assertIn('job2', grid)
+
+        compact = self.report.render_evaluations(entries, 'compact')
+        self.assertEqual(compact, "c_d promoted: No successful jobs: 1 "
+                                  "missing jobs: job2")
+
+        rendered_json = json.loads(self.report.render_evaluations(entries,
+                                                                  'json'))
+        self.assertEqual(rendered_json[0]['missing_jobs'], ['job2'])
+
+    def test_render_candidates_formats(self):
+        entry = self.report.add_candidates('l1', 't1', [self.aggregate_hash,
+                                                        self.commitdistro_hash])
+        grid = self.report.render_candidates(entry)
+        self.assertIn('Aggregate Hash', grid)
+        self.assertIn('abc', grid)
+        compact = self.report.render_candidates(entry, 'compact')
+        self.assertEqual(len(compact.split("\n")), 2)
+
+    @mock.patch('promotion_report.PromotionReport.render_evaluations')
+    @mock.patch('logging.Logger.info')
+    def test_log_evaluations_is_deferred(self, mock_log_info, mock_render):
+        self.log.setLevel(logging.INFO)
+        self.report.add_evaluation('l1', 't1', self.aggregate_hash,
+                                   {'job1'}, set())
+        self.report.log_evaluations(self.log, 'l1', 't1')
+        self.assertTrue(mock_log_info.called)
+        self.assertFalse(mock_render.called)
+        deferred = mock_log_info.call_args[0][1]
+        self.assertIsInstance(deferred, DeferredRender)
+        mock_render.return_value = 'table'
+        self.assertEqual(str(deferred), 'table')
+
+    @mock.patch('logging.Logger.info')
+    def test_log_disabled_with_none_format(self, mock_log_info):
+        report = PromotionReport('none')
+        entry = report.add_candidates('l1', 't1', [self.aggregate_hash])
+        report.log_candidates(self.log, entry)
+        self.assertFalse(mock_log_info.called)
+
+    def test_write(self):
+        report_file = os.path.join(self.tmp_dir, 'report.json')
+        self.report.add_evaluation('l1', 't1', self.aggregate_hash,
+                                   {'job1'}, set())
+        self.assertTrue(self.report.write(report_file))
+        with open(report_file) as report:
+            content = json.load(report)
+        self.assertEqual(content['evaluations'][0]['hash']['commit_hash'],
+                         'a')
+        self.assertEqual(os.listdir(self.tmp_dir), ['report.json'])
+
+    @mock.patch('logging.Logger.error')
+    def test_write_failure_not_fatal(self, mock_log_error):
+        report_file = os.path.join(self.tmp_dir, 'missing', 'report.json')
+        self.assertFalse(self.report.write(report_file))
+        self.assertTrue(mock_log_error.called)
@@ -90,6 +90,25 @@ class TestQcowConnectionClient(unittest.TestCase):
         client.close()
         self.assertFalse(paramiko_close_mock.called)
 
+    @patch('paramiko.SSHClient.get_transport')
+    @patch('paramiko.SSHClient.connect')
+    @patch('paramiko.SSHClient.open_sftp')
+    def test_instance_sftp_is_connected(self,
+                                        paramiko_sftp_mock,
+                                        paramiko_connect_mock,
+                                        paramiko_transport_mock):
+        client = QcowConnectionClient(self.server_conf_sftp)
+        self.assertFalse(client.is_connected())
+
+        client.connect()
+        paramiko_transport_mock.return_value.is_active.return_value = True
+        self.assertTrue(client.is_connected())
+        paramiko_transport_mock.return_value.is_active.return_value = False
+        self.assertFalse(client.is_connected())
+
+        client.close()
+        self.assertFalse(client.is_connected())
+
     def tearDown(self):
         super(TestQcowConnectionClient, self).tearDown()
         os.remove(self.path)
@@ -190,6 +190,33 @@ class TestPrepareExtraVars(ConfigSetup):
         ])
         self.assertFalse(mock_log_error.called)
 
+    @patch('manifest_planner.ManifestPlanner.lookup')
+    def test_filter_ppc_containers(self, mock_lookup):
+        mock_lookup.side_effect = lambda container, tag: \
+            container != 'openstack-b' or tag.endswith('x86_64')
+        filtered = self.client.filter_ppc_containers(['a', 'b'], 'abc_def')
+        self.assertEqual(filtered, ['a'])
+        # Only the ppc tags are looked up
+        self.assertEqual(sorted(call[0] for call in mock_lookup.call_args_list),
+                         [('openstack-a', 'abc_def_ppc64le'),
+                          ('openstack-b', 'abc_def_ppc64le')])
+
+    @patch('manifest_planner.ManifestPlanner.lookup')
+    def test_filter_ppc_containers_without_manifest_push(self, mock_lookup):
+        self.client.config.manifest_push = False
+        mock_lookup.side_effect = lambda container, tag: \
+            container != 'openstack-b'
+        self.assertEqual(
+            self.client.filter_ppc_containers(['a', 'b'], 'abc_def'), ['a'])
+
+    @patch('manifest_planner.ManifestPlanner.plan')
+    def test_filter_ppc_containers_disabled(self, mock_plan):
+        self.client.config.manifest_source_registry = ""
+        self.assertEqual(
+            self.client.filter_ppc_containers(['a', 'b'], 'abc_def'),
+            ['a', 'b'])
+        self.assertFalse(mock_plan.called)
+
 
 class TestPromote(ConfigSetup):
 
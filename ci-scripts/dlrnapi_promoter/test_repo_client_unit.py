@@ -18,7 +18,8 @@ except ImportError:
 
 from config import PromoterConfigFactory
 from dlrn_hash import DlrnAggregateHash, DlrnCommitDistroExtendedHash
-from repo_client import RepoClient
+from http_session import DownloadError
+from repo_client import RepoArtifacts, RepoClient, RepoError
 
 log_dir = "~/web/promoter_logs"
 
@@ -276,8 +277,8 @@ class TestGetVersionsCsv(RepoSetup):
                                          candidate_label="tripleo-ci-testing")
 
         assertion.assertNotEqual(out_versions_csv_reader, None)
-        assertion.assertIsInstance(out_versions_csv_reader, csv.DictReader)
-        out_row = next(out_versions_csv_reader)
+        assertion.assertIsInstance(out_versions_csv_reader, RepoArtifacts)
+        out_row = next(iter(out_versions_csv_reader.versions.values()))
         assertion.assertEqual(out_row, self.versions_csv_rows[0])
         mock_log_debug.assert_has_calls([
             mock.call("Accessing versions at %s", mock.ANY)
@@ -294,8 +295,8 @@ class TestGetVersionsCsv(RepoSetup):
                                          candidate_label="tripleo-ci-testing")
 
         assertion.assertNotEqual(out_versions_csv_reader, None)
-        out_row = next(out_versions_csv_reader)
-        assertion.assertIsInstance(out_versions_csv_reader, csv.DictReader)
+        out_row = next(iter(out_versions_csv_reader.versions.values()))
+        assertion.assertIsInstance(out_versions_csv_reader, RepoArtifacts)
         assertion.assertEqual(out_row, self.versions_csv_rows[0])
         mock_log_debug.assert_has_calls([
             mock.call("Accessing versions at %s", mock.ANY)
@@ -322,6 +323,88 @@ class TestGetVersionsCsv(RepoSetup):
         ])
         assertion.assertTrue(mock_log_exception.called)
 
+    @patch('logging.Logger.exception')
+    @patch('logging.Logger.error')
+    @patch('logging.Logger.debug')
+    @patch('repo_client.open_text_stream')
+    def test_get_version_csv_parsed_once(self, mock_open_stream,
+                                         mock_log_debug, mock_log_error,
+                                         mock_log_exception):
+        self.client.artifacts = {}
+        stream = mock_open_stream.return_value
+        stream.__iter__.return_value = iter([
+            "Project,Source Sha\n", "project1,abc\n", "project2,def\n"])
+        out_versions_csv_reader = \
+            self.client.get_versions_csv(self.dlrn_hash_commitdistro,
+                                         candidate_label="tripleo-ci-testing")
+        assertion.assertTrue(stream.close.called)
+        # All the lookups, also from a new call, share the same parse
+        assertion.assertIs(
+            out_versions_csv_reader,
+            self.client.get_versions_csv(self.dlrn_hash_commitdistro,
+                                         candidate_label="tripleo-ci-testing"))
+        assertion.assertEqual(
+            self.client.get_commit_sha(out_versions_csv_reader, "project2"),
+            "def")
+        assertion.assertEqual(
+            self.client.get_commit_sha(out_versions_csv_reader, "project1"),
+            "abc")
+        assertion.assertEqual(mock_open_stream.call_count, 1)
+
+        # Errors while the body is read are handled as download errors
+        self.client.artifacts = {}
+        stream.reset_mock()
+        stream.__iter__.side_effect = DownloadError("connection reset")
+        out_versions_csv_reader = \
+            self.client.get_versions_csv(self.dlrn_hash_commitdistro,
+                                         candidate_label="tripleo-ci-testing")
+        assertion.assertIsNone(out_versions_csv_reader)
+        assertion.assertTrue(stream.close.called)
+
+
+class TestRepoArtifacts(RepoSetup):
+
+    def test_versions_missing_file(self):
+        artifacts = RepoArtifacts(self.client.root_url,
+                                  self.dlrn_hash_commitdistro2)
+        with assertion.assertRaises(RepoError):
+            artifacts.versions
+
+    def test_components_missing_file(self):
+        artifacts = RepoArtifacts(self.client.root_url,
+                                  self.dlrn_hash_commitdistro2)
+        with assertion.assertRaises(RepoError):
+            artifacts.components
+
+    @patch('repo_client.open_text_stream')
+    def test_components_error_while_reading(self, mock_open_stream):
+        # The parser iterates over the lines of the stream
+        stream = mock_open_stream.return_value
+        stream.__iter__.side_effect = DownloadError("connection reset")
+        artifacts = RepoArtifacts(self.client.root_url,
+                                  self.dlrn_hash_aggregate)
+        with assertion.assertRaises(RepoError):
+            artifacts.components
+        assertion.assertTrue(stream.close.called)
+
+    def test_components(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            commit_dir = os.path.join(tmp_dir,
+                                      self.dlrn_hash_aggregate.commit_dir)
+            os.makedirs(commit_dir)
+            with open(os.path.join(commit_dir, "delorean.repo"), "w") as repo:
+                repo.write("[component2]\nbaseurl=http://url2\n"
+                           "[component1]\nbaseurl=http://url1\n")
+            artifacts = RepoArtifacts("file://{}".format(tmp_dir),
+                                      self.dlrn_hash_aggregate)
+            assertion.assertEqual(list(artifacts.components.items()), [
+                ('component2', 'http://url2'),
+                ('component1', 'http://url1'),
+            ])
+        finally:
+            shutil.rmtree(tmp_dir)
+
 
 class TestGetContainersList(RepoSetup):
 
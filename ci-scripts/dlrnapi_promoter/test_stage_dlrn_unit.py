@@ -1,7 +1,19 @@
+import os
+import shutil
+import tempfile
 import unittest
 
 import pytest
-from stage_dlrn import generate_versions_csv
+from dlrn import db as dlrn_db
+from stage_dlrn import (DlrnStagingServer, StagingRepo,
+                        generate_synthetic_db_data, generate_versions_csv)
+
+try:
+    # Python3 imports
+    from unittest import mock
+except ImportError:
+    # Python2 imports
+    import mock
 
 
 class TestGeneral(unittest.TestCase):
@@ -19,6 +31,68 @@ class TestGeneral(unittest.TestCase):
         assert False
 
 
+class TestSyntheticData(unittest.TestCase):
+
+    def test_generate_synthetic_db_data(self):
+        data = generate_synthetic_db_data(100)
+        self.assertEqual(len(data['commits']), 100)
+        self.assertEqual(len(data['civotes']), 200)
+        self.assertEqual(len(data['promotions']), 25)
+        commit_hashes = set(commit['commit_hash']
+                            for commit in data['commits'])
+        self.assertEqual(len(commit_hashes), 100)
+        # Synthetic history is older than the db data files
+        self.assertLess(data['commits'][-1]['dt_commit'], 1441045153)
+        self.assertIsNone(data['commits'][0]['component'])
+
+    def test_generate_synthetic_db_data_components(self):
+        data = generate_synthetic_db_data(6, components=['tripleo', 'nova'])
+        components = [commit['component'] for commit in data['commits']]
+        self.assertEqual(components, ['tripleo', 'nova'] * 3)
+
+    def test_seed_synthetic_data(self):
+        root_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root_dir)
+        staging_repo = StagingRepo.__new__(StagingRepo)
+        staging_repo.distro = "centos"
+        staging_repo.repo_root_files = root_dir
+        staging_repo.components_mode = True
+        server = DlrnStagingServer.__new__(DlrnStagingServer)
+        server.config = mock.Mock()
+        server.config.dlrn = {'components': ['tripleo', 'nova']}
+        server.components_mode = True
+        server.synthetic_commits = 40
+        server.db_file = os.path.join(root_dir, "commits.sqlite")
+        server.staging_repo = staging_repo
+        session = dlrn_db.getSession("sqlite:///{}".format(server.db_file))
+        self.addCleanup(session.close)
+
+        server.seed_synthetic_data(session)
+
+        self.assertEqual(session.query(dlrn_db.Commit).count(), 40)
+        self.assertEqual(session.query(dlrn_db.CIVote).count(), 80)
+        self.assertEqual(session.query(dlrn_db.Commit).filter_by(
+            component='nova').count(), 20)
+        promotions = session.query(dlrn_db.Promotion).all()
+        self.assertEqual(len(promotions), 10)
+        self.assertEqual(session.query(dlrn_db.Promotion).filter_by(
+            promotion_name='tripleo-ci-staging-promoted').count(), 2)
+        aggregate_hashes = [promotion.aggregate_hash
+                            for promotion in promotions]
+        self.assertNotIn(None, aggregate_hashes)
+        self.assertEqual(len(set(aggregate_hashes)), 10)
+        # The hierarchy shares a single versions.csv
+        commit = session.query(dlrn_db.Commit).first()
+        commit_dir = os.path.join(root_dir, commit.getshardedcommitdir())
+        self.assertEqual(os.readlink(os.path.join(commit_dir, "versions.csv")),
+                         os.path.join(root_dir, "versions.csv"))
+        with open(os.path.join(commit_dir, "delorean.repo")) as repo:
+            self.assertIn("-component-{}".format(commit.component),
+                          repo.read())
+        self.assertTrue(os.path.exists(os.path.join(commit_dir,
+                                                    "commit.yaml")))
+
+
 class TestStagingRepo(unittest.TestCase):
 
     @pytest.mark.xfail(reason="Not Implemented", run=False)
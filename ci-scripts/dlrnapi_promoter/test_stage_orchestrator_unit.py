@@ -1,6 +1,17 @@
+import threading
 import unittest
 
 import pytest
+from stage_orchestrator import StageOrchestrator
+
+try:
+    # Python3 imports
+    from unittest import mock
+    from unittest.mock import patch
+except ImportError:
+    # Python2 imports
+    from mock import patch
+    import mock
 
 
 class TestStageOrchestrator(unittest.TestCase):
@@ -24,3 +35,66 @@ class TestStageOrchestrator(unittest.TestCase):
     @pytest.mark.xfail(reason="Not Implemented", run=False)
     def test_stage_info(self):
         assert False
+
+
+class TestRunParts(unittest.TestCase):
+
+    @patch('stage_orchestrator.DlrnStagingServer')
+    def setUp(self, mock_dlrn_server):
+        config = {
+            'log_file': '/tmp/stage.log',
+            'distro_name': 'centos',
+            'distro_version': '8',
+            'promoter_user': 'promoter',
+            'release': 'master',
+            'stage_root': '/tmp/stage',
+            'dry_run': True,
+            'stage_info_path': '/tmp/stage-info.yaml',
+            'scenes': ['dlrn', 'registries', 'containers'],
+            'stage_workers': 4,
+        }
+        self.orchestrator = StageOrchestrator(config)
+        self.events = []
+        self.controllers = {}
+        for part in ['dlrn', 'registries', 'containers', 'overcloud_images']:
+            controller = mock.Mock()
+            controller.setup.side_effect = self.setup_part(part)
+            self.controllers[part] = controller
+        self.orchestrator.get_controller = self.controllers.get
+        self.registries_started = threading.Event()
+
+    def setup_part(self, part):
+        def setup():
+            if part == 'registries':
+                self.registries_started.set()
+            if part == 'dlrn':
+                # dlrn and registries are independent, so registries must
+                # be able to start while dlrn is still running
+                assert self.registries_started.wait(5)
+            self.events.append(part)
+            return "{}-info".format(part)
+        return setup
+
+    def test_run_parts_success(self):
+        results = self.orchestrator.run_parts(['dlrn', 'registries',
+                                               'containers',
+                                               'overcloud_images'])
+        self.assertEqual(results['containers'], "containers-info")
+        self.assertEqual(results['overcloud_images'],
+                         "overcloud_images-info")
+        self.assertEqual(self.events[0], 'registries')
+        self.assertGreater(self.events.index('containers'),
+                           self.events.index('dlrn'))
+        self.assertGreater(self.events.index('overcloud_images'),
+                           self.events.index('dlrn'))
+
+    def test_run_parts_missing_dependency_ignored(self):
+        results = self.orchestrator.run_parts(['registries', 'containers'])
+        self.assertEqual(self.events, ['registries', 'containers'])
+        self.assertNotIn('dlrn', results)
+
+    def test_run_parts_failure(self):
+        self.controllers['registries'].setup.side_effect = Exception
+        with self.assertRaises(Exception):
+            self.orchestrator.run_parts(['registries', 'containers'])
+        self.assertFalse(self.controllers['containers'].setup.called)
@@ -23,6 +23,12 @@ class TestMain(unittest.TestCase):
         assert args.promoter_user == "prom"
         assert args.db_data_file == 'fix.yaml'
         assert args.scenes.split(',') == ['dlrn', 'registries']
+        assert args.warm_cache is False
+
+    def test_parse_args_warm_cache(self):
+        args = parse_args(self.defaults,
+                          cmd_line="--warm-cache setup --release-config r")
+        assert args.warm_cache is True
 
     def test_arg_parse_teardown(self):
         line = "teardown"
@@ -0,0 +1,269 @@
+#!/usr/bin/env python
+"""
+Statistics of the servers, stacks and quotas of a cloud tenant, written as
+influxdb lines in a file of the web directory, read by the cockpit.
+
+The listings are done with openstacksdk in this process, with one
+authenticated connection to the cloud, and at the same time. Each listing
+is then counted in a single pass.
+
+The clouds are described in CLOUDS, a new tenant only needs an entry
+there, or an entry in clouds.yaml and the --cloud option.
+"""
+import argparse
+import datetime
+import logging
+import os
+import re
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import influx_lines
+import openstack
+
+# This file is running on toolbox periodically
+
+re_ex = re.compile(r"^export ([^\s=]+)=(\S+)")
+
+SERVERS_FIELDS = ['ACTIVE', 'BUILD', 'ERROR', 'DELETED', 'undercloud',
+                  'multinode', 'bmc', 'ovb-node', 'other', 'total']
+SERVER_STATUSES = ['ACTIVE', 'BUILD', 'ERROR', 'DELETED']
+STACKS_FIELDS = ['stacks_total', 'create_complete', 'create_failed',
+                 'create_in_progress', 'delete_in_progress', 'delete_failed',
+                 'delete_complete', 'old_stacks']
+STACK_STATUSES = ['CREATE_COMPLETE', 'CREATE_FAILED', 'CREATE_IN_PROGRESS',
+                  'DELETE_IN_PROGRESS', 'DELETE_FAILED', 'DELETE_COMPLETE']
+OLD_STACK_HOURS = 5
+STACK_TIME_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+# name -> profile. secrets: the rc file with the OS_ credentials, without
+# it the cloud is looked up in clouds.yaml. undercloud_flavor,
+# undercloud_name and multinode_name recognize the nodepool nodes
+CLOUDS = {
+    'rdocloud': {
+        'secrets': "/etc/nodepoolrc",
+        'file_path': 'influxdb_stats',
+        'undercloud_flavor': 'ci.m1.nodepool',
+        'undercloud_name': 'upstream-centos-8-rdo-cloud',
+        'multinode_name': 'upstream-centos-8-2-node-rdo-cloud',
+    },
+    'vexxhost': {
+        'secrets': "/etc/vexxhostrc",
+        'file_path': 'influxdb_stats_vexx',
+        'undercloud_flavor': 'nodepool',
+        'undercloud_name': 'node',
+        # can't figure out for vexx
+        'multinode_name': None,
+    },
+}
+
+
+def read_secrets(secrets):
+    """
+    :param secrets: The path of a rc file
+    :return: A dict with the variables exported by the file
+    """
+    d = {}
+    with open(secrets) as f:
+        for line in f:
+            if re_ex.match(line):
+                key, val = re_ex.search(line).groups()
+                d[key] = val.replace('"', '').replace("'", "")
+    return d
+
+
+def connect(name, profile):
+    """
+    Opens the connection shared by all the listings, authenticated once
+    """
+    if profile.get('secrets'):
+        os.environ.update(read_secrets(profile['secrets']))
+        conn = openstack.connect()
+    else:
+        conn = openstack.connect(cloud=name)
+    conn.authorize()
+    return conn
+
+
+def get_absolute_limits(proxy):
+    return proxy.get('/limits').json()['limits']['absolute']
+
+
+def list_resources(conn):
+    """
+    Lists the resources of the tenant, all at the same time
+    :return: A dict name -> list of resources, or dict for the limits.
+    The listings that failed are None
+    """
+    listings = {
+        'servers': lambda: list(conn.compute.servers(details=True)),
+        'flavors': lambda: list(conn.compute.flavors()),
+        'images': lambda: list(conn.image.images()),
+        'compute_limits': lambda: get_absolute_limits(conn.compute),
+        'volume_limits': lambda: get_absolute_limits(conn.block_storage),
+        'fips': lambda: list(conn.network.ips()),
+        'ports_down': lambda: list(conn.network.ports(status='DOWN')),
+        'stacks': lambda: list(conn.orchestration.stacks()),
+    }
+    with ThreadPoolExecutor(max_workers=len(listings)) as executor:
+        futures = dict((name, executor.submit(listing))
+                       for name, listing in listings.items())
+    resources = {}
+    for name, future in futures.items():
+        try:
+            resources[name] = future.result()
+        except Exception as e:
+            logging.error("Listing of %s failed: %s", name, e)
+            resources[name] = None
+    return resources
+
+
+def count_servers(servers, profile, flavors=None, images=None):
+    """
+    :param servers: The openstacksdk servers, with their details
+    :param flavors: The flavors, to name the flavor of the servers when
+    the compute api doesn't
+    :param images: The images, to name the image of the servers. A server
+    booted from a volume has no image
+    :return: The SERVERS_FIELDS dict, None without servers
+    """
+    if servers is None:
+        return None
+    flavor_names = dict((f.id, f.name) for f in flavors or [])
+    image_names = dict((i.id, i.name) for i in images or [])
+    d = dict((key, 0) for key in SERVERS_FIELDS)
+    for server in servers:
+        flavor_name = (getattr(server.flavor, 'original_name', None)
+                       or flavor_names.get(getattr(server.flavor, 'id',
+                                                   None)))
+        image_name = image_names.get(getattr(server.image, 'id', None))
+        name = server.name
+        if server.status in SERVER_STATUSES:
+            d[server.status] += 1
+        if (flavor_name == profile['undercloud_flavor']
+                and profile['undercloud_name'] in name):
+            d['undercloud'] += 1
+        if profile['multinode_name'] and profile['multinode_name'] in name:
+            d['multinode'] += 1
+        if image_name == 'bmc-template':
+            d['bmc'] += 1
+        if image_name == 'ipxe-boot':
+            d['ovb-node'] += 1
+        d['total'] += 1
+    d['other'] = (
+        d['total'] - d['ovb-node'] - d['bmc']
+        - d['undercloud'] - d['multinode'])
+    return d
+
+
+def count_stacks(stacks, now=None):
+    """
+    :param stacks: The openstacksdk stacks
+    :param now: The current utc time, default utcnow
+    :return: The STACKS_FIELDS dict, None without stacks
+    """
+    if stacks is None:
+        return None
+    now = now or datetime.datetime.utcnow()
+    statuses = Counter()
+    old_stacks = 0
+    for stack in stacks:
+        statuses[stack.status] += 1
+        created = datetime.datetime.strptime(stack.created_at,
+                                             STACK_TIME_FORMAT)
+        if int((now - created).total_seconds() / 3600) > OLD_STACK_HOURS:
+            old_stacks += 1
+    d = dict((status.lower(), statuses[status])
+             for status in STACK_STATUSES)
+    d['stacks_total'] = len(stacks)
+    d['old_stacks'] = old_stacks
+    return d
+
+
+def get_quotes(compute_limits, volume_limits):
+    if compute_limits is None:
+        return None
+    return {
+        'cores': compute_limits.get('totalCoresUsed', 0),
+        'ram': compute_limits.get('totalRAMUsed', 0),
+        'instances': compute_limits.get('totalInstancesUsed', 0),
+        'gbs': (volume_limits or {}).get('totalGigabytesUsed', 0),
+    }
+
+
+def compose_influxdb_data(name, servers, quotes, stacks, fips, ports_down,
+                          ts):
+    nanots = int(ts) * 1000000000
+    lines = []
+    servers_fields = []
+    if servers:
+        servers_fields += [(key, servers[key]) for key in SERVERS_FIELDS]
+    if stacks:
+        servers_fields += [(key, stacks[key]) for key in STACKS_FIELDS]
+    if servers_fields:
+        lines.append(influx_lines.point('%s-servers' % name,
+                                        fields=servers_fields,
+                                        timestamp=nanots))
+    if quotes:
+        lines.append(influx_lines.point(
+            '%s-perf' % name,
+            fields=[('instances', quotes['instances']),
+                    ('cores', quotes['cores']),
+                    ('ram', quotes['ram']),
+                    ('gigabytes', quotes['gbs']),
+                    ('fips', fips),
+                    ('ports_down', ports_down)],
+            timestamp=nanots))
+
+    return ''.join(line + '\n' for line in lines)
+
+
+def collect(name, profile=None):
+    """
+    :param name: The name of the cloud, in CLOUDS or in clouds.yaml
+    :param profile: The profile of the cloud, default the one in CLOUDS
+    :return: The influxdb lines of the cloud, as a string
+    """
+    profile = profile or CLOUDS.get(name, {
+        'undercloud_flavor': None, 'undercloud_name': '',
+        'multinode_name': None})
+    resources = list_resources(connect(name, profile))
+    servers = count_servers(resources['servers'], profile,
+                            resources['flavors'], resources['images'])
+    quotes = get_quotes(resources['compute_limits'],
+                        resources['volume_limits'])
+    stacks = count_stacks(resources['stacks'])
+    fips = len(resources['fips'] or [])
+    ports_down = len(resources['ports_down'] or [])
+    return compose_influxdb_data(name, servers, quotes, stacks, fips,
+                                 ports_down, time.time())
+
+
+def write_influxdb_file(webdir, file_path, influxdb_data):
+    with open(os.path.join(webdir, file_path), "w") as f:
+        f.write(influxdb_data)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Retrieve cloud statistics")
+
+    parser.add_argument(
+        '--cloud', required=True,
+        help="one of %s or a cloud of clouds.yaml" % ", ".join(CLOUDS))
+    parser.add_argument(
+        '--webdir', default="/var/www/html/", help="(default: %(default)s)")
+    parser.add_argument(
+        '--file-path',
+        help="(default: the file of the cloud, influxdb_stats_CLOUD for "
+             "the clouds of clouds.yaml)")
+    args = parser.parse_args()
+
+    file_path = args.file_path or CLOUDS.get(args.cloud, {}).get(
+        'file_path', 'influxdb_stats_%s' % args.cloud)
+    write_influxdb_file(args.webdir, file_path, collect(args.cloud))
+
+
+if __name__ == '__main__':
+    main()
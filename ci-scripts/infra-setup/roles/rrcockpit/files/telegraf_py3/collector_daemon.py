@@ -0,0 +1,370 @@
+#!/usr/bin/env python
+"""
+Runs the cockpit collectors in a single long running process.
+
+Each collector of the configuration (collectors.yaml) is a plugin, one of
+the collector scripts, with its arguments and its interval. The collectors
+run concurrently in a pool of threads, share one pool of keep-alive
+connections and the caches of their modules, and their lines are buffered
+until telegraf reads them from the http endpoint:
+
+    GET /metrics  The buffered lines, in line protocol. They are removed
+                  from the buffer once the response was written, so a
+                  read that fails is retried by the next one. A read
+                  that times out after the response was written is lost
+    GET /status   The schedule and the result of the last run of the
+                  collectors, as json
+
+A collector whose previous run is still going is skipped, like a telegraf
+exec input still running its command. A run longer than the timeout of its
+collector is stopped at the next line it yields, or when it returns, and
+its lines are dropped. The requests of the shared session time out too, so
+a run can't hang on a stuck server.
+"""
+import argparse
+import json
+import logging
+import os
+import socketserver
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import gerrit_changes
+import get_jenkins_jobs
+import github_status
+import requests
+import storyboard
+import urllib3
+import yaml
+import zuulv3_job_builds
+import zuulv3_queues_status
+
+urllib3.disable_warnings()
+
+CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                      'collectors.yaml')
+PORT = 8095
+WORKERS = 8
+# Default timeout of the requests of the shared session, in seconds
+REQUEST_TIMEOUT = 60
+# Lines kept when telegraf doesn't read them, the oldest are dropped
+BUFFER_SIZE = 500000
+
+
+def fetch(session, url, timeout=120):
+    """Lines already in line protocol, like the cloud influxdb_stats"""
+    response = session.get(url, timeout=timeout)
+    response.raise_for_status()
+    return response.text.splitlines()
+
+
+# plugin name -> function(session, **args) returning the lines
+PLUGINS = {
+    'zuul_builds': lambda session, **args: zuulv3_job_builds.collect(
+        session=session, **args),
+    'zuul_queues': lambda session, **args: zuulv3_queues_status.collect(
+        session=session, **args),
+    'gerrit': lambda session, **args: gerrit_changes.collect(
+        session=session, **args),
+    'jenkins': lambda session, **args: get_jenkins_jobs.collect(
+        session=session, **args),
+    'storyboard': lambda session, **args: storyboard.collect(
+        session=session, **args),
+    'github_status': lambda session, **args: github_status.collect(
+        session=session, **args),
+    'fetch': fetch,
+}
+
+
+class CollectorTimeout(Exception):
+    pass
+
+
+class TimeoutSession(requests.Session):
+    """A session whose requests time out by default"""
+
+    def __init__(self, timeout=REQUEST_TIMEOUT):
+        super(TimeoutSession, self).__init__()
+        self.timeout = timeout
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return super(TimeoutSession, self).request(method, url, **kwargs)
+
+
+def create_session(pool_size, timeout=REQUEST_TIMEOUT):
+    """
+    The session shared by the collectors, passed to each plugin
+    """
+    session = TimeoutSession(timeout)
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size,
+                                            pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+class Collector(object):
+    """A plugin with its arguments, its schedule and its last result"""
+
+    def __init__(self, name, plugin, interval, args=None, timeout=None):
+        if plugin not in PLUGINS:
+            raise ValueError("{}: unknown plugin {}".format(name, plugin))
+        self.name = name
+        self.plugin = plugin
+        self.interval = interval
+        # Max duration of a run, default the interval
+        self.timeout = timeout or interval
+        self.args = args or {}
+        self.next_run = 0
+        self.deadline = None
+        self.running = False
+        self.last_run = None
+        self.last_duration = None
+        self.last_lines = None
+        self.last_error = None
+
+    def snapshot(self):
+        return {
+            'plugin': self.plugin,
+            'interval': self.interval,
+            'timeout': self.timeout,
+            'running': self.running,
+            'last_run': self.last_run,
+            'last_duration': self.last_duration,
+            'last_lines': self.last_lines,
+            'last_error': self.last_error,
+        }
+
+
+def load_collectors(config_path):
+    with open(config_path) as config_file:
+        config = yaml.safe_load(config_file)
+    return [Collector(c['name'], c['plugin'], c['interval'], c.get('args'),
+                      c.get('timeout'))
+            for c in config['collectors']]
+
+
+class CollectorDaemon(object):
+
+    def __init__(self, collectors, session, workers=WORKERS,
+                 buffer_size=BUFFER_SIZE):
+        self.collectors = collectors
+        self.session = session
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.lines = deque(maxlen=buffer_size)
+        # Sequence number of self.lines[0], counting all the lines added
+        self.first_seq = 0
+        self.dropped = 0
+        self.lock = threading.Lock()
+
+    def add_lines(self, lines):
+        with self.lock:
+            for line in lines:
+                if len(self.lines) == self.lines.maxlen:
+                    self.dropped += 1
+                    self.first_seq += 1
+                self.lines.append(line)
+
+    def peek(self):
+        """
+        :return: A tuple (buffered lines, sequence number to pass to ack
+        to remove them)
+        """
+        with self.lock:
+            return list(self.lines), self.first_seq + len(self.lines)
+
+    def ack(self, end_seq):
+        """
+        Removes the lines returned by peek, the ones added since are kept
+        """
+        with self.lock:
+            while self.lines and self.first_seq < end_seq:
+                self.lines.popleft()
+                self.first_seq += 1
+
+    def drain(self):
+        """
+        :return: The buffered lines, removed from the buffer
+        """
+        lines, end_seq = self.peek()
+        self.ack(end_seq)
+        return lines
+
+    def collect(self, collector):
+        """
+        Runs the plugin of a collector until its deadline
+        :return: The lines of the run
+        :raise CollectorTimeout: If the deadline is passed, the lines
+        collected so far are dropped
+        """
+        output = PLUGINS[collector.plugin](self.session, **collector.args)
+        lines = []
+        try:
+            for line in output:
+                lines.append(line)
+                if time.time() > collector.deadline:
+                    break
+        finally:
+            # Stops the generators, and their pending requests
+            if hasattr(output, 'close'):
+                output.close()
+        if time.time() > collector.deadline:
+            raise CollectorTimeout("timed out after {}s".format(
+                collector.timeout))
+        return lines
+
+    def run(self, collector):
+        start = time.time()
+        collector.deadline = start + collector.timeout
+        try:
+            # Buffered per run, so telegraf doesn't read half of a run
+            lines = self.collect(collector)
+            self.add_lines(lines)
+            collector.last_lines = len(lines)
+            collector.last_error = None
+        except CollectorTimeout as ex:
+            logging.error("Collector %s %s, its lines are dropped",
+                          collector.name, ex)
+            collector.last_error = str(ex)
+        except Exception as ex:
+            logging.exception("Collector %s failed", collector.name)
+            collector.last_error = str(ex)
+        finally:
+            collector.last_run = datetime.utcfromtimestamp(
+                start).isoformat()
+            collector.last_duration = round(time.time() - start, 3)
+            collector.running = False
+
+    def run_pending(self, now=None):
+        """
+        Starts the collectors whose time has come
+        :param now: The current time, default time.time()
+        :return: The futures of the started runs
+        """
+        now = time.time() if now is None else now
+        futures = []
+        for collector in self.collectors:
+            if collector.next_run > now:
+                continue
+            if collector.running:
+                logging.warning("Collector %s still running, skipped",
+                                collector.name)
+                if collector.deadline and now > collector.deadline:
+                    logging.error("Collector %s is running past its "
+                                  "timeout of %ss", collector.name,
+                                  collector.timeout)
+            else:
+                collector.running = True
+                futures.append(self.executor.submit(self.run, collector))
+            collector.next_run = now + collector.interval
+        return futures
+
+    def snapshot(self):
+        with self.lock:
+            buffered = len(self.lines)
+        return {
+            'buffered_lines': buffered,
+            'dropped_lines': self.dropped,
+            'collectors': dict((c.name, c.snapshot())
+                               for c in self.collectors),
+        }
+
+    def serve_forever(self, tick=1):
+        while True:
+            self.run_pending()
+            time.sleep(tick)
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        path = self.path.split('?')[0]
+        end_seq = None
+        if path == '/metrics':
+            lines, end_seq = self.server.daemon.peek()
+            body = "".join(line + "\n" for line in lines)
+            content_type = "text/plain; charset=utf-8"
+        elif path in ['/', '/status']:
+            body = json.dumps(self.server.daemon.snapshot(), indent=2)
+            content_type = "application/json"
+        else:
+            self.send_error(404)
+            return
+        body = body.encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.wfile.flush()
+        # Only once written, a failed write raises and keeps the lines
+        if end_seq is not None:
+            self.server.daemon.ack(end_seq)
+
+    def log_message(self, log_format, *args):
+        logging.debug("Metrics server: %s - %s", self.address_string(),
+                      log_format % args)
+
+
+class MetricsServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, collector_daemon):
+        self.daemon = collector_daemon
+        HTTPServer.__init__(self, address, MetricsRequestHandler)
+
+
+def start_metrics_server(collector_daemon, port, host=''):
+    """
+    Starts the http endpoint in a background thread
+    :return: The running MetricsServer. Use its shutdown method to stop it
+    """
+    server = MetricsServer((host, port), collector_daemon)
+    thread = threading.Thread(target=server.serve_forever,
+                              name="metrics-server")
+    thread.daemon = True
+    thread.start()
+    logging.info("Metrics server: listening on port %d",
+                 server.server_address[1])
+    return server
+
+
+def main():
+
+    parser = argparse.ArgumentParser(
+        description="Run the cockpit collectors and serve their lines")
+    parser.add_argument(
+        '--config', default=CONFIG, help="(default: %(default)s)")
+    parser.add_argument(
+        '--port', type=int, default=PORT, help="(default: %(default)s)")
+    parser.add_argument(
+        '--host', default='127.0.0.1', help="(default: %(default)s)")
+    parser.add_argument(
+        '--workers', type=int, default=WORKERS,
+        help="collectors running at the same time (default: %(default)s)")
+    parser.add_argument(
+        '--pool-size', type=int, default=32,
+        help="keep-alive connections per host (default: %(default)s)")
+    parser.add_argument(
+        '--request-timeout', type=float, default=REQUEST_TIMEOUT,
+        help="default timeout of the requests, in seconds "
+             "(default: %(default)s)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s %(levelname)s %(message)s')
+    collector_daemon = CollectorDaemon(load_collectors(args.config),
+                                       create_session(args.pool_size,
+                                                      args.request_timeout),
+                                       workers=args.workers)
+    start_metrics_server(collector_daemon, args.port, args.host)
+    collector_daemon.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,17 @@
 #!/usr/bin/env python
 import argparse
 import json
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+import influx_lines
 import requests
 from diskcache import Cache
 
 CACHE_SIZE = int(1e9)  # 1GB
+PAGE_SIZE = 50
+# Pages requested at the same time
+WORKERS = 4
 
 cache = Cache('/tmp/gerrt_changes_cache', size_limit=CACHE_SIZE)
 cache.expire()
@@ -17,18 +22,10 @@ def time_convert(t, nano=True):
         '000000000' if nano else '')
 
 
-def influx_esc(s):
-    s = s.replace('"', '\\"')
-    s = s.replace(',', '\\,')
-    s = s.replace("'", '\\"')
-    s = s.replace(" ", '\\ ')
-    return s
-
-
-def get_username(host, uid):
+def get_username(host, uid, session=None):
     if uid in cache:
         return cache[uid]
-    user = requests.get("%s/accounts/%s" % (host, uid))
+    user = (session or requests).get("%s/accounts/%s" % (host, uid))
     if user.ok:
         json_raw = user.content[5:]
         try:
@@ -41,79 +38,118 @@ def get_username(host, uid):
     return ''
 
 
-def get_gerrit_data(host, project, pages=1):
-    total_data = []
-    for i in range(pages):
-        url = (
-            "%s/changes/?q=project:%s"
-            "+-label:Workflow=-1+-label:Code-Review=-2"
-            "+-message:\"WIP\"+-message:\"DNM\"&n=50&start=%s") % (
-            host, project, i * 50)
-        data = requests.get(url)
-        json_raw = data.content[5:]
-        try:
-            json_data = json.loads(json_raw)
-            total_data += json_data
-        except Exception:
-            return total_data
+def get_changes_url(host, projects, start):
+    """
+    One query per project, gerrit answers them in a single response. The
+    owners come with their name, so they don't need a request each
+    """
+    queries = "&".join(
+        "q=project:%s+-label:Workflow=-1+-label:Code-Review=-2"
+        "+-message:\"WIP\"+-message:\"DNM\"" % project
+        for project in projects)
+    return "%s/changes/?%s&o=DETAILED_ACCOUNTS&n=%s&start=%s" % (
+        host, queries, PAGE_SIZE, start)
+
+
+def get_gerrit_page(host, projects, start, session=None):
+    """
+    :return: A list with the changes of each project, None if the page
+    could not be read
+    """
+    data = (session or requests).get(get_changes_url(host, projects, start))
+    json_raw = data.content[5:]
+    try:
+        json_data = json.loads(json_raw)
+    except Exception:
+        return None
+    # The results of a single query are not in a list of results
+    if len(projects) == 1:
+        json_data = [json_data]
+    if (not isinstance(json_data, list) or len(json_data) != len(projects)
+            or not all(isinstance(changes, list) for changes in json_data)):
+        return None
+    return json_data
+
+
+def get_projects_data(host, projects, pages=1, session=None,
+                      workers=WORKERS):
+    """
+    Requests the pages of all the projects at once, every page has the
+    changes of all the projects
+    :return: A dict project -> changes. The pages after the first one
+    that could not be read are ignored
+    """
+    total_data = dict((project, []) for project in projects)
+    with ThreadPoolExecutor(max_workers=max(1, min(pages, workers))) \
+            as executor:
+        results = [executor.submit(get_gerrit_page, host, projects,
+                                   i * PAGE_SIZE, session)
+                   for i in range(pages)]
+        for result in results:
+            page = result.result()
+            if page is None:
+                break
+            for project, changes in zip(projects, page):
+                total_data[project] += changes
     return total_data
 
 
-def pretty_print(patch, host, project):
+def get_gerrit_data(host, project, pages=1, session=None):
+    return get_projects_data(host, [project], pages, session=session)[
+        project]
+
+
+def pretty_print(patch, host, project, session=None):
     patch_id = patch['_number']
-    patch_created = time_convert(patch['created'], nano=False) + "000"
-    patch_updated = time_convert(patch['updated'], nano=False) + "000"
+    patch_created = int(time_convert(patch['created'], nano=False) + "000")
+    patch_updated = int(time_convert(patch['updated'], nano=False) + "000")
     patch_mergeable = patch.get('mergeable', False)
-    patch_title = patch['subject'].replace('"', '\\"')
+    patch_title = patch['subject']
     patch_status = patch['status']
     patch_merged_at = 0
     if 'submitted' in patch:
-        patch_merged_at = time_convert(patch['submitted'], nano=False) + "000"
-    patch_user = get_username(host, patch['owner']['_account_id'])
+        patch_merged_at = int(
+            time_convert(patch['submitted'], nano=False) + "000")
+    patch_user = patch['owner'].get('name')
+    if patch_user is None:
+        patch_user = get_username(host, patch['owner']['_account_id'],
+                                  session=session)
     patch_link = "<a href='%s/%s' target=_blank>%s</a>" % (
         host, patch_id, patch_title)
-    return (u'patch,'
-            'id=%s,'
-            'created=%s,'
-            'updated=%s,'
-            'mergeable=%s,'
-            'status=%s,'
-            'owner=%s,'
-            'project=%s'
-            ' '
-            'id=%s,'
-            'created=%s,'
-            'updated=%s,'
-            'mergeable=%s,'
-            'status="%s",'
-            'merged=%s,'
-            'owner="%s",'
-            'subject="%s",'
-            'project="%s",'
-            'link="%s"'
-            ' '
-            '%s' % (
-                patch_id,
-                patch_created,
-                patch_updated,
-                patch_mergeable,
-                patch_status,
-                influx_esc(patch_user),
-                project,
-
-                patch_id,
-                patch_created,
-                patch_updated,
-                patch_mergeable,
-                patch_status,
-                patch_merged_at,
-                patch_user,
-                patch_title,
-                project,
-                patch_link,
-                time_convert(
-                    patch['created'], nano=True)
-            )).encode('utf-8')
+    return influx_lines.point(
+        'patch',
+        tags=[
+            ('id', patch_id),
+            ('created', patch_created),
+            ('updated', patch_updated),
+            ('mergeable', patch_mergeable),
+            ('status', patch_status),
+            ('owner', patch_user),
+            ('project', project),
+        ],
+        fields=[
+            ('id', patch_id),
+            ('created', patch_created),
+            ('updated', patch_updated),
+            ('mergeable', patch_mergeable),
+            ('status', patch_status),
+            ('merged', patch_merged_at),
+            ('owner', patch_user),
+            ('subject', patch_title),
+            ('project', project),
+            ('link', patch_link),
+        ],
+        timestamp=time_convert(patch['created'], nano=True)).encode('utf-8')
+
+
+def collect(host, projects, pages=1, session=None):
+    lines = []
+    for project, changes in get_projects_data(host, projects, pages,
+                                              session=session).items():
+        lines.extend(pretty_print(c, host, project,
+                                  session=session).decode('UTF8')
+                     for c in changes)
+    return lines
 
 
 def main():
@@ -123,18 +159,14 @@ def main():
     parser.add_argument(
         '--host', default="https://review.opendev.org",
         help="(default: %(default)s)")
-    parser.add_argument('--project', help='Project name in Gerrit'
-                        '(including "openstack/")')
+    parser.add_argument('--project', action='append', required=True,
+                        help='Project name in Gerrit'
+                        '(including "openstack/"), can be repeated')
     parser.add_argument(
         '--pages', type=int, default=1, help='How many pages of 50 changes')
     args = parser.parse_args()
 
-    changes = get_gerrit_data(args.host, args.project, args.pages)
-    if changes:
-        patches = [pretty_print(c, args.host, args.project).decode(
-            'UTF8') for c in changes]
-        for p in patches:
-            print(p)
+    influx_lines.write_lines(collect(args.host, args.project, args.pages))
 
 
 if __name__ == '__main__':
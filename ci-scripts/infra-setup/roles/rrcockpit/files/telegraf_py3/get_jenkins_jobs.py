@@ -1,20 +1,32 @@
 #!/usr/bin/python3
 
 import click
+import influx_lines
 import requests
 
 
-def request_data(jenkins_url):
+def request_data(jenkins_url, session=None):
     jenkins_query = ("?tree=jobs[name,builds[fullDisplayName,id,url,"
                      + "logs,number,timestamp,duration,result]]"
                      + "&xpath=/hudson/job/build"
                      + "[count(result)=0]&wrapper=builds")
 
-    r = requests.get(jenkins_url + "/api/json" + jenkins_query, verify=False)
+    r = (session or requests).get(jenkins_url + "/api/json" + jenkins_query,
+                                  verify=False)
     return r
 
 
 def print_data(data, release, name_filter):
+    influx_lines.write_lines(get_lines(data, release, name_filter))
+
+
+def collect(jenkins_url, release="master", name_filter="tripleo-quickstart",
+            session=None):
+    return list(get_lines(request_data(jenkins_url, session=session),
+                          release, name_filter))
+
+
+def get_lines(data, release, name_filter):
 
     jobs = data.json()['jobs']
 
@@ -32,24 +44,19 @@ def print_data(data, release, name_filter):
                         b['result_int'] = int(0)
                     # convert milliseconds to seconds
                     b['duration'] = round(int(b['duration']) / 1000)
-                    print(('jenkins,'
-                           'job_name={},build_id="{}",'
-                           'duration={},result="{}",'
-                           'url="{}" result="{}",'
-                           'url="{}",build_id="{}",'
-                           'result_int={},'
-                           'duration={} {}').
-                          format(job_name,
-                                 b['id'],
-                                 b['duration'],
-                                 b['result'],
-                                 b['url'],
-                                 b['result'],
-                                 b['url'],
-                                 b['id'],
-                                 b['result_int'],
-                                 b['duration'],
-                                 b['timestamp']))
+                    yield influx_lines.point(
+                        'jenkins',
+                        tags=[('job_name', job_name),
+                              ('build_id', b['id']),
+                              ('duration', b['duration']),
+                              ('result', b['result']),
+                              ('url', b['url'])],
+                        fields=[('result', b['result']),
+                                ('url', b['url']),
+                                ('build_id', b['id']),
+                                ('result_int', b['result_int']),
+                                ('duration', b['duration'])],
+                        timestamp=b['timestamp'])
 
 
 @click.command()
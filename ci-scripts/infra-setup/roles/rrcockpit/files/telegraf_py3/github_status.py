@@ -1,26 +1,34 @@
 #!/usr/bin/env python
 
+import influx_lines
 import requests
 from influxdb_utils import format_ts_from_str
 
-INFLUXDB_LINE = 'github-status message="{}",status="{}",status_enum={} {}'
+STATUS_URL = "https://kctbh9vrtdwd.statuspage.io/api/v2/status.json"
 STATUS_MAPPING = {'none': 0, 'minor': -1, 'major': -2, 'critical': -3}
 
 # ISO 8601
 TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%S.%fZ'
 
 
-def main():
-    r = requests.get("https://kctbh9vrtdwd.statuspage.io/api/v2/status.json")
+def collect(session=None):
+    r = (session or requests).get(STATUS_URL)
     if r.ok:
         message = r.json()
         if message:
-            print(INFLUXDB_LINE.format(
-                message['status']['description'],
-                message['status']['indicator'],
-                STATUS_MAPPING[message['status']['indicator']],
-                format_ts_from_str(message['page']['updated_at'],
-                                   TIMESTAMP_FORMAT)))
+            return [influx_lines.point(
+                'github-status',
+                fields=[('message', message['status']['description']),
+                        ('status', message['status']['indicator']),
+                        ('status_enum',
+                         STATUS_MAPPING[message['status']['indicator']])],
+                timestamp=format_ts_from_str(message['page']['updated_at'],
+                                             TIMESTAMP_FORMAT))]
+    return []
+
+
+def main():
+    influx_lines.write_lines(collect())
 
 
 if __name__ == '__main__':
@@ -0,0 +1,92 @@
+"""
+Revalidation cache for the files the collectors download over and over,
+like the promoter configurations and the criteria files.
+The validators (ETag, Last-Modified) and the content of each url are stored
+in a directory, the next downloads send If-None-Match/If-Modified-Since and
+reuse the stored content when the server answers 304 Not Modified.
+The layout of the directory is the one of the DiskCache of the promoter
+(ci-scripts/dlrnapi_promoter/http_session.py), so the same directory can be
+shared by the promoter and the collectors.
+Nothing is evicted from the directory, so the cache is only used for the
+few files passed explicitly, and only when HTTP_CACHE_DIR is set.
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+
+import requests
+
+# Empty by default: no file is cached
+CACHE_DIR = os.environ.get('HTTP_CACHE_DIR', '')
+# Bigger files are not worth keeping
+CACHE_MAX_SIZE = 4 * 1024 * 1024
+
+
+def get_path(url, cache_dir=CACHE_DIR):
+    return os.path.join(cache_dir, hashlib.sha256(url.encode()).hexdigest())
+
+
+def load(url, cache_dir=CACHE_DIR):
+    """
+    :return: A tuple (validators dict, content bytes), None if the url is
+    not in the cache
+    """
+    try:
+        with open(get_path(url, cache_dir), 'rb') as cache_file:
+            header = json.loads(cache_file.readline().decode())
+            content = cache_file.read()
+    except (OSError, ValueError):
+        return None
+    if header.get('url') != url:
+        return None
+    return header['validators'], content
+
+
+def save(url, validators, content, cache_dir=CACHE_DIR):
+    """
+    Stores a url in the cache, replacing atomically the previous entry.
+    The cache is only an optimization, errors are logged and ignored
+    """
+    header = json.dumps({'url': url, 'validators': validators})
+    tmp_path = None
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir, prefix='.tmp')
+        with os.fdopen(fd, 'wb') as cache_file:
+            cache_file.write(header.encode() + b"\n")
+            cache_file.write(content)
+        os.replace(tmp_path, get_path(url, cache_dir))
+    except OSError as err:
+        logging.warning("Unable to store %s in the http cache: %s", url, err)
+        if tmp_path is not None and os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+
+
+def get_text(url, cache_dir=None, session=None, **kwargs):
+    """
+    Downloads a text file, revalidating the copy stored in the cache
+    :param url: The url of the file
+    :param cache_dir: The directory of the cache, default none
+    :param session: The requests session to use, default none
+    :param kwargs: Passed to requests.get, like verify or timeout
+    :return: The content of the file, as a string. Raises
+    requests.exceptions.RequestException if the download fails
+    """
+    cached = load(url, cache_dir) if cache_dir else None
+    headers = dict(cached[0]) if cached else {}
+    response = (session or requests).get(url, headers=headers, **kwargs)
+    if cached and response.status_code == 304:
+        logging.debug("Not modified, using the cached %s", url)
+        return cached[1].decode('utf-8')
+    response.raise_for_status()
+
+    validators = {}
+    if response.headers.get('ETag'):
+        validators['If-None-Match'] = response.headers['ETag']
+    if response.headers.get('Last-Modified'):
+        validators['If-Modified-Since'] = response.headers['Last-Modified']
+    if cache_dir and validators and len(response.content) <= CACHE_MAX_SIZE:
+        save(url, validators, response.content, cache_dir)
+    return response.text
@@ -0,0 +1,140 @@
+"""
+InfluxDB line protocol [1] shared by the collectors.
+
+point() builds a line escaping the measurement, the tags and the fields, so
+commas, spaces, equal signs and quotes in job names, titles or urls don't
+break the line. The lines are written by a writer: by default to stdout,
+for the telegraf exec inputs, or, when INFLUXDB_WRITE_URL is set, straight
+to InfluxDB in gzip compressed batches.
+
+Numbers are written without the integer suffix, so they keep being stored
+as floats like the lines written before this module.
+
+[1] https://docs.influxdata.com/influxdb/v1.8/write_protocols/
+"""
+import gzip
+import os
+import sys
+
+import requests
+
+MEASUREMENT_ESCAPES = str.maketrans({',': '\\,', ' ': '\\ ',
+                                     '\n': '\\ '})
+KEY_ESCAPES = str.maketrans({',': '\\,', '=': '\\=', ' ': '\\ ',
+                             '\n': '\\ '})
+STRING_ESCAPES = str.maketrans({'"': '\\"', '\\': '\\\\', '\n': '\\n'})
+
+# e.g. http://influxdb:8086/write?db=telegraf
+WRITE_URL = os.environ.get('INFLUXDB_WRITE_URL')
+BATCH_SIZE = 5000
+
+
+def format_field(value):
+    # bool first, it's a subclass of int
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, (int, float)):
+        return repr(value)
+    return '"{}"'.format(str(value).translate(STRING_ESCAPES))
+
+
+def point(measurement, tags=None, fields=None, timestamp=None):
+    """
+    Builds a line. The tags and the fields are dicts or lists of pairs,
+    written in their order. The tags with None or empty values and the
+    fields with None values are left out, as the protocol has no null
+    :param measurement: The measurement name
+    :param tags: The tags, their values are written as strings
+    :param fields: The fields, strings are quoted, numbers and booleans
+    are not. At least one is needed
+    :param timestamp: Optional timestamp, in nanoseconds
+    :return: The line, without the newline
+    """
+    if hasattr(tags, 'items'):
+        tags = tags.items()
+    if hasattr(fields, 'items'):
+        fields = fields.items()
+    line = [measurement.translate(MEASUREMENT_ESCAPES)]
+    for key, value in tags or ():
+        if value is None or value == '':
+            continue
+        line.append(',{}={}'.format(key.translate(KEY_ESCAPES),
+                                    str(value).translate(KEY_ESCAPES)))
+    line.append(' ')
+    line.append(','.join(
+        '{}={}'.format(key.translate(KEY_ESCAPES), format_field(value))
+        for key, value in fields or () if value is not None))
+    if timestamp is not None:
+        line.append(' {}'.format(timestamp))
+    return ''.join(line)
+
+
+class StdoutWriter(object):
+    """Writes the lines to stdout, for the telegraf exec inputs"""
+
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+
+    def write(self, line):
+        self.stream.write(line + '\n')
+
+    def flush(self):
+        self.stream.flush()
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class HttpWriter(StdoutWriter):
+    """
+    Sends the lines to the InfluxDB write api in gzip compressed batches
+    of batch_size lines
+    """
+
+    def __init__(self, write_url, batch_size=BATCH_SIZE, timeout=30,
+                 session=None):
+        self.write_url = write_url
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.session = session or requests.Session()
+        self.lines = []
+
+    def write(self, line):
+        self.lines.append(line)
+        if len(self.lines) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.lines:
+            return
+        body = gzip.compress('\n'.join(self.lines).encode('utf-8'))
+        self.lines = []
+        response = self.session.post(
+            self.write_url, data=body, timeout=self.timeout,
+            headers={'Content-Encoding': 'gzip',
+                     'Content-Type': 'text/plain; charset=utf-8'})
+        response.raise_for_status()
+
+
+def open_writer(write_url=WRITE_URL, **kwargs):
+    """
+    :param write_url: The InfluxDB write url, with the database, None to
+    write to stdout
+    :return: A writer, to be closed or used as a context manager
+    """
+    if write_url:
+        return HttpWriter(write_url, **kwargs)
+    return StdoutWriter()
+
+
+def write_lines(lines, write_url=WRITE_URL):
+    """Writes all the lines with the writer of open_writer()"""
+    with open_writer(write_url) as writer:
+        for line in lines:
+            writer.write(line)
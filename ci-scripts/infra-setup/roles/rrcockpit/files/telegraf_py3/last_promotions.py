@@ -4,21 +4,13 @@ import argparse
 from datetime import datetime
 
 import dlrnapi_client
+import influx_lines
 import promoter_utils
 from influxdb_utils import format_ts_from_float, format_ts_from_last_modified
 
-PROMOTION_INFLUXDB_LINE = ("dlrn-promotion,"
-                           "release={release},distro={distro},"
-                           "name={promote_name} "
-                           "commit_hash=\"{commit_hash}\","
-                           "distro_hash=\"{distro_hash}\","
-                           "repo_hash=\"{repo_hash}\","
-                           "repo_url=\"{repo_url}\","
-                           "consistent_date={consistent_date},"
-                           "promotion_details=\"{promotion_details}\","
-                           "component=\"{component}\","
-                           "extended_hash=\"{extended_hash}\" "
-                           "{timestamp}")
+PROMOTION_FIELDS = ['commit_hash', 'distro_hash', 'repo_hash', 'repo_url',
+                    'consistent_date', 'promotion_details', 'component',
+                    'extended_hash']
 
 DEFAULT_PROMOTER_BASE_URL = (
     "https://raw.githubusercontent.com/rdo-infra/ci-config/master"
@@ -26,10 +18,14 @@ DEFAULT_PROMOTER_BASE_URL = (
 
 
 def influxdb(promotion):
-    if 'extended_hash' not in promotion.keys():
-        promotion['extended_hash'] = None
     promotion['timestamp'] = format_ts_from_float(promotion['timestamp'])
-    return PROMOTION_INFLUXDB_LINE.format(**promotion)
+    return influx_lines.point(
+        'dlrn-promotion',
+        tags=[('release', promotion['release']),
+              ('distro', promotion['distro']),
+              ('name', promotion['promote_name'])],
+        fields=[(field, promotion.get(field)) for field in PROMOTION_FIELDS],
+        timestamp=promotion['timestamp'])
 
 
 def get_dlrn_client(url, release, distro, component):
@@ -166,8 +162,8 @@ if __name__ == '__main__':
             promotions.append(promo)
 
     if not args.human:
-        for promotion in promotions:
-            print(influxdb(promotion))
+        influx_lines.write_lines(
+            influxdb(promotion) for promotion in promotions)
     else:
         for pr in promotions:
             delin = " ============ "
@@ -1,4 +1,5 @@
 import dlrnapi_client
+import http_cache
 import requests
 import yaml
 
@@ -15,11 +16,10 @@ def get_promoter_config(base_url, release, distro, component):
 
     url_template = base_url.rstrip('/') + tail
     url = url_template.format(distro, release)
-    response = requests.get(url)
-
-    if response.ok:
-        config = yaml.load(response.text, Loader=yaml.FullLoader)
-    else:
+    try:
+        text = http_cache.get_text(url, cache_dir=http_cache.CACHE_DIR)
+        config = yaml.load(text, Loader=yaml.FullLoader)
+    except requests.exceptions.RequestException:
         raise Exception(
             'Unable to fetch promoter configuration from {}'.format(url)
         )
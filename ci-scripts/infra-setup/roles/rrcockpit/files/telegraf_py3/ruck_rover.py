@@ -4,11 +4,13 @@ import csv
 import logging
 import os
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from io import StringIO
 
 import click
 import dlrnapi_client
+import http_cache
 import requests
 import yaml
 from click.exceptions import BadParameter
@@ -58,6 +60,9 @@ ZUUL_JOB_HISTORY_THRESHOLD = 5
 
 PROMOTIONS_LIMIT = 1
 
+# Components and promotions looked up at the same time
+WORKERS = 8
+
 UPSTREAM_API_URL = "https://trunk.rdoproject.org/api-{system}-{release}"
 UPSTREAM_CRITERIA_URL = (
     "https://raw.githubusercontent.com/rdo-infra/rdo-jobs/master/"
@@ -91,22 +96,45 @@ class AttributeDict(dict):
                 else AttributeDict(self[name]))
 
 
-def web_scrape(url):
+def create_session():
+    """
+    The session shared by the lookups of a run, with a keep-alive
+    connection per worker
+    """
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=WORKERS,
+                                            pool_maxsize=WORKERS)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def get_api_instance(api_url):
+    """
+    A DLRN API client, it can be shared by the lookups of a run
+    """
+    api_client = dlrnapi_client.ApiClient(host=api_url,
+                                          auth_method="kerberosAuth",
+                                          force_auth=True)
+    return dlrnapi_client.DefaultApi(api_client)
+
+
+def web_scrape(url, session=None, cache_dir=None):
     logging.debug("Fetching url: %s", url)
     try:
-        response = requests.get(url, verify=CERT_PATH)
-        response.raise_for_status()
+        text = http_cache.get_text(url, cache_dir=cache_dir, session=session,
+                                   verify=CERT_PATH)
     except (requests.exceptions.HTTPError,
             requests.exceptions.RequestException) as err:
         raise SystemExit(err)
 
     logging.debug("Fetched url: %s", url)
-    return response.text
+    return text
 
 
-def url_response_in_yaml(url):
+def url_response_in_yaml(url, session=None, cache_dir=None):
     logging.debug("Fetching URL: %s", url)
-    text_response = web_scrape(url)
+    text_response = web_scrape(url, session=session, cache_dir=cache_dir)
     processed_data = yaml.safe_load(text_response)
 
     logging.debug("Return processed data")
@@ -156,7 +184,8 @@ def get_diff(control_tag, file1, test_tag, file2):
         return table
 
 
-def get_dlrn_promotions(api_url, promotion_name, component=None):
+def get_dlrn_promotions(api_url, promotion_name, component=None,
+                        api_instance=None):
     """
     This function gets latest promotion line details [1][2].
 
@@ -177,6 +206,8 @@ def get_dlrn_promotions(api_url, promotion_name, component=None):
     :param api_url (str): The DLRN API endpoint for the release.
     :param promotion_name (str): Promotion name for a line.
     :param component (str) [optional]: Component to be fetched.
+    :param api_instance (object) [optional]: The API client to use, default
+        a new one.
     :return pr (object): Response from API.
 
     [1]: https://github.com/softwarefactory-project/dlrnapi_client/
@@ -184,10 +215,7 @@ def get_dlrn_promotions(api_url, promotion_name, component=None):
     [2]: https://dlrn.readthedocs.io/en/latest/api.html#get-api-promotions
     """
     logging.debug("Getting promotion %s for %s", promotion_name, api_url)
-    api_client = dlrnapi_client.ApiClient(host=api_url,
-                                          auth_method="kerberosAuth",
-                                          force_auth=True)
-    api_instance = dlrnapi_client.DefaultApi(api_client)
+    api_instance = api_instance or get_api_instance(api_url)
     query = dlrnapi_client.PromotionQuery(
         promote_name=promotion_name,
         component=component,
@@ -198,7 +226,8 @@ def get_dlrn_promotions(api_url, promotion_name, component=None):
 
 
 def find_results_from_dlrn_repo_status(api_url, commit_hash,
-                                       distro_hash, extended_hash):
+                                       distro_hash, extended_hash,
+                                       api_instance=None):
     """ This function returns api_response from dlrn for a particular
         commit_hash, distro_hash, extended_hash.
         https://github.com/softwarefactory-project/dlrnapi_client/blob/master/
@@ -211,13 +240,11 @@ def find_results_from_dlrn_repo_status(api_url, commit_hash,
          info.
         :param extended_hash: For a particular repo, commit.yaml contains this
          info.
+        :param api_instance: The API client to use, default a new one
         :return api_response: from dlrnapi server containing result of
          passing/failing jobs
     """
-    api_client = dlrnapi_client.ApiClient(host=api_url,
-                                          auth_method="kerberosAuth",
-                                          force_auth=True)
-    api_instance = dlrnapi_client.DefaultApi(api_client)
+    api_instance = api_instance or get_api_instance(api_url)
     params = dlrnapi_client.Params2(commit_hash=commit_hash,
                                     distro_hash=distro_hash,
                                     extended_hash=extended_hash)
@@ -269,11 +296,12 @@ def get_dlrn_results(api_response):
     return jobs
 
 
-def get_job_history(jobs, url):
+def get_job_history(jobs, url, session=None):
     """Fetch jobs history from provided URL.
 
     :param jobs (set): Set of job names
     :param url (str): URL to fetch job history from.
+    :param session (object) [optional]: requests session to use.
     :return history (dict): Summary of history for all jobs.
     """
     if not jobs:
@@ -283,7 +311,7 @@ def get_job_history(jobs, url):
         return {}
 
     logging.debug("Fetching jobs history")
-    response = requests.get(
+    response = (session or requests).get(
         url,
         params={
             'job_name': jobs,
@@ -458,17 +486,14 @@ def render_component_yaml(jobs, testproject_url):
     print(output)
 
 
-def render_tables(jobs, timestamp, under_test_url, component,
-                  components, api_response, pkg_diff, test_hash,
-                  periodic_builds_url, testproject_url):
+def classify_jobs(jobs):
     """
     jobs_to_promote are any job that hasn't registered
     success w/ dlrn. jobs_pending are any jobs in pending.
-    We only want test project config for jobs that have completed.
-    execute if there are failing jobs in criteria and if
-    you are only looking at one component and not all components
-    """
 
+    :param jobs (list of dicts): Jobs, as returned by prepare_jobs.
+    :return (tuple of sets): passed, failed, no_result and to_promote jobs.
+    """
     passed = set(k['job_name'] for k in jobs if k['status'] == INFLUX_PASSED)
     failed = set(k['job_name'] for k in jobs if k['status'] == INFLUX_FAILED)
     no_result = set(
@@ -487,6 +512,23 @@ def render_tables(jobs, timestamp, under_test_url, component,
             to_promote.remove(job_to_promote)
             in_criteria.update(alt_criteria_passed)
 
+    return passed, failed, no_result, to_promote
+
+
+def render_tables(jobs, timestamp, under_test_url, component,
+                  components, api_response, pkg_diff, test_hash,
+                  periodic_builds_url, testproject_url,
+                  periodic_history=None):
+    """
+    We only want test project config for jobs that have completed.
+    execute if there are failing jobs in criteria and if
+    you are only looking at one component and not all components
+
+    periodic_history is the job history of the jobs to promote, when it
+    was already fetched, by default it is fetched from periodic_builds_url
+    """
+    passed, failed, no_result, to_promote = classify_jobs(jobs)
+
     if failed:
         status = "Red"
     elif not to_promote:
@@ -507,7 +549,8 @@ def render_tables(jobs, timestamp, under_test_url, component,
     print_a_set_in_table(failed, "Jobs which failed:")
     print_a_set_in_table(no_result, "Pending running jobs")
 
-    periodic_history = get_job_history(to_promote, periodic_builds_url)
+    if periodic_history is None:
+        periodic_history = get_job_history(to_promote, periodic_builds_url)
 
     print_failed_in_criteria(periodic_history)
 
@@ -562,6 +605,53 @@ def get_package_diff(base_url, component, promotion_name, aggregate_hash):
     return components, diff
 
 
+def fetch_component(component, api_url, base_url, criteria,
+                    periodic_builds_url, api_instance=None, session=None):
+    """
+    Fetches everything render_tables needs for a component: its commit.yaml,
+    its DLRN results and promotion and the history of its jobs to promote.
+
+    :return (dict): The render_tables arguments of the component.
+    """
+    logging.debug("Fetching component: %s data", component)
+
+    component_url = COMPONENT_COMMIT_URL.format(
+        url=base_url, component=component)
+    component_criteria = url_response_in_yaml(component_url, session=session)
+
+    commit_hash, distro_hash, extended_hash = fetch_hashes_from_commit_yaml(
+        component_criteria)
+    api_response = find_results_from_dlrn_repo_status(
+        api_url, commit_hash, distro_hash, extended_hash,
+        api_instance=api_instance)
+
+    promotion = get_dlrn_promotions(
+        api_url, "promoted-components", component, api_instance=api_instance)
+    timestamp = datetime.utcfromtimestamp(promotion.timestamp)
+
+    under_test_url = COMPONENT_TEST_URL.format(
+        url=api_url, commit_hash=commit_hash, distro_hash=distro_hash)
+
+    jobs_in_criteria = set(criteria['promoted-components'].get(
+        component, []))
+
+    dlrn_jobs = get_dlrn_results(api_response)
+    jobs = prepare_jobs(jobs_in_criteria, {}, dlrn_jobs)
+    to_promote = classify_jobs(jobs)[3]
+    periodic_history = get_job_history(to_promote, periodic_builds_url,
+                                       session=session)
+    logging.debug("Fetched component: %s data", component)
+
+    return {
+        'jobs': jobs,
+        'timestamp': timestamp,
+        'under_test_url': under_test_url,
+        'api_response': api_response,
+        'test_hash': commit_hash,
+        'periodic_history': periodic_history,
+    }
+
+
 def track_component_promotion(
         api_url, base_url, criteria, periodic_builds_url, testproject_url,
         promotion_name, aggregate_hash, test_component):
@@ -570,37 +660,25 @@ def track_component_promotion(
     components, pkg_diff = get_package_diff(
         base_url, test_component, promotion_name, aggregate_hash)
 
-    for component in components:
-        logging.debug("Fetching component: %s data", component)
-
-        component_url = COMPONENT_COMMIT_URL.format(
-            url=base_url, component=component)
-        component_criteria = url_response_in_yaml(component_url)
-
-        commit_hash, distro_hash, extended_hash = fetch_hashes_from_commit_yaml(
-            component_criteria)
-        api_response = find_results_from_dlrn_repo_status(
-            api_url, commit_hash, distro_hash, extended_hash)
-
-        promotion = get_dlrn_promotions(
-            api_url, "promoted-components", component)
-        timestamp = datetime.utcfromtimestamp(promotion.timestamp)
-
-        test_hash = commit_hash
-        under_test_url = COMPONENT_TEST_URL.format(
-            url=api_url, commit_hash=commit_hash, distro_hash=distro_hash)
-
-        jobs_in_criteria = set(criteria['promoted-components'].get(
-            component, []))
-
-        dlrn_jobs = get_dlrn_results(api_response)
-        jobs = prepare_jobs(jobs_in_criteria, {}, dlrn_jobs)
-
-        render_tables(
-            jobs, timestamp, under_test_url, component,
-            components, api_response, pkg_diff, test_hash,
-            periodic_builds_url, testproject_url)
-        logging.debug("Finished component: %s data", component)
+    # The components are fetched at the same time, with one DLRN API client
+    # and one session, and each is rendered as soon as it and the ones
+    # before it are fetched, so the output keeps the components order
+    api_instance = get_api_instance(api_url)
+    session = create_session()
+    with ThreadPoolExecutor(max_workers=WORKERS) as executor:
+        results = executor.map(
+            lambda component: fetch_component(
+                component, api_url, base_url, criteria, periodic_builds_url,
+                api_instance=api_instance, session=session),
+            components)
+        for component, result in zip(components, results):
+            render_tables(
+                result['jobs'], result['timestamp'],
+                result['under_test_url'], component, components,
+                result['api_response'], pkg_diff, result['test_hash'],
+                periodic_builds_url, testproject_url,
+                periodic_history=result['periodic_history'])
+            logging.debug("Finished component: %s data", component)
 
     logging.debug("Finshed component track")
 
@@ -624,12 +702,16 @@ def integration(api_instance, promote_name, jobs_in_criteria,
         promote_name=promote_name, limit=PROMOTIONS_LIMIT)
     promotions = api_instance.api_promotions_get(params)
 
-    results = {}
-    for promotion in promotions:
-        params = dlrnapi_client.AggQuery(
-            aggregate_hash=promotion.aggregate_hash)
-        aggregate = api_instance.api_agg_status_get(params)
+    # The aggregates of the promotions are fetched at the same time
+    with ThreadPoolExecutor(max_workers=WORKERS) as executor:
+        aggregates = list(executor.map(
+            lambda promotion: api_instance.api_agg_status_get(
+                dlrnapi_client.AggQuery(
+                    aggregate_hash=promotion.aggregate_hash)),
+            promotions))
 
+    results = {}
+    for promotion, aggregate in zip(promotions, aggregates):
         dlrn_jobs = get_dlrn_results(aggregate)
         jobs = prepare_jobs(jobs_in_criteria, jobs_alt_criteria, dlrn_jobs)
 
@@ -642,7 +724,8 @@ def integration(api_instance, promote_name, jobs_in_criteria,
 
 
 def downstream_integration(system, release):
-    config = yaml.safe_load(web_scrape(DOWNSTREAM_CRITERIA_URL))
+    config = yaml.safe_load(
+        web_scrape(DOWNSTREAM_CRITERIA_URL, cache_dir=http_cache.CACHE_DIR))
 
     logging.debug("Configure DLRN API for downstream")
     dlrnapi_client.configuration.ssl_ca_cert = CERT_PATH
@@ -651,7 +734,8 @@ def downstream_integration(system, release):
 
     url = config['downstream']['criteria'][system][release]['int_url']
     logging.debug("Downstream Integration URL: %s", url)
-    criteria = yaml.safe_load(web_scrape(url))
+    criteria = yaml.safe_load(
+        web_scrape(url, cache_dir=http_cache.CACHE_DIR))
 
     jobs_in_criteria = set(
         criteria['promotions'][DOWNSTREAM_PROMOTE_NAME]['criteria'])
@@ -673,7 +757,7 @@ def downstream_integration(system, release):
 
 def upstream_proxy(release, system, *_args, **_kwargs):
     url = UPSTREAM_CRITERIA_URL.format(system=system, release=release)
-    config = yaml.safe_load(web_scrape(url))
+    config = yaml.safe_load(web_scrape(url, cache_dir=http_cache.CACHE_DIR))
     jobs_in_criteria = config[UPSTREAM_PROMOTE_NAME]
 
     host = UPSTREAM_API_URL.format(system=system, release=release)
@@ -690,7 +774,8 @@ def upstream_proxy(release, system, *_args, **_kwargs):
 
 
 def downstream(release, distro, promotion_name, aggregate_hash, component):
-    config = yaml.safe_load(web_scrape(DOWNSTREAM_CRITERIA_URL))
+    config = yaml.safe_load(
+        web_scrape(DOWNSTREAM_CRITERIA_URL, cache_dir=http_cache.CACHE_DIR))
     krb_principal = config['downstream']['dlrnapi_krb_principal']
 
     dlrnapi_client.configuration.ssl_ca_cert = CERT_PATH
@@ -701,7 +786,7 @@ def downstream(release, distro, promotion_name, aggregate_hash, component):
 
     if component:
         url = config['downstream']['criteria'][distro][release]['comp_url']
-        criteria = url_response_in_yaml(url)
+        criteria = url_response_in_yaml(url, cache_dir=http_cache.CACHE_DIR)
         criteria = AttributeDict(criteria)
 
         promotion_name = "current-tripleo"
@@ -715,7 +800,7 @@ def downstream(release, distro, promotion_name, aggregate_hash, component):
         # NOTE(dasm): It is a temporary workaround
         # TODO(dasm): Change the way how packages are compared
         url = config['downstream']['criteria'][distro][release]['int_url']
-        criteria = url_response_in_yaml(url)
+        criteria = url_response_in_yaml(url, cache_dir=http_cache.CACHE_DIR)
         _, pkg_diff = get_package_diff(
             criteria['base_url'], None,
             DOWNSTREAM_PROMOTE_NAME, DOWNSTREAM_TESTING_NAME)
@@ -2,6 +2,7 @@
 import argparse
 from datetime import datetime
 
+import influx_lines
 import requests
 from diskcache import Cache
 
@@ -11,19 +12,19 @@ cache = Cache('/tmp/storyboard_cache', size_limit=CACHE_SIZE)
 cache.expire()
 
 
-def get_storyboard_data(host, project, status, limit):
+def get_storyboard_data(host, project, status, limit, session=None):
     url = ("%s/api/v1/stories?"
            "limit=%s&project_id=%s&sort_dir=desc&status=%s") % (
         host, limit, project, status)
-    data = requests.get(url)
+    data = (session or requests).get(url)
     if data.ok:
         return data.json()
 
 
-def get_username(host, uid):
+def get_username(host, uid, session=None):
     if uid in cache:
         return cache[uid]
-    user = requests.get("%s/api/v1/users/%s" % (host, uid))
+    user = (session or requests).get("%s/api/v1/users/%s" % (host, uid))
     if user.ok:
         data = user.json()
         username = data.get('full_name')
@@ -37,57 +38,40 @@ def time_convert(t, nano=True):
         '000000000' if nano else '')
 
 
-def influx_esc(s):
-    s = s.replace('"', '\\"')
-    s = s.replace(',', '\\,')
-    s = s.replace("'", '\\"')
-    s = s.replace(" ", '\\ ')
-    return s
-
-
-def extract_story(story, host):
+def extract_story(story, host, session=None):
     sid = story['id']
     s_created = time_convert(story['created_at'], nano=False)
     s_updated = time_convert(story['updated_at'], nano=False)
-    s_user = get_username(host, story['creator_id'])
-    s_title = story['title'].replace('"', "'").replace(',', ' ')
+    s_user = get_username(host, story['creator_id'], session=session)
+    s_title = story['title']
     s_current = "-".join(
         [i['key'] for i in story['task_statuses'] if i['count']])
     s_not_started = s_current == 'todo'
     s_link = "<a href='%s/#!/story/%s' target=_blank>%s</a>" % (
         host, sid, s_title)
-    return ('story,'
-            'id=%s,'
-            'created=%s,'
-            'updated=%s,'
-            'user=%s,'
-            'current=%s'
-            ' '
-            'id=%s,'
-            'created=%s,'
-            'updated=%s,'
-            'user="%s",'
-            'title="%s",'
-            'current="%s",'
-            'not_started=%s,'
-            'link="%s"'
-            ' '
-            '%s' % (
-                sid,
-                s_created,
-                s_updated,
-                influx_esc(s_user),
-                s_current,
-                sid,
-                s_created + "000",
-                s_updated + "000",
-                s_user,
-                s_title,
-                s_current,
-                s_not_started,
-                s_link,
-                time_convert(story['created_at'], nano=True)
-            ))
+    return influx_lines.point(
+        'story',
+        tags=[('id', sid),
+              ('created', s_created),
+              ('updated', s_updated),
+              ('user', s_user),
+              ('current', s_current)],
+        fields=[('id', sid),
+                ('created', int(s_created + "000")),
+                ('updated', int(s_updated + "000")),
+                ('user', s_user),
+                ('title', s_title),
+                ('current', s_current),
+                ('not_started', s_not_started),
+                ('link', s_link)],
+        timestamp=time_convert(story['created_at'], nano=True))
+
+
+def collect(host, project_id, story_status='active', limit=10, session=None):
+    stories_json = get_storyboard_data(host, project_id, story_status, limit,
+                                       session=session)
+    return [extract_story(story, host, session=session)
+            for story in stories_json or []]
 
 
 def main():
@@ -104,12 +88,8 @@ def main():
                         help='Limit stories to specific number')
     args = parser.parse_args()
 
-    stories_json = get_storyboard_data(args.host, args.project_id,
-                                       args.story_status, args.limit)
-    if stories_json:
-        stories = [extract_story(story, args.host) for story in stories_json]
-        for s in stories:
-            print(s)
+    influx_lines.write_lines(collect(args.host, args.project_id,
+                                     args.story_status, args.limit))
 
 
 if __name__ == '__main__':
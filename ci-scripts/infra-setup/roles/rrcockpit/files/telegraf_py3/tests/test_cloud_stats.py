@@ -0,0 +1,100 @@
+# pylint: disable=C0413
+
+import datetime
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cloud_stats  # noqa
+from openstack.compute.v2.flavor import Flavor  # noqa
+from openstack.compute.v2.server import Server  # noqa
+from openstack.image.v2.image import Image  # noqa
+from openstack.orchestration.v1.stack import Stack  # noqa
+
+
+def server(name, status='ACTIVE', flavor=None, image=None):
+    # The image of a server booted from a volume is an empty string
+    return Server(name=name, status=status, flavor=flavor,
+                  image=image or '')
+
+
+class TestCloudStats(unittest.TestCase):
+
+    def setUp(self):
+        self.servers = [
+            server('upstream-centos-8-rdo-cloud-1',
+                   flavor={'original_name': 'ci.m1.nodepool'}),
+            # Named from the flavors listing
+            server('upstream-centos-8-rdo-cloud-2', status='BUILD',
+                   flavor={'id': 'f1'}),
+            server('upstream-centos-8-2-node-rdo-cloud-3', status='ERROR'),
+            server('bmc-1', image={'id': 'i1'}),
+            server('baremetal-1', image={'id': 'i2'}),
+            server('other-1', status='SHUTOFF'),
+        ]
+        self.flavors = [Flavor(id='f1', name='ci.m1.nodepool')]
+        self.images = [Image(id='i1', name='bmc-template'),
+                       Image(id='i2', name='ipxe-boot')]
+
+    def test_count_servers(self):
+        obtained = cloud_stats.count_servers(
+            self.servers, cloud_stats.CLOUDS['rdocloud'], self.flavors,
+            self.images)
+        self.assertEqual(obtained, {
+            'ACTIVE': 3, 'BUILD': 1, 'ERROR': 1, 'DELETED': 0,
+            'undercloud': 2, 'multinode': 1, 'bmc': 1, 'ovb-node': 1,
+            'other': 1, 'total': 6})
+        vexxhost = cloud_stats.count_servers(
+            self.servers, cloud_stats.CLOUDS['vexxhost'], self.flavors,
+            self.images)
+        self.assertEqual(vexxhost['multinode'], 0)
+        self.assertIsNone(cloud_stats.count_servers(
+            None, cloud_stats.CLOUDS['vexxhost']))
+
+    def test_count_stacks(self):
+        now = datetime.datetime(2021, 3, 12, 12, 0, 0)
+        stacks = [
+            Stack(status='CREATE_COMPLETE', created_at='2021-03-12T11:00:00Z'),
+            Stack(status='CREATE_COMPLETE', created_at='2021-03-12T05:00:00Z'),
+            Stack(status='DELETE_FAILED', created_at='2021-03-11T12:00:00Z'),
+        ]
+        obtained = cloud_stats.count_stacks(stacks, now=now)
+        self.assertEqual(obtained, {
+            'stacks_total': 3, 'create_complete': 2, 'create_failed': 0,
+            'create_in_progress': 0, 'delete_in_progress': 0,
+            'delete_failed': 1, 'delete_complete': 0, 'old_stacks': 2})
+
+    @mock.patch('openstack.connect')
+    def test_collect(self, mock_connect):
+        conn = mock_connect.return_value
+        conn.compute.servers.return_value = iter(self.servers)
+        conn.compute.flavors.return_value = iter(self.flavors)
+        conn.image.images.return_value = iter(self.images)
+        conn.compute.get.return_value.json.return_value = {
+            'limits': {'absolute': {'totalCoresUsed': 8,
+                                    'totalRAMUsed': 16384,
+                                    'totalInstancesUsed': 6}}}
+        conn.block_storage.get.side_effect = Exception("no volume service")
+        conn.network.ips.return_value = iter([{}, {}])
+        conn.network.ports.return_value = iter([{}])
+        conn.orchestration.stacks.return_value = iter([])
+
+        obtained = cloud_stats.collect('mycloud', {
+            'undercloud_flavor': 'ci.m1.nodepool',
+            'undercloud_name': 'rdo-cloud', 'multinode_name': None})
+
+        mock_connect.assert_called_once_with(cloud='mycloud')
+        conn.authorize.assert_called_once_with()
+        conn.network.ports.assert_called_once_with(status='DOWN')
+        lines = obtained.splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[0].startswith(
+            'mycloud-servers ACTIVE=3,BUILD=1,ERROR=1,DELETED=0,'
+            'undercloud=2,multinode=0,'))
+        self.assertRegex(
+            lines[1],
+            r'^mycloud-perf instances=6,cores=8,ram=16384,gigabytes=0,'
+            r'fips=2,ports_down=1 [0-9]+$')
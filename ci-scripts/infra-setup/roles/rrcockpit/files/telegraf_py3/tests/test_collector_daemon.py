@@ -0,0 +1,180 @@
+# pylint: disable=C0413
+
+import inspect
+import json
+import os
+import sys
+import unittest
+from unittest import mock
+from urllib import request
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import collector_daemon  # noqa
+import gerrit_changes  # noqa
+import get_jenkins_jobs  # noqa
+import storyboard  # noqa
+import zuulv3_job_builds  # noqa
+import zuulv3_queues_status  # noqa
+
+
+class TestCollectorDaemon(unittest.TestCase):
+
+    def setUp(self):
+        self.plugin = mock.Mock(return_value=['m x=1', 'm x=2'])
+        patcher = mock.patch.dict(collector_daemon.PLUGINS,
+                                  {'test': self.plugin})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.session = mock.Mock()
+        self.collector = collector_daemon.Collector('test1', 'test', 60,
+                                                    {'url': 'http://a/'})
+        self.daemon = collector_daemon.CollectorDaemon([self.collector],
+                                                       self.session,
+                                                       workers=2,
+                                                       buffer_size=3)
+        self.addCleanup(self.daemon.executor.shutdown)
+
+    def test_run_pending(self):
+        futures = self.daemon.run_pending(now=1000)
+        for future in futures:
+            future.result()
+
+        self.assertEqual(len(futures), 1)
+        self.plugin.assert_called_once_with(self.session, url='http://a/')
+        self.assertEqual(self.collector.next_run, 1060)
+        self.assertEqual(self.collector.last_lines, 2)
+        self.assertFalse(self.collector.running)
+        # Not due yet
+        self.assertEqual(self.daemon.run_pending(now=1030), [])
+
+    def test_run_pending_skips_running(self):
+        self.collector.running = True
+        self.assertEqual(self.daemon.run_pending(now=1000), [])
+        self.assertEqual(self.collector.next_run, 1060)
+        self.plugin.assert_not_called()
+
+    def test_run_keeps_error(self):
+        self.plugin.side_effect = ValueError("broken")
+        self.collector.running = True
+        self.daemon.run(self.collector)
+        self.assertEqual(self.collector.last_error, "broken")
+        self.assertFalse(self.collector.running)
+        self.assertEqual(self.daemon.drain(), [])
+
+    @mock.patch('logging.error')
+    def test_run_timeout(self, mock_error):
+        def lines():
+            yield 'm x=1'
+            self.collector.deadline = 0
+            yield 'm x=2'
+            yield 'm x=3'
+
+        output = lines()
+        self.plugin.return_value = output
+        self.collector.timeout = 5
+        self.collector.running = True
+        self.daemon.run(self.collector)
+        self.assertEqual(self.collector.last_error, "timed out after 5s")
+        self.assertFalse(self.collector.running)
+        self.assertEqual(self.daemon.drain(), [])
+        # The plugin was stopped
+        self.assertEqual(list(output), [])
+        self.assertTrue(mock_error.called)
+
+    @mock.patch('logging.error')
+    @mock.patch('logging.warning')
+    def test_run_pending_logs_timeout(self, mock_warning, mock_error):
+        self.collector.running = True
+        self.collector.deadline = 900
+        self.assertEqual(self.daemon.run_pending(now=1000), [])
+        mock_error.assert_called_once_with(mock.ANY, 'test1', 60)
+
+    @mock.patch('zuulv3_job_builds.collect')
+    def test_zuul_builds_session(self, mock_collect):
+        mock_collect.return_value = []
+        collector_daemon.PLUGINS['zuul_builds'](self.session, url='u')
+        mock_collect.assert_called_once_with(session=self.session, url='u')
+
+    def test_create_session(self):
+        default_session = zuulv3_job_builds.default_session
+        session = collector_daemon.create_session(4, timeout=7)
+        self.addCleanup(session.close)
+        self.assertIs(zuulv3_job_builds.default_session, default_session)
+        with mock.patch('requests.Session.request') as mock_request:
+            session.get('http://a/')
+            session.get('http://a/', timeout=1)
+        self.assertEqual(
+            [call[1]['timeout'] for call in mock_request.call_args_list],
+            [7, 1])
+
+    def test_drain_and_buffer_size(self):
+        self.daemon.add_lines(['a x=1', 'b x=2'])
+        self.daemon.add_lines(['c x=3', 'd x=4'])
+        self.assertEqual(self.daemon.drain(), ['b x=2', 'c x=3', 'd x=4'])
+        self.assertEqual(self.daemon.drain(), [])
+        self.assertEqual(self.daemon.snapshot()['dropped_lines'], 1)
+
+    def test_ack_keeps_new_lines(self):
+        self.daemon.add_lines(['a x=1', 'b x=2'])
+        lines, end_seq = self.daemon.peek()
+        # Added while the response is written, one line is dropped
+        self.daemon.add_lines(['c x=3', 'd x=4'])
+        self.daemon.ack(end_seq)
+        self.assertEqual(lines, ['a x=1', 'b x=2'])
+        self.assertEqual(self.daemon.drain(), ['c x=3', 'd x=4'])
+
+    def test_metrics_kept_when_write_fails(self):
+        server = collector_daemon.MetricsServer(('127.0.0.1', 0),
+                                                self.daemon)
+        self.addCleanup(server.server_close)
+        self.daemon.add_lines(['a x=1'])
+        handler = collector_daemon.MetricsRequestHandler.__new__(
+            collector_daemon.MetricsRequestHandler)
+        handler.server = server
+        handler.path = '/metrics'
+        handler.request_version = 'HTTP/1.1'
+        handler.requestline = 'GET /metrics HTTP/1.1'
+        handler.client_address = ('127.0.0.1', 0)
+        handler.wfile = mock.Mock()
+        handler.wfile.write.side_effect = [None, BrokenPipeError()]
+
+        with self.assertRaises(BrokenPipeError):
+            handler.do_GET()
+        self.assertEqual(self.daemon.drain(), ['a x=1'])
+
+    def test_metrics_server(self):
+        server = collector_daemon.start_metrics_server(self.daemon, 0,
+                                                       '127.0.0.1')
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        base_url = "http://127.0.0.1:{}".format(server.server_address[1])
+        self.daemon.run(self.collector)
+
+        with request.urlopen(base_url + '/metrics') as response:
+            self.assertEqual(response.read(), b'm x=1\nm x=2\n')
+        with request.urlopen(base_url + '/metrics') as response:
+            self.assertEqual(response.read(), b'')
+        with request.urlopen(base_url + '/status') as response:
+            status = json.loads(response.read().decode())
+        self.assertEqual(status['collectors']['test1']['last_lines'], 2)
+        self.assertEqual(status['buffered_lines'], 0)
+
+    def test_load_collectors(self):
+        collectors = collector_daemon.load_collectors(collector_daemon.CONFIG)
+        names = [c.name for c in collectors]
+        self.assertEqual(len(names), len(set(names)))
+        self.assertIn('zuul_builds_upstream', names)
+        timeouts = dict((c.name, c.timeout) for c in collectors)
+        self.assertEqual(timeouts['zuul_builds_upstream'], 803)
+        self.assertEqual(timeouts['zuul_queues'], 30)
+        collect = {'gerrit': gerrit_changes.collect,
+                   'jenkins': get_jenkins_jobs.collect,
+                   'storyboard': storyboard.collect,
+                   'zuul_builds': zuulv3_job_builds.collect,
+                   'zuul_queues': zuulv3_queues_status.collect}
+        for collector in collectors:
+            if collector.plugin in collect:
+                # Raises TypeError on a wrong argument
+                inspect.signature(collect[collector.plugin]).bind(
+                    **collector.args)
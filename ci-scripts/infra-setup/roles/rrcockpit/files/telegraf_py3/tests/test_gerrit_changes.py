@@ -1,9 +1,15 @@
+# pylint: disable=C0413
+
 import json
 import os
+import sys
 import unittest
 
 import mock
-from telegraf_py3 import gerrit_changes
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegraf_py3 import gerrit_changes  # noqa
 
 
 class TestGerritChanges(unittest.TestCase):
@@ -63,3 +69,45 @@ class TestGerritChanges(unittest.TestCase):
         obtained = gerrit_changes.get_gerrit_data(
                 self.host, self.project, self.pages)
         assert (expected == obtained)
+
+    def _mock_page(self, data):
+        return self._mock_response(
+            content=(")]}'\n" + json.dumps(data)).encode())
+
+    @mock.patch('requests.get')
+    def test_get_projects_data(self, mock_get):
+        other = 'openstack/tripleo-ci'
+        responses = {
+            0: self._mock_page([self.data[:30], self.data[30:]]),
+            50: self._mock_page([[self.data[0]], []]),
+            100: self._mock_response(content=b"broken"),
+            150: self._mock_page([[self.data[1]], []]),
+        }
+        mock_get.side_effect = lambda url: responses[
+            int(url.split('&start=')[1])]
+
+        obtained = gerrit_changes.get_projects_data(
+            self.host, [self.project, other], pages=4)
+
+        self.assertEqual(mock_get.call_count, 4)
+        url = mock_get.call_args_list[0][0][0]
+        self.assertIn('q=project:%s+' % self.project, url)
+        self.assertIn('&q=project:%s+' % other, url)
+        self.assertIn('&o=DETAILED_ACCOUNTS&n=50&start=0', url)
+        # The pages after the broken one are ignored
+        self.assertEqual(obtained[self.project],
+                         self.data[:30] + [self.data[0]])
+        self.assertEqual(obtained[other], self.data[30:])
+
+    @mock.patch('requests.get')
+    def test_collect_uses_detailed_accounts(self, mock_get):
+        change = dict(self.data[0], owner={'_account_id': 31552,
+                                           'name': 'Jane Doe'})
+        mock_get.return_value = self._mock_page([change])
+
+        lines = gerrit_changes.collect(self.host, [self.project])
+
+        # Only the changes were requested, not the owner
+        mock_get.assert_called_once()
+        self.assertEqual(len(lines), 1)
+        self.assertIn(',owner=Jane\\ Doe,', lines[0])
@@ -0,0 +1,91 @@
+# pylint: disable=C0413
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+import requests
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import http_cache  # noqa
+
+
+def make_response(status_code, content=b'', headers=None):
+    response = mock.Mock()
+    response.status_code = status_code
+    response.content = content
+    response.text = content.decode()
+    response.headers = headers or {}
+    if status_code >= 400:
+        response.raise_for_status.side_effect = requests.exceptions.HTTPError(
+            status_code)
+    return response
+
+
+class TestHttpCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.url = 'https://example.com/criteria.yaml'
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    @mock.patch('requests.get')
+    def test_get_text_revalidates(self, m_get):
+        m_get.side_effect = [
+            make_response(200, b'release: master\n', {'ETag': '"v1"'}),
+            make_response(304),
+        ]
+        first = http_cache.get_text(self.url, cache_dir=self.cache_dir,
+                                    verify=False)
+        second = http_cache.get_text(self.url, cache_dir=self.cache_dir,
+                                     verify=False)
+
+        self.assertEqual(first, 'release: master\n')
+        self.assertEqual(second, first)
+        m_get.assert_has_calls([
+            mock.call(self.url, headers={}, verify=False),
+            mock.call(self.url, headers={'If-None-Match': '"v1"'},
+                      verify=False),
+        ])
+
+    @mock.patch('requests.get')
+    def test_get_text_replaces_modified(self, m_get):
+        modified = 'Mon, 19 Oct 2026 10:00:00 GMT'
+        http_cache.save(self.url, {'If-Modified-Since': modified}, b'old',
+                        cache_dir=self.cache_dir)
+        m_get.return_value = make_response(200, b'new', {'ETag': '"v2"'})
+
+        obtained = http_cache.get_text(self.url, cache_dir=self.cache_dir)
+
+        self.assertEqual(obtained, 'new')
+        m_get.assert_called_once_with(
+            self.url, headers={'If-Modified-Since': modified})
+        self.assertEqual(http_cache.load(self.url, self.cache_dir),
+                         ({'If-None-Match': '"v2"'}, b'new'))
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+
+    @mock.patch('requests.get')
+    def test_get_text_error(self, m_get):
+        m_get.return_value = make_response(404)
+        with self.assertRaises(requests.exceptions.HTTPError):
+            http_cache.get_text(self.url, cache_dir=self.cache_dir)
+        self.assertIsNone(http_cache.load(self.url, self.cache_dir))
+
+    @mock.patch('http_cache.save')
+    @mock.patch('requests.get')
+    def test_get_text_no_cache_by_default(self, m_get, m_save):
+        m_get.return_value = make_response(200, b'data', {'ETag': '"v1"'})
+        self.assertEqual(http_cache.get_text(self.url), 'data')
+        m_get.assert_called_once_with(self.url, headers={})
+        self.assertFalse(m_save.called)
+
+    def test_load_broken_entry(self):
+        with open(http_cache.get_path(self.url, self.cache_dir), 'wb') as f:
+            f.write(b'not json\ncontent')
+        self.assertIsNone(http_cache.load(self.url, self.cache_dir))
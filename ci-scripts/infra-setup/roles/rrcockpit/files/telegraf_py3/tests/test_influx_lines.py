@@ -0,0 +1,67 @@
+# pylint: disable=C0413
+
+import gzip
+import io
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import influx_lines  # noqa
+
+
+class TestInfluxLines(unittest.TestCase):
+
+    def test_point(self):
+        line = influx_lines.point(
+            'build',
+            tags=[('job_name', 'tox py3, el9'), ('voting', True),
+                  ('change', None), ('empty', '')],
+            fields=[('result', 'SUCCESS'), ('duration', 120),
+                    ('ratio', 0.5), ('passed', False), ('missing', None)],
+            timestamp=1600000000000000000)
+        self.assertEqual(
+            line,
+            'build,job_name=tox\\ py3\\,\\ el9,voting=True '
+            'result="SUCCESS",duration=120,ratio=0.5,passed=false '
+            '1600000000000000000')
+
+    def test_point_escapes(self):
+        line = influx_lines.point(
+            'my measurement', tags={'a=b': 'x=y\nz'},
+            fields={'title': 'Fix "quotes" and C:\\path\nnext',
+                    'link': "<a href='x'>y</a>"})
+        self.assertEqual(
+            line,
+            'my\\ measurement,a\\=b=x\\=y\\ z '
+            'title="Fix \\"quotes\\" and C:\\\\path\\nnext",'
+            'link="<a href=\'x\'>y</a>"')
+
+    def test_stdout_writer(self):
+        stream = io.StringIO()
+        with influx_lines.StdoutWriter(stream) as writer:
+            writer.write('a x=1')
+            writer.write('b x=2')
+        self.assertEqual(stream.getvalue(), 'a x=1\nb x=2\n')
+
+    def test_http_writer_batches(self):
+        session = mock.Mock()
+        with influx_lines.open_writer('http://influxdb/write?db=t',
+                                      batch_size=2,
+                                      session=session) as writer:
+            for value in range(3):
+                writer.write('m x={}'.format(value))
+            self.assertEqual(session.post.call_count, 1)
+
+        self.assertEqual(session.post.call_count, 2)
+        bodies = [gzip.decompress(call[1]['data']).decode()
+                  for call in session.post.call_args_list]
+        self.assertEqual(bodies, ['m x=0\nm x=1', 'm x=2'])
+        session.post.assert_called_with(
+            'http://influxdb/write?db=t', data=mock.ANY, timeout=30,
+            headers={'Content-Encoding': 'gzip',
+                     'Content-Type': 'text/plain; charset=utf-8'})
+        self.assertIsInstance(influx_lines.open_writer(None),
+                              influx_lines.StdoutWriter)
@@ -17,6 +17,8 @@ class TestRuckRover(unittest.TestCase):
         full_path = os.path.dirname(os.path.abspath(__file__))
         with open(full_path + "/data/master.yaml") as file:
             data = file.read()
+        m_get.return_value.status_code = 200
+        m_get.return_value.headers = {}
         m_get.return_value.text = data
         obtained = ruck_rover.web_scrape('www.demooourl.com')
         self.assertEqual(data, obtained)
@@ -26,6 +28,8 @@ class TestRuckRover(unittest.TestCase):
         full_path = os.path.dirname(os.path.abspath(__file__))
         with open(full_path + "/data/master.yaml") as file:
             data = file.read()
+        m_get.return_value.status_code = 200
+        m_get.return_value.headers = {}
         m_get.return_value.text = data
         obtained = ruck_rover.url_response_in_yaml('www.demooourl.com')
         self.assertTrue(isinstance(obtained, dict))
@@ -243,6 +247,67 @@ class TestRuckRoverComponent(unittest.TestCase):
 
         self.assertEqual(result, m_pr)
 
+    @mock.patch('ruck_rover.render_tables')
+    @mock.patch('ruck_rover.get_job_history')
+    @mock.patch('ruck_rover.get_dlrn_promotions')
+    @mock.patch('ruck_rover.find_results_from_dlrn_repo_status')
+    @mock.patch('ruck_rover.url_response_in_yaml')
+    @mock.patch('ruck_rover.get_api_instance')
+    def test_track_component_promotion(
+            self, m_api_instance, m_yaml, m_results, m_promotions,
+            m_history, m_render):
+        m_yaml.side_effect = lambda url, session: {'commits': [{
+            'commit_hash': url.split('/')[2], 'distro_hash': 'd',
+            'extended_hash': "None"}]}
+        m_results.return_value = []
+        m_promotions.return_value = mock.MagicMock(timestamp=1650363176)
+        m_history.return_value = {'job': {}}
+        criteria = {'promoted-components': {'cinder': ['job']}}
+
+        ruck_rover.track_component_promotion(
+            "api_url", "base", criteria, "builds_url", "tp_url",
+            "current-tripleo", "component-ci-testing", "all")
+
+        components = sorted(ruck_rover.ALL_COMPONENTS.difference(["all"]))
+        # One DLRN API client and one session for all the components
+        m_api_instance.assert_called_once_with("api_url")
+        api_instance = m_api_instance.return_value
+        for component in components:
+            m_promotions.assert_any_call(
+                "api_url", "promoted-components", component,
+                api_instance=api_instance)
+        sessions = set(id(c[1]['session']) for c in m_yaml.call_args_list)
+        self.assertEqual(len(sessions), 1)
+        m_history.assert_any_call({'job'}, "builds_url",
+                                  session=mock.ANY)
+        # Rendered in the components order, with the fetched history
+        self.assertEqual([c[0][3] for c in m_render.call_args_list],
+                         components)
+        self.assertEqual([c[0][7] for c in m_render.call_args_list],
+                         components)
+        for render_call in m_render.call_args_list:
+            self.assertEqual(render_call[1]['periodic_history'],
+                             {'job': {}})
+
+    @mock.patch('ruck_rover.dlrnapi_client.AggQuery')
+    def test_integration(self, m_agg_query):
+        m_agg_query.side_effect = lambda aggregate_hash: aggregate_hash
+        api_instance = mock.MagicMock()
+        api_instance.api_promotions_get.return_value = [
+            mock.MagicMock(timestamp=1, aggregate_hash='a1'),
+            mock.MagicMock(timestamp=2, aggregate_hash='a2'),
+        ]
+        api_instance.api_agg_status_get.side_effect = lambda query: []
+
+        results = ruck_rover.integration(
+            api_instance, "current-tripleo", {'job'}, {})
+
+        self.assertEqual(api_instance.api_agg_status_get.call_count, 2)
+        self.assertEqual(
+            [(ts, r['aggregate_hash']) for ts, r in results.items()],
+            [(1, 'a1'), (2, 'a2')])
+        self.assertEqual(results[1]['jobs'][0]['job_name'], 'job')
+
 
 class TestRuckRoverWithCommonSetup(unittest.TestCase):
     def setUp(self):
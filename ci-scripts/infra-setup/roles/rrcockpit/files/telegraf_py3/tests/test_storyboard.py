@@ -1,9 +1,15 @@
+# pylint: disable=C0413
+
 import json
 import os
+import sys
 import unittest
 
 import mock
-from telegraf_py3 import storyboard
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegraf_py3 import storyboard  # noqa
 
 
 class TestStoryBoard(unittest.TestCase):
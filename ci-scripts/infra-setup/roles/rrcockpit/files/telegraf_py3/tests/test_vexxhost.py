@@ -1,8 +1,14 @@
+# pylint: disable=C0413
+
+import os
+import sys
 import time
 import unittest
 from unittest.mock import mock_open, patch
 
-from telegraf_py3 import vexxhost
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegraf_py3 import vexxhost  # noqa
 
 
 class TestVexxHost(unittest.TestCase):
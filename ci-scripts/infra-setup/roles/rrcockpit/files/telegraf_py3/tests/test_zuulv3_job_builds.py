@@ -1,9 +1,19 @@
+# pylint: disable=C0413
+
 import json
 import os
+import shutil
+import sys
+import tempfile
+import time
 import unittest
 
 import mock
-from telegraf_py3 import zuulv3_job_builds
+from diskcache import Cache
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegraf_py3 import zuulv3_job_builds  # noqa
 
 
 class TestStoryBoard(unittest.TestCase):
@@ -39,7 +49,7 @@ class TestStoryBoard(unittest.TestCase):
             )
         return mock_resp
 
-    @mock.patch('requests.get')
+    @mock.patch.object(zuulv3_job_builds.default_session, 'get')
     def test_get_builds_info(self, mock_get):
         mock_resp = self._mock_response(json_data=self.data)
         mock_get.return_value = mock_resp
@@ -48,6 +58,43 @@ class TestStoryBoard(unittest.TestCase):
         self.assertIsNotNone(result)
         assert (self.data == result)
 
+    @mock.patch.object(zuulv3_job_builds.default_session, 'get')
+    def test_get_builds_info_pages(self, mock_get):
+        def get(url, params, **kwargs):
+            # The last pages answer first
+            time.sleep(0.01 * (3 - params['skip'] // 50))
+            return self._mock_response(
+                json_data=[{'skip': params['skip']}])
+
+        mock_get.side_effect = get
+        result = zuulv3_job_builds.get_builds_info(
+            self.url, self.query, 3, 10)
+        self.assertEqual(result, [{'skip': 10}, {'skip': 60},
+                                  {'skip': 110}])
+        self.assertEqual(self.query, {'project': 'openstack/puppet-tripleo'})
+
+    def test_token_bucket(self):
+        bucket = zuulv3_job_builds.TokenBucket(20, capacity=1)
+        start = time.monotonic()
+        for _ in range(4):
+            bucket.acquire()
+        # The first token is available, the others are refilled at 20/s
+        self.assertGreaterEqual(time.monotonic() - start, 0.14)
+
+    @mock.patch.object(zuulv3_job_builds.default_session, 'get')
+    def test_get_rate_limited(self, mock_get):
+        zuulv3_job_builds.set_rate_limit(self.url, 1)
+        self.addCleanup(zuulv3_job_builds.set_rate_limit, self.url, 0)
+        limiter = zuulv3_job_builds.rate_limiters['zuul.openstack.org']
+        with mock.patch.object(limiter, 'acquire') as mock_acquire:
+            zuulv3_job_builds.get_builds_page(self.url, self.query, 0)
+            # The log files on the same host are not limited
+            zuulv3_job_builds.get_file_from_build(
+                {'log_url': 'http://zuul.openstack.org/logs/1/'},
+                'zuul-info/inventory.yaml', False)
+        mock_acquire.assert_called_once_with()
+        self.assertEqual(mock_get.call_count, 2)
+
     def test_invalid_url_builds_data(self):
         expected = []
         self.url = 'http://zuul.test.org/api/'
@@ -58,3 +105,120 @@ class TestStoryBoard(unittest.TestCase):
     def test_influx(self):
         result = zuulv3_job_builds.influx(self.data[0])
         self.assertIsNotNone(result)
+
+    @mock.patch('telegraf_py3.zuulv3_job_builds.influx')
+    def test_stream_influx(self, mock_influx):
+        def influx(build, session):
+            # The first builds are the slowest to enrich
+            time.sleep(0.01 * (5 - build['id']))
+            return "build {}".format(build['id'])
+
+        mock_influx.side_effect = influx
+        pages = [[{'id': 0, 'result': 'SUCCESS'},
+                  {'id': 1, 'result': None}],
+                 None,
+                 [{'id': 2, 'result': 'FAILURE'},
+                  {'id': 3, 'result': 'SUCCESS'}]]
+        with zuulv3_job_builds.ThreadPoolExecutor(max_workers=4) as executor:
+            lines = list(zuulv3_job_builds.stream_influx(
+                'upstream', pages, executor, max_pending=2))
+        self.assertEqual(lines, ['build 0', 'build 2', 'build 3'])
+        self.assertEqual(pages[2][0]['type'], 'upstream')
+        self.assertEqual(mock_influx.call_count, 3)
+
+    @mock.patch('telegraf_py3.zuulv3_job_builds.get')
+    def test_enrich_caches_fields(self, mock_get):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        cache = Cache(cache_dir)
+        self.addCleanup(cache.close)
+        files = {
+            'zuul-info/inventory.yaml': (
+                "all:\n  hosts:\n    primary:\n      nodepool:\n"
+                "        cloud: vexxhost\n        region: ca-ymq-1\n"
+                "        provider: vexxhost-ca\n"),
+            'logs/failures_file': "Timeout\nReason: infra\n",
+        }
+        mock_get.side_effect = lambda url, json_view, session: files.get(
+            url.split('/0d5ccc1/')[1])
+        build = dict(self.data[0], log_url=self.data[0]['log_url'] + 'html/')
+
+        with mock.patch.object(zuulv3_job_builds, 'cache', cache):
+            zuulv3_job_builds.enrich(build)
+            cached_build = dict(self.data[0])
+            zuulv3_job_builds.enrich(cached_build)
+
+        expected = {'cloud': 'vexxhost', 'region': 'ca-ymq-1',
+                    'provider': 'vexxhost-ca', 'sova_reason': 'Timeout',
+                    'sova_tag': 'infra'}
+        self.assertEqual(mock_get.call_count, 2)
+        self.assertEqual(cache.get('build_fields:{}:{}'.format(
+            zuulv3_job_builds.FIELDS_SCHEMA, build['uuid'])), expected)
+        for field, value in expected.items():
+            self.assertEqual(cached_build[field], value)
+        self.assertEqual(build['log_url'], self.data[0]['log_url'])
+
+    @mock.patch('telegraf_py3.zuulv3_job_builds.get_builds_page')
+    def test_get_new_builds(self, mock_page):
+        def build(uuid, end_time):
+            return {'uuid': uuid, 'end_time': end_time}
+
+        size = zuulv3_job_builds.PAGE_SIZE
+        pages = [
+            [build('running', None)] + [
+                build('n{}'.format(i), '2026-10-19T12:00:00')
+                for i in range(size - 1)],
+            [build('n', '2026-10-19T11:00:00'),
+             build('w', '2026-10-19T10:00:00')] + [
+                build('o{}'.format(i), '2026-10-19T09:00:00')
+                for i in range(size - 2)],
+            [build('x', '2026-10-19T08:00:00')] * size,
+        ]
+        mock_page.side_effect = pages
+        watermark = {'uuid': 'w', 'end_time': '2026-10-19T10:00:00'}
+
+        builds = zuulv3_job_builds.get_new_builds(
+            self.url, 'openstack/tripleo-ci', 10, 0, watermark)
+
+        self.assertEqual([b['uuid'] for b in builds],
+                         ['n{}'.format(i) for i in range(size - 1)] + ['n'])
+        mock_page.assert_has_calls([
+            mock.call(self.url, {'project': 'openstack/tripleo-ci'}, 0,
+                      session=None),
+            mock.call(self.url, {'project': 'openstack/tripleo-ci'}, size,
+                      session=None),
+        ])
+        self.assertEqual(mock_page.call_count, 2)
+
+    def test_collect_uses_session(self):
+        session = mock.Mock()
+        session.get.return_value.json.return_value = []
+        with mock.patch.object(zuulv3_job_builds, 'OOO_PROJECTS',
+                               ['openstack/tripleo-ci']), \
+                mock.patch.object(zuulv3_job_builds.default_session,
+                                  'get') as mock_default_get:
+            lines = list(zuulv3_job_builds.collect(
+                self.url, 'upstream', backfill=True, rate=0,
+                session=session))
+        self.assertEqual(lines, [])
+        self.assertEqual(session.get.call_count, 1)
+        self.assertFalse(mock_default_get.called)
+
+    def test_update_watermark(self):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        cache = Cache(cache_dir)
+        self.addCleanup(cache.close)
+        key = zuulv3_job_builds.get_watermark_key(self.url, 'p')
+        builds = [{'uuid': 'a', 'end_time': '2026-10-19T10:00:00'},
+                  {'uuid': 'b', 'end_time': '2026-10-19T11:00:00'},
+                  {'uuid': 'c', 'end_time': None}]
+
+        with mock.patch.object(zuulv3_job_builds, 'cache', cache):
+            zuulv3_job_builds.update_watermark(self.url, 'p', builds, None)
+            self.assertEqual(cache.get(key), {
+                'uuid': 'b', 'end_time': '2026-10-19T11:00:00'})
+            # An older backfill doesn't move the watermark back
+            zuulv3_job_builds.update_watermark(
+                self.url, 'p', builds[:1], cache.get(key))
+            self.assertEqual(cache.get(key)['uuid'], 'b')
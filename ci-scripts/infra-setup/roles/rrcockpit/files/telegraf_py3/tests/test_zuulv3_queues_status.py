@@ -1,9 +1,16 @@
+# pylint: disable=C0413
+
+import io
 import json
 import os
+import sys
 import unittest
 
 import mock
-from telegraf_py3 import zuulv3_queues_status
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegraf_py3 import zuulv3_queues_status  # noqa
 
 
 class TestZuulV3QueueStatus(unittest.TestCase):
@@ -39,16 +46,66 @@ class TestZuulV3QueueStatus(unittest.TestCase):
             )
         return mock_resp
 
+    def _mock_status(self):
+        mock_resp = self._mock_response()
+        mock_resp.raw = io.BytesIO(json.dumps(self.data).encode())
+        return mock_resp
+
     @mock.patch('requests.get')
     def test_find_zuul_queues(self, mock_get):
-        self.data = str(self.data).replace("'", '"')
-        mock_resp = self._mock_response(content=str(self.data))
-        mock_get.return_value = mock_resp
+        mock_get.return_value = self._mock_status()
         result = zuulv3_queues_status.find_zuul_queues(
             self.url, self.pipeline, self.queue_name, self.project_regex)
         self.assertIsNotNone(result)
         self.assertEqual('gate', result[0]['pipeline'])
         self.assertEqual('tripleo', result[0]['queue'])
+        mock_get.assert_called_once_with(self.url, stream=True)
+
+    @mock.patch('requests.get')
+    def test_collect_selectors(self, mock_get):
+        mock_get.side_effect = [self._mock_status(), self._mock_status()]
+        selectors = [
+            zuulv3_queues_status.parse_selector('gate:tripleo'),
+            zuulv3_queues_status.parse_selector('check-arm64~.*tripleo.*'),
+            zuulv3_queues_status.parse_selector('gate'),
+            zuulv3_queues_status.parse_selector('missing'),
+        ]
+        self.assertEqual(selectors[1], {'pipeline': 'check-arm64',
+                                        'project_regex': '.*tripleo.*'})
+
+        found = zuulv3_queues_status.find_queues(self.url, selectors)
+        lines = zuulv3_queues_status.collect(self.url, selectors,
+                                             max_time=True)
+
+        # Downloaded once per call
+        self.assertEqual(mock_get.call_count, 2)
+        self.assertEqual(len(found), 4)
+        self.assertEqual([q['queue'] for q in found[0]], ['tripleo'])
+        self.assertEqual(found[1], [])
+        self.assertGreater(len(found[2]), len(found[0]))
+        self.assertEqual(found[3], [])
+        # The longest enqueued job of each selector with queues
+        self.assertEqual(len(lines), 2)
+        self.assertIn(',queue=tripleo,', lines[0])
+        self.assertIn(',queue=integrated,', lines[1])
+
+    def test_convert_builds_as_influxdb(self):
+        queues = [{
+            'url': self.url, 'pipeline': 'gate', 'queue': 'tripleo',
+            'refspecs': [{
+                'id': '12345,6', 'enqueue_time': 1613028228218,
+                'jobs': [{'name': 'tox-py3', 'result': 'SUCCESS'},
+                         {'name': 'tox-pep8'}]}]}]
+        lines = zuulv3_queues_status.convert_builds_as_influxdb(queues)
+        self.assertEqual(len(lines), 2)
+        self.assertRegex(
+            lines[0],
+            r'^zuul-queue-status,url=http://zuul.openstack.org/api/status,'
+            r'pipeline=gate,queue=tripleo,job=tox-py3,review=12345,'
+            r'patch_set=6 result="SUCCESS",enqueue_time=1613028228218,'
+            r'enqueued_time=[0-9.]+,result_code=1$')
+        self.assertIn('result="ONGOING"', lines[1])
+        self.assertIn('result_code=0', lines[1])
 
     def test_calculate_minutes_enqueued(self):
         enqueue_time = 1613028228218
@@ -2,9 +2,13 @@
 
 import argparse
 import re
+import threading
 import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+import influx_lines
 import requests
 import urllib3
 import yaml
@@ -13,9 +17,9 @@ from diskcache import Cache
 urllib3.disable_warnings()
 
 try:
-    from urlparse import urljoin
+    from urlparse import urljoin, urlparse
 except ImportError:
-    from urllib.parse import urljoin
+    from urllib.parse import urljoin, urlparse
 
 
 OOO_PROJECTS = [
@@ -61,8 +65,85 @@ TASK_DURATION_TRESHOLD = 10
 CACHE_EXPIRE_SECS = 604800  # a week
 CACHE_SIZE = int(2e9)  # 2GB
 
+# The cache keeps only the fields extracted from the log files of each
+# build. Bump the schema when the fields or the way they are extracted
+# change, the entries of the other schemas are dropped
+FIELDS_SCHEMA = 1
+ENRICHED_FIELDS = ['cloud', 'region', 'provider', 'sova_reason', 'sova_tag',
+                   'dep_change']
+
 cache = Cache('/tmp/ruck_rover_cache', size_limit=CACHE_SIZE)
 cache.expire()
+if cache.get('fields_schema') != FIELDS_SCHEMA:
+    cache.clear()
+    cache.set('fields_schema', FIELDS_SCHEMA)
+
+# Builds returned by a page of the zuul builds api
+PAGE_SIZE = 50
+WORKERS = 8
+# Builds whose log files are fetched concurrently
+LOG_WORKERS = 16
+# Requests per second sent to the builds api of a zuul host, the log files
+# are not limited
+RATE = 2.0
+
+
+def mount_pool(pool_size):
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size,
+                                            pool_maxsize=pool_size)
+    default_session.mount('http://', adapter)
+    default_session.mount('https://', adapter)
+
+
+# One pool of keep-alive connections for the requests of the script, the
+# callers of collect can pass their own session
+default_session = requests.Session()
+mount_pool(WORKERS)
+
+# host -> TokenBucket of its builds api, the hosts without one are not rate
+# limited
+rate_limiters = {}
+
+
+class TokenBucket(object):
+    """
+    Rate limiter shared by the threads: each request takes a token, the
+    tokens are refilled at `rate` per second up to `capacity`, so short
+    bursts are allowed but the average rate stays under `rate`
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity,
+                    self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def set_rate_limit(url, rate):
+    """
+    Limits the builds api requests sent to the host of url, rate <= 0
+    disables it
+    """
+    host = urlparse(url).netloc
+    if rate > 0:
+        rate_limiters[host] = TokenBucket(rate)
+    else:
+        rate_limiters.pop(host, None)
 
 # Convert datetime to timestamp
 
@@ -78,13 +159,13 @@ def to_seconds(duration):
         hours=x.tm_hour, minutes=x.tm_min, seconds=x.tm_sec).total_seconds()
 
 
-def get(url, json_view, query=None, timeout=20):
+def get(url, json_view, query=None, timeout=20, session=None):
     query = query or {}
     try:
-        response = requests.get(url,
-                                params=query,
-                                timeout=timeout,
-                                verify=False)
+        response = (session or default_session).get(url,
+                                                    params=query,
+                                                    timeout=timeout,
+                                                    verify=False)
         if response and response.ok:
             if json_view:
                 return response.json()
@@ -97,55 +178,64 @@ def get(url, json_view, query=None, timeout=20):
     return None
 
 
-def get_builds_info(url, query, pages, offset):
+def get_builds_page(url, query, skip, session=None):
+    if "rdo" in url:
+        builds_api = url + "builds"
+    else:
+        builds_api = url + "builds" + '?complete=true'
+    # Only the api calls are limited, the log files can be on the same host
+    limiter = rate_limiters.get(urlparse(builds_api).netloc)
+    if limiter is not None:
+        limiter.acquire()
+    return get(builds_api, True, dict(query, skip=skip),
+               session=session) or []
+
+
+def submit_builds_pages(executor, url, query, pages, offset, session=None):
+    """
+    Fetches the pages of builds concurrently, the zuul api is protected by
+    the rate limiter of its host
+    :return: The list of futures of the pages, in order
+    """
+    return [executor.submit(get_builds_page, url, query,
+                            offset + (p * PAGE_SIZE), session)
+            for p in range(pages)]
+
+
+def get_builds_info(url, query, pages, offset, executor=None):
+    if executor is None:
+        with ThreadPoolExecutor(max_workers=WORKERS) as executor:
+            return get_builds_info(url, query, pages, offset, executor)
     builds = []
-    for p in range(pages):
-        if p > 0:
-            query['skip'] = offset + (p * 50)
-            # let's not abuse ZUUL API and sleep betwen requests
-            time.sleep(2)
-        else:
-            query['skip'] = offset
-        if "rdo" in url:
-            builds_api = url + "builds"
-        else:
-            builds_api = url + "builds" + '?complete=true'
-        response = get(builds_api, True, query)
-        if response is not None:
-            builds += response
+    for page in submit_builds_pages(executor, url, query, pages, offset):
+        builds += page.result()
     return builds
 
 
-def get_file_from_build(build, file_relative_path, json_view):
-    if 'log_url' in build and build['log_url']:
+def fix_log_url(build):
+    if build.get('log_url'):
         if build['log_url'].endswith("/html/"):
             build['log_url'] = build['log_url'].replace('html/', '')
         if build['log_url'].endswith("/cover/"):
             build['log_url'] = build['log_url'].replace('cover/', '')
-        file_path = urljoin(build['log_url'], file_relative_path)
 
-        if file_path not in cache:
-            resp = get(file_path, json_view)
-
-            if resp is not None:
-                if json_view:
-                    cache.add(
-                        file_path, yaml.safe_load(resp),
-                        expire=CACHE_EXPIRE_SECS)
-                else:
-                    cache.add(file_path, resp)
-            # Add negative cache
-            else:
-                cache[file_path] = None
 
-        return cache[file_path]
+def get_file_from_build(build, file_relative_path, json_view, session=None):
+    if 'log_url' in build and build['log_url']:
+        fix_log_url(build)
+        file_path = urljoin(build['log_url'], file_relative_path)
+
+        resp = get(file_path, json_view, session=session)
+        if resp is not None and json_view:
+            return yaml.safe_load(resp)
+        return resp
 
 
-def add_inventory_info(build, json_view=False):
+def add_inventory_info(build, json_view=False, session=None):
     try:
         inventory = get_file_from_build(build,
                                         "zuul-info/inventory.yaml",
-                                        json_view)
+                                        json_view, session=session)
         inventory = yaml.safe_load(inventory)
         hosts = inventory['all']['hosts']
         host = hosts[list(hosts.keys())[0]]
@@ -159,11 +249,11 @@ def add_inventory_info(build, json_view=False):
         pass
 
 
-def add_sova_info(build, json_view=False):
+def add_sova_info(build, json_view=False, session=None):
     try:
         failures_file = get_file_from_build(build,
                                             "logs/failures_file",
-                                            json_view)
+                                            json_view, session=session)
         lines = failures_file.split('\n')
         reason = lines[0]
         tag = lines[1].split("Reason: ")[1]
@@ -175,7 +265,7 @@ def add_sova_info(build, json_view=False):
 
 
 # rdoinfo and nfvinfo job meta re which package is updated
-def add_rdopkg_change(build, json_view=False):
+def add_rdopkg_change(build, json_view=False, session=None):
     rdo_file = "logs/tested_pkgs_updates.txt.gz"
     rdo_project = ["rdoinfo", "nfvinfo"]
     rpm_change_file = ""
@@ -185,7 +275,8 @@ def add_rdopkg_change(build, json_view=False):
         try:
             rpm_change_file = get_file_from_build(build,
                                                   file,
-                                                  json_view)
+                                                  json_view,
+                                                  session=session)
             rpm_change_file = rpm_change_file.splitlines()
         except Exception:
             pass
@@ -288,12 +379,34 @@ def print_influx_ara_tasks(build, ara_json_file):
         pass
 
 
-def influx(build):
+def enrich(build, session=None):
+    """
+    Adds to the build the fields extracted from its log files. The fields
+    of a build are cached by uuid, so its logs are fetched and parsed only
+    the first time it's seen
+    """
+    fix_log_url(build)
+    key = None
+    if build.get('uuid'):
+        key = 'build_fields:{}:{}'.format(FIELDS_SCHEMA, build['uuid'])
+        fields = cache.get(key)
+        if fields is not None:
+            build.update(fields)
+            return
 
-    add_inventory_info(build)
+    add_inventory_info(build, session=session)
     # add_container_prep_time(build)
-    add_sova_info(build)
-    add_rdopkg_change(build)
+    add_sova_info(build, session=session)
+    add_rdopkg_change(build, session=session)
+
+    if key is not None:
+        cache.set(key, {field: build[field] for field in ENRICHED_FIELDS
+                        if field in build}, expire=CACHE_EXPIRE_SECS)
+
+
+def influx(build, session=None):
+
+    enrich(build, session=session)
 
     if build['end_time'] is None:
         build['end_time'] = datetime.fromtimestamp(
@@ -304,65 +417,164 @@ def influx(build):
     duration = build.get('duration', 0)
     if duration is None:
         duration = 0
-    # Get the nodename
-    return ('build,'
-            'type=%s,'
-            'pipeline=%s,'
-            'branch=%s,'
-            'project=%s,'
-            'job_name=%s,'
-            'voting=%s,'
-            'change=%s,'
-            'patchset=%s,'
-            'passed=%s,'
-            'cloud=%s,'
-            'region=%s,'
-            'provider=%s,'
-            'result="%s"'
-            ' '
-            'result="%s",'
-            'result_num=%s,'
-            'log_url="%s",'
-            'log_link="%s",'
-            'duration=%s,'
-            'start=%s,'
-            'end=%s,'
-            'cloud="%s",'
-            'region="%s",'
-            'provider="%s",'
-            'sova_reason="%s",'
-            'sova_tag="%s",'
-            'dep_change="%s",'
-            'container_prep_time_u=0'
-            ' '
-            '%s' %
-            (build['type'],
-             build['pipeline'], 'none' if not build['branch']
-             else build['branch'], build['project'], build['job_name'],
-             build['voting'], build['change'], build['patchset'], 'True'
-             if build['result'] == 'SUCCESS' else 'False',
-             build.get('cloud', 'null'), build.get('region', 'null'),
-             build.get('provider', 'null'), build['result'], build['result'], 1
-             if build['result'] == 'SUCCESS' else 0, build['log_url'],
-             "<a href={} target='_blank'>{}</a>".format(
-                 build['log_url'], build['job_name']),
-             duration,
-             to_ts(build['start_time'], seconds=True),
-             to_ts(build['end_time'], seconds=True), build.get(
-                 'cloud', 'null'), build.get('region', 'null'),
-             build.get('provider', 'null'),
-             build.get('sova_reason', ''),
-             build.get('sova_tag', ''),
-             build.get('dep_change', ''),
-             to_ts(build['end_time'])))
-
-
-def print_influx(build_type, builds):
-    if builds:
-        for build in builds:
-            if build['result'] is not None:
-                build['type'] = build_type
-                print(influx(build))
+    passed = build['result'] == 'SUCCESS'
+    return influx_lines.point(
+        'build',
+        tags=[
+            ('type', build['type']),
+            ('pipeline', build['pipeline']),
+            ('branch', build['branch'] or 'none'),
+            ('project', build['project']),
+            ('job_name', build['job_name']),
+            ('voting', build['voting']),
+            ('change', build['change']),
+            ('patchset', build['patchset']),
+            ('passed', passed),
+            ('cloud', build.get('cloud', 'null')),
+            ('region', build.get('region', 'null')),
+            ('provider', build.get('provider', 'null')),
+            ('result', build['result']),
+        ],
+        fields=[
+            ('result', build['result']),
+            ('result_num', 1 if passed else 0),
+            ('log_url', build['log_url']),
+            ('log_link', "<a href={} target='_blank'>{}</a>".format(
+                build['log_url'], build['job_name'])),
+            ('duration', duration),
+            ('start', int(to_ts(build['start_time'], seconds=True))),
+            ('end', int(to_ts(build['end_time'], seconds=True))),
+            ('cloud', build.get('cloud', 'null')),
+            ('region', build.get('region', 'null')),
+            ('provider', build.get('provider', 'null')),
+            ('sova_reason', build.get('sova_reason', '')),
+            ('sova_tag', build.get('sova_tag', '')),
+            ('dep_change', build.get('dep_change', '')),
+            ('container_prep_time_u', 0),
+        ],
+        timestamp=to_ts(build['end_time']))
+
+
+def get_watermark_key(url, project):
+    return 'watermark:{}:{}'.format(url, project)
+
+
+def is_new(build, watermark):
+    return bool(build.get('end_time')) and (
+        watermark is None or build['end_time'] > watermark['end_time'])
+
+
+def get_new_builds(url, project, pages, offset, watermark, session=None):
+    """
+    Pages the builds of a project from the newest until the page where the
+    watermark is reached, at most `pages` pages. The builds that end after
+    a newer one are collected only if they're still in that page, the
+    others are left to --backfill
+    :param watermark: A dict with the uuid and end_time of the newest build
+    collected by the previous runs
+    :return: The list of the builds ended after the watermark
+    """
+    builds = []
+    for p in range(pages):
+        page = get_builds_page(url, {'project': project},
+                               offset + (p * PAGE_SIZE), session=session)
+        new_builds = [build for build in page if is_new(build, watermark)]
+        builds += new_builds
+        # The running builds, without end_time, don't tell if the
+        # watermark was reached
+        reached = any(not is_new(build, watermark) for build in page
+                      if build.get('end_time'))
+        if reached or len(page) < PAGE_SIZE:
+            break
+    return builds
+
+
+def update_watermark(url, project, builds, watermark):
+    """
+    Stores as watermark of the project the newest ended build, if it's
+    newer than the current one
+    """
+    ended = [build for build in builds if build.get('end_time')]
+    if not ended:
+        return
+    newest = max(ended, key=lambda build: build['end_time'])
+    if watermark is None or newest['end_time'] > watermark['end_time']:
+        cache.set(get_watermark_key(url, project),
+                  {'uuid': newest['uuid'], 'end_time': newest['end_time']})
+
+
+def stream_influx(build_type, pages, executor, max_pending, session=None):
+    """
+    Enriches the builds with their log files in the executor and yields
+    their lines in order, as soon as they are ready. At most max_pending
+    builds are queued, so the first lines come out while the next pages
+    are still being fetched
+    :param build_type: The type of the builds
+    :param pages: An iterable of lists of builds
+    :param executor: The executor running influx() for each build
+    :param max_pending: The max number of builds submitted and not printed
+    :param session: The requests session fetching the log files
+    """
+    pending = deque()
+    for builds in pages:
+        for build in builds or []:
+            if build['result'] is None:
+                continue
+            build['type'] = build_type
+            pending.append(executor.submit(influx, build, session))
+            if len(pending) >= max_pending:
+                yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def collect(url, build_type, pages=1, offset=0, backfill=False,
+            workers=WORKERS, log_workers=LOG_WORKERS, rate=RATE,
+            session=None):
+    """
+    Yields the lines of the builds of the projects of build_type. The
+    watermarks are moved once all the lines were consumed
+    :param session: The requests session to use, default the module one
+    """
+    if build_type == 'internal':
+        report_projects = INTERNAL_OOO_PROJECTS
+    else:
+        report_projects = OOO_PROJECTS
+
+    set_rate_limit(url, rate)
+    with ThreadPoolExecutor(max_workers=workers) as executor, \
+            ThreadPoolExecutor(max_workers=log_workers) as log_executor:
+        # All the projects are requested at once, their builds are
+        # enriched as the pages arrive, and printed in order. The projects
+        # already collected are paged only until their watermark, the
+        # others have all their pages requested at once
+        watermarks = OrderedDict(
+            (project, cache.get(get_watermark_key(url, project)))
+            for project in report_projects)
+        projects_pages = OrderedDict()
+        for project in report_projects:
+            if backfill or watermarks[project] is None:
+                projects_pages[project] = submit_builds_pages(
+                    executor, url, {'project': project}, pages, offset,
+                    session=session)
+            else:
+                projects_pages[project] = [executor.submit(
+                    get_new_builds, url, project, pages, offset,
+                    watermarks[project], session)]
+        builds_pages = (page.result()
+                        for project_pages in projects_pages.values()
+                        for page in project_pages)
+        for line in stream_influx(build_type, builds_pages, log_executor,
+                                  log_workers * 2, session=session):
+            yield line
+
+        # Moved only once all the builds were printed, so an interrupted
+        # run is collected again by the next one
+        for project, project_pages in projects_pages.items():
+            update_watermark(url, project,
+                             [build for page in project_pages
+                              for build in page.result() or []],
+                             watermarks[project])
 
 
 def main():
@@ -380,21 +592,28 @@ def main():
         '--pages', type=int, default=1, help="(default: %(default)s)")
     parser.add_argument(
         '--offset', type=int, default=0, help="(default: %(default)s)")
+    parser.add_argument(
+        '--backfill', action='store_true',
+        help="ignore the watermarks of the previous runs and collect all "
+             "the --pages pages, to fill gaps")
+    parser.add_argument(
+        '--workers', type=int, default=WORKERS,
+        help="concurrent requests (default: %(default)s)")
+    parser.add_argument(
+        '--log-workers', type=int, default=LOG_WORKERS,
+        help="builds whose log files are fetched concurrently "
+             "(default: %(default)s)")
+    parser.add_argument(
+        '--rate', type=float, default=RATE,
+        help="max requests per second to the zuul api, 0 for no limit "
+             "(default: %(default)s)")
     args = parser.parse_args()
 
-    if args.type == 'internal':
-        report_projects = INTERNAL_OOO_PROJECTS
-    else:
-        report_projects = OOO_PROJECTS
-
-    for project in report_projects:
-        print_influx(
-            args.type,
-            get_builds_info(
-                url=args.url,
-                query={'project': project},
-                pages=args.pages,
-                offset=args.offset))
+    mount_pool(max(args.workers, args.log_workers))
+    influx_lines.write_lines(collect(
+        args.url, args.type, pages=args.pages, offset=args.offset,
+        backfill=args.backfill, workers=args.workers,
+        log_workers=args.log_workers, rate=args.rate))
 
 
 if __name__ == '__main__':
@@ -2,61 +2,114 @@
 
 import argparse
 import json
+import logging
 import re
 from os import path
 from time import time
 
+import influx_lines
 import requests
 
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
 CERT_LOCATION = '/etc/pki/tls/certs/ca-bundle.crt'
 
 
-def find_zuul_queues(zuul_status_url, pipeline_name, queue_name,
-                     project_regex):
+def iter_pipelines(stream):
+    """
+    Yields the pipelines of a zuul status document. With ijson they are
+    parsed one at a time while the document is downloaded, so only one
+    pipeline is in memory and the download stops once the wanted ones
+    were found
+    """
+    if ijson is None:
+        return iter(json.load(stream)['pipelines'])
+    return ijson.items(stream, 'pipelines.item', use_float=True)
+
+
+def parse_selector(value):
+    """
+    :param value: pipeline, pipeline:queue or pipeline~project_regex
+    :return: The selector dict
+    """
+    if ':' in value:
+        pipeline, queue = value.split(':', 1)
+        return {'pipeline': pipeline, 'queue': queue}
+    if '~' in value:
+        pipeline, project_regex = value.split('~', 1)
+        return {'pipeline': pipeline, 'project_regex': project_regex}
+    return {'pipeline': value}
+
+
+def select_queues(zuul_status_url, pipeline, selector):
+    queue_name = selector.get('queue')
+    project_regex = selector.get('project_regex')
     queues = []
-    # required for internal zuul
-    if 'redhat.com' in zuul_status_url:
-        if path.exists(CERT_LOCATION):
-            cert = CERT_LOCATION
-        else:
-            cert = False
-        zuul_status = json.loads(
-            requests.get(
-                zuul_status_url,
-                verify=cert).content)
-    else:
-        zuul_status = json.loads(
-            requests.get(
-                zuul_status_url).content)
-
-    found_pipeline = next(pipeline['change_queues']
-                          for pipeline in zuul_status['pipelines']
-                          if pipeline['name'] == pipeline_name)
-
-    if queue_name:
-        found_queues = (queue for queue in found_pipeline
-                        if queue['name'] == queue_name)
-    elif project_regex:
-        found_queues = (queue for queue in found_pipeline
-                        if re.search(project_regex, queue['name']))
-    else:
-        found_queues = (queue for queue in found_pipeline)
-
-    for queue in found_queues:
-        refspecs = []
-        queue_heads = queue['heads']
-        if queue_heads:
-            refspecs = queue_heads[0]
+    for queue in pipeline['change_queues']:
+        if queue_name and queue['name'] != queue_name:
+            continue
+        if project_regex and not re.search(project_regex, queue['name']):
+            continue
+        if queue['heads']:
             queues.append({
                 'url': zuul_status_url,
-                'pipeline': pipeline_name,
+                'pipeline': pipeline['name'],
                 'queue': queue['name'],
-                'refspecs': refspecs
+                'refspecs': queue['heads'][0]
             })
-
     return queues
 
 
+def find_queues(zuul_status_url, selectors, session=None):
+    """
+    Downloads the zuul status once for all the selectors
+    :param zuul_status_url: The url of the status api
+    :param selectors: List of dicts with a pipeline and optionally a
+    queue or a project_regex matching the queue names
+    :return: A list with the queues of each selector, in their order
+    """
+    http = session or requests
+    kwargs = {}
+    # required for internal zuul
+    if 'redhat.com' in zuul_status_url:
+        kwargs['verify'] = \
+            CERT_LOCATION if path.exists(CERT_LOCATION) else False
+
+    wanted = {}
+    for index, selector in enumerate(selectors):
+        wanted.setdefault(selector['pipeline'], []).append(index)
+    found = [[] for _ in selectors]
+
+    response = http.get(zuul_status_url, stream=True, **kwargs)
+    try:
+        response.raise_for_status()
+        response.raw.decode_content = True
+        for pipeline in iter_pipelines(response.raw):
+            for index in wanted.pop(pipeline['name'], []):
+                found[index] = select_queues(zuul_status_url, pipeline,
+                                             selectors[index])
+            if not wanted:
+                break
+    finally:
+        response.close()
+
+    for pipeline_name in wanted:
+        logging.warning("Pipeline %s not found in %s", pipeline_name,
+                        zuul_status_url)
+    return found
+
+
+def find_zuul_queues(zuul_status_url, pipeline_name, queue_name,
+                     project_regex, session=None):
+    return find_queues(zuul_status_url,
+                       [{'pipeline': pipeline_name, 'queue': queue_name,
+                         'project_regex': project_regex}],
+                       session=session)[0]
+
+
 def calculate_minutes_enqueued(enqueue_time):
     # TODO: Do we have to use start time instead ?
     current_time = int(time() * 1000)
@@ -72,41 +125,49 @@ def convert_builds_as_influxdb(queues, max_time=False):
         'SUCCESS': 1,
         'SKIPPED': 1,
     }
-    influxdb_lines = []
-    influxdb_line = ("zuul-queue-status,url={url},pipeline={pipeline}"
-                     ",queue={queue},job={name},review={review}"
-                     ",patch_set={patch_set} result=\"{result}\""
-                     ",enqueue_time={enqueue_time},"
-                     "enqueued_time={enqueued_time},result_code={result_code}")
-    lines = []
+    records = []
     for queue in queues:
         for refspec in queue['refspecs']:
+            review, patch_set = refspec['id'].split(',')[:2]
+            enqueued_time = calculate_minutes_enqueued(
+                refspec['enqueue_time'])
             for job in refspec['jobs']:
-                # FIXME: Not very performant
-                values = {}
-                values.update(job)
-                values.update(refspec)
-                values.update(queue)
-
-                result = values.get('result', 'ONGOING')
-                values['result'] = result
-                result_code = result_mapping.get(result, -1)
-
-                values['result_code'] = result_code
-                values['enqueued_time'] = calculate_minutes_enqueued(
-                    values['enqueue_time'])
-
-                # influxdb line protocol uses commas to split stuf,
-                # let's escape it
-                id_ = values['id'].split(',')
-                values['review'] = id_[0]
-                values['patch_set'] = id_[1]
-                lines.append(values)
+                result = job.get('result', 'ONGOING')
+                records.append((enqueued_time, [
+                    ('url', queue['url']),
+                    ('pipeline', queue['pipeline']),
+                    ('queue', queue['queue']),
+                    ('job', job['name']),
+                    ('review', review),
+                    ('patch_set', patch_set)
+                ], [
+                    ('result', result),
+                    ('enqueue_time', refspec['enqueue_time']),
+                    ('enqueued_time', enqueued_time),
+                    ('result_code', result_mapping.get(result, -1))
+                ]))
     if max_time:
-        lines = sorted(lines, key=lambda x: x['enqueued_time'])[-1:]
-    for line in lines:
-        influxdb_lines.append(influxdb_line.format(**line))
-    return influxdb_lines
+        records = [max(records, key=lambda record: record[0])] \
+            if records else []
+    return [influx_lines.point('zuul-queue-status', tags=tags,
+                               fields=fields)
+            for _, tags, fields in records]
+
+
+def collect(url, selectors=None, max_time=False, session=None, **selector):
+    """
+    :param selectors: List of selector dicts, see find_queues. The
+    pipeline, queue and project_regex keyword arguments are a single one
+    :param max_time: Only the job enqueued for the longest time of each
+    selector
+    :return: The lines of the queues of all the selectors
+    """
+    if selectors is None:
+        selectors = [selector]
+    lines = []
+    for queues in find_queues(url, selectors, session=session):
+        lines.extend(convert_builds_as_influxdb(queues, max_time=max_time))
+    return lines
 
 
 def main():
@@ -115,21 +176,28 @@ def main():
         description="Print zuul status as influxdb lines")
 
     parser.add_argument('--url', required=True)
-    parser.add_argument('--pipeline', required=True)
+    parser.add_argument('--pipeline')
     parser.add_argument('--max-time', action="store_true",
                         default=False)
     group = parser.add_mutually_exclusive_group()
     group.add_argument('--queue')
     group.add_argument('--project-regex')
+    parser.add_argument(
+        '--select', action='append', default=[], type=parse_selector,
+        metavar='PIPELINE[:QUEUE|~PROJECT_REGEX]',
+        help="pipeline and optionally queue to collect, can be repeated "
+             "to collect several of them with a single download")
 
     args = parser.parse_args()
-
-    queues = find_zuul_queues(args.url, args.pipeline, args.queue,
-                              args.project_regex)
-
-    influxdb_lines = convert_builds_as_influxdb(queues, max_time=args.max_time)
-
-    print('\n'.join(influxdb_lines))
+    selectors = args.select
+    if args.pipeline:
+        selectors.append({'pipeline': args.pipeline, 'queue': args.queue,
+                          'project_regex': args.project_regex})
+    if not selectors:
+        parser.error("--pipeline or --select is required")
+
+    influx_lines.write_lines(collect(args.url, selectors,
+                                     max_time=args.max_time))
 
 
 if __name__ == '__main__':